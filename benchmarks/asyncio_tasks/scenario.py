@@ -0,0 +1,45 @@
+import asyncio
+from typing import Callable  # noqa:F401
+from typing import Generator  # noqa:F401
+
+import bm
+import bm.utils as utils
+
+from ddtrace.tracer import Tracer  # noqa:F401
+
+
+class AsyncioTasks(bm.Scenario):
+    ntasks = bm.var(type=int)
+    nspans = bm.var(type=int)
+    versioned = bm.var_bool()
+
+    async def create_trace(self, tracer):
+        # type: (Tracer) -> None
+        with tracer.trace("root"):
+            for _ in range(self.nspans - 1):
+                with tracer.trace("child"):
+                    # Switch to the other tasks while the span is active
+                    await asyncio.sleep(0)
+
+    def run(self):
+        # type: () -> Generator[Callable[[int], None], None, None]
+        from ddtrace import config
+        from ddtrace import tracer
+
+        # The version tag requires the root span of the active trace
+        config.version = "1.0.0" if self.versioned else None
+
+        utils.drop_traces(tracer)
+        utils.drop_telemetry_events()
+
+        loop = asyncio.new_event_loop()
+
+        async def create_traces():
+            await asyncio.gather(*(self.create_trace(tracer) for _ in range(self.ntasks)))
+
+        def _(loops):
+            # type: (int) -> None
+            for _ in range(loops):
+                loop.run_until_complete(create_traces())
+
+        yield _
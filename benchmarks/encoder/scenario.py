@@ -7,18 +7,23 @@ class Encoder(bm.Scenario):
     nspans = bm.var(type=int)
     ntags = bm.var(type=int)
     ltags = bm.var(type=int)
+    ntagvalues = bm.var(type=int)
     nmetrics = bm.var(type=int)
     dd_origin = bm.var_bool()
     encoding = bm.var(type=str)
+    compression = bm.var(type=str)
 
     def run(self):
         encoder = utils.init_encoder(self.encoding)
+        compressor = utils.init_compressor(self.compression)
         traces = utils.gen_traces(self)
 
         def _(loops):
             for _ in range(loops):
                 for trace in traces:
                     encoder.put(trace)
-                    encoder.encode()
+                    payload = encoder.encode()
+                    if compressor is not None:
+                        compressor.compress(payload)
 
         yield _
@@ -27,6 +27,26 @@ except ImportError:
         return MSGPACK_ENCODERS[encoding]()
 
 
+try:
+    from ddtrace.internal.writer.compression import get_compressor
+
+    def init_compressor(compression):
+        return get_compressor(compression)
+
+except ImportError:
+    import zlib
+
+    class _GzipCompressor(object):
+        def compress(self, payload):
+            compressor = zlib.compressobj(1, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            return compressor.compress(payload) + compressor.flush()
+
+    def init_compressor(compression):
+        # Earlier versions send payloads uncompressed, compare with the cost of
+        # compressing them with the standard library.
+        return _GzipCompressor() if compression else None
+
+
 def _rands(size=6, chars=string.ascii_uppercase + string.digits):
     return "".join(random.choice(chars) for _ in range(size))
 
@@ -45,6 +65,8 @@ def gen_traces(config):
     resources = _random_values(256, 16)
     services = _random_values(16, 16)
     tag_keys = _random_values(config.ntags, 16)
+    # choose the values of each tag from a small set, like the tags set by integrations, if configured
+    tag_values = [_random_values(config.ntagvalues, config.ltags) for _ in range(config.ntags)]
     metric_keys = _random_values(config.nmetrics, 16)
     dd_origin_values = ["synthetics", "ciapp-test"]
 
@@ -62,7 +84,9 @@ def gen_traces(config):
                     # to its children. The encoder only checks the root span's context in a trace for dd_origin, so
                     # here we need to add dd_origin to the root span's context.
                     span.context.dd_origin = random.choice(dd_origin_values)
-                if config.ntags > 0:
+                if config.ntags > 0 and config.ntagvalues > 0:
+                    span.set_tags(dict(zip(tag_keys, [random.choice(values) for values in tag_values])))
+                elif config.ntags > 0:
                     span.set_tags(dict(zip(tag_keys, [_rands(size=config.ltags) for _ in range(config.ntags)])))
                 if config.nmetrics > 0:
                     span.set_metrics(
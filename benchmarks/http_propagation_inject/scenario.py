@@ -2,16 +2,23 @@ import json
 
 import bm
 
+from ddtrace import config
 from ddtrace.context import Context
 from ddtrace.propagation import http
+from ddtrace.span import Span
 
 
 class HTTPPropagationInject(bm.Scenario):
     sampling_priority = bm.var(type=str)
     dd_origin = bm.var(type=str)
     meta = bm.var(type=str)
+    styles = bm.var(type=str)
+    fan_out = bm.var(type=int)
 
     def run(self):
+        if self.styles:
+            config._propagation_style_inject = self.styles.split(",")
+
         sampling_priority = None
         if self.sampling_priority != "":
             sampling_priority = int(self.sampling_priority)
@@ -29,9 +36,18 @@ class HTTPPropagationInject(bm.Scenario):
             meta=meta,
         )
 
+        # Inject the context of a different child span at each call, like a
+        # service making many downstream calls for a request.
+        contexts = [ctx]
+        if self.fan_out:
+            contexts = [
+                ctx._with_span(Span("child", trace_id=ctx.trace_id, span_id=span_id))
+                for span_id in range(1, self.fan_out + 1)
+            ]
+
         def _(loops):
-            for _ in range(loops):
+            for i in range(loops):
                 # Just pass in a new/empty dict, we don't care about the result
-                http.HTTPPropagator.inject(ctx, {})
+                http.HTTPPropagator.inject(contexts[i % len(contexts)], {})
 
         yield _
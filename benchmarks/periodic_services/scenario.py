@@ -0,0 +1,46 @@
+from typing import Callable  # noqa:F401
+from typing import Generator  # noqa:F401
+
+import bm
+
+from ddtrace.internal import periodic
+
+
+class IdleService(periodic.PeriodicService):
+    wakeups = 0
+
+    def periodic(self):
+        # type: () -> None
+        self.wakeups += 1
+
+
+class PeriodicServices(bm.Scenario):
+    nservices = bm.var(type=int)
+    interval = bm.var(type=float)
+    shared_scheduler = bm.var_bool()
+    workers = bm.var(type=int)
+
+    def run(self):
+        # type: () -> Generator[Callable[[int], None], None, None]
+        # DEV: the periodic services wake up and take the GIL in the background
+        # while the application code runs in the foreground. The more often
+        # they do, the slower the application code.
+        periodic.SHARED_SCHEDULER_ENABLED = self.shared_scheduler
+        periodic._scheduler = periodic.PeriodicScheduler(self.workers)
+
+        services = [IdleService(self.interval) for _ in range(self.nservices)]
+        for service in services:
+            service.start()
+
+        def _(loops):
+            # type: (int) -> None
+            for _ in range(loops):
+                total = 0
+                for i in range(100000):
+                    total += i
+
+        yield _
+
+        for service in services:
+            service.stop()
+            service.join()
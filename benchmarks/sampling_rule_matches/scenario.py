@@ -1,10 +1,12 @@
 import itertools
 import random
+import re
 import string
 
 import bm
 
 from ddtrace import Span
+from ddtrace.internal.sampling import SamplingRuleMatcher
 from ddtrace.sampling_rule import SamplingRule
 
 
@@ -29,6 +31,7 @@ class SamplingRules(bm.Scenario):
     num_operations = bm.var(type=int)
     num_resources = bm.var(type=int)
     num_tags = bm.var(type=int)
+    num_rules = bm.var(type=int)
 
     def run(self):
         # Generate random service and operation names for the counts we requested
@@ -44,6 +47,37 @@ class SamplingRules(bm.Scenario):
             span.set_tag(tag, tag)
             spans.append(span)
 
+        if self.num_rules > 1:
+            # Generate rules that mostly do not match, mixing exact values, regular
+            # expressions and tag globs, followed by a rule that matches
+            rules = []
+            for i in range(self.num_rules - 1):
+                kind = i % 4
+                if kind == 0:
+                    rules.append(SamplingRule(sample_rate=0.5, service=rands(), name=random.choice(operation_names)))
+                elif kind == 1:
+                    rules.append(SamplingRule(sample_rate=0.5, service=random.choice(services), resource=rands()))
+                elif kind == 2:
+                    rules.append(SamplingRule(sample_rate=0.5, name=re.compile(rands()), tags={rands(): "*"}))
+                else:
+                    rules.append(SamplingRule(sample_rate=0.5, tags={random.choice(tag_names): rands(3) + "*"}))
+            rules.append(
+                SamplingRule(
+                    sample_rate=1.0,
+                    service=random.choice(services),
+                    tags={random.choice(tag_names): "*"},
+                )
+            )
+            matcher = SamplingRuleMatcher(rules)
+
+            def _(loops):
+                for _ in range(loops):
+                    for span in iter_n(spans, n=self.num_iterations):
+                        matcher.match(span)
+
+            yield _
+            return
+
         # Create a single rule to use for all matches
         # Pick a random service/operation name
         rule = SamplingRule(
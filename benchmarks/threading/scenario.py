@@ -34,6 +34,8 @@ class Threading(bm.Scenario):
     nthreads = bm.var(type=int)
     ntraces = bm.var(type=int)
     nspans = bm.var(type=int)
+    nshards = bm.var(type=int)
+    versioned = bm.var_bool()
 
     def create_trace(self, tracer):
         # type: (Tracer) -> None
@@ -45,8 +47,14 @@ class Threading(bm.Scenario):
 
     def run(self):
         # type: () -> Generator[Callable[[int], None], None, None]
+        from ddtrace import config
         from ddtrace import tracer
 
+        # DEV: versions without span aggregator sharding ignore this setting
+        config._span_aggregator_shards = self.nshards
+        # The version tag requires the root span of the active trace
+        config.version = "1.0.0" if self.versioned else None
+
         # configure global tracer to drop traces rather
         tracer.configure(writer=NoopWriter())
 
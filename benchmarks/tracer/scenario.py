@@ -4,6 +4,7 @@ import bm.utils as utils
 
 class Tracer(bm.Scenario):
     depth = bm.var(type=int)
+    nglobaltags = bm.var(type=int)
 
     def run(self):
         # configure global tracer to drop traces rather than encoded and sent to
@@ -13,6 +14,9 @@ class Tracer(bm.Scenario):
         utils.drop_traces(tracer)
         utils.drop_telemetry_events()
 
+        # Tags set on every span by the tracer
+        tracer.set_tags({"tag%d" % i: "value%d" % i for i in range(self.nglobaltags)})
+
         def _(loops):
             for _ in range(loops):
                 spans = []
@@ -0,0 +1,30 @@
+import bm
+import bm.utils as utils
+
+
+class TracerWrap(bm.Scenario):
+    ncalls = bm.var(type=int)
+    hot = bm.var_bool()
+    # Maximum number of spans per second, or a negative number for no limit
+    max_spans_per_second = bm.var(type=float)
+
+    def run(self):
+        # configure global tracer to drop traces rather than encoded and sent to
+        # an agent
+        from ddtrace import tracer
+
+        utils.drop_traces(tracer)
+        utils.drop_telemetry_events()
+
+        max_spans_per_second = self.max_spans_per_second if self.max_spans_per_second >= 0 else None
+
+        @tracer.wrap("wrapped", hot=self.hot, max_spans_per_second=max_spans_per_second)
+        def wrapped(a, b=None):
+            return a
+
+        def _(loops):
+            for _ in range(loops):
+                for i in range(self.ncalls):
+                    wrapped(i, b=i)
+
+        yield _
@@ -19,7 +19,8 @@ from .internal.utils.http import w3c_get_dd_list_member as _w3c_get_dd_list_memb
 
 
 if TYPE_CHECKING:  # pragma: no cover
-    from typing import Tuple  # noqa:F401,I001
+    from typing import List  # noqa:F401,I001
+    from typing import Tuple  # noqa:F401
 
     from .span import Span  # noqa:F401
 
@@ -46,7 +47,7 @@ class Context(object):
     boundaries.
     """
 
-    __slots__ = ["trace_id", "span_id", "_lock", "_meta", "_metrics", "_span_links", "_baggage"]
+    __slots__ = ["trace_id", "span_id", "_lock", "_meta", "_metrics", "_span_links", "_baggage", "_injected_headers"]
 
     def __init__(
         self,
@@ -66,6 +67,9 @@ class Context(object):
 
         self.trace_id = trace_id  # type: Optional[int]
         self.span_id = span_id  # type: Optional[int]
+        # The last propagation headers rendered for the trace, shared with the
+        # contexts of its spans (see HTTPPropagator.inject)
+        self._injected_headers = None  # type: Optional[List[Any]]
 
         if dd_origin is not None and _DD_ORIGIN_INVALID_CHARS_REGEX.search(dd_origin) is None:
             self._meta[ORIGIN_KEY] = dd_origin
@@ -99,13 +103,14 @@ class Context(object):
     def __setstate__(self, state):
         # type: (_ContextState) -> None
         self.trace_id, self.span_id, self._meta, self._metrics, self._span_links, self._baggage = state
+        self._injected_headers = None
         # We cannot serialize and lock, so we must recreate it unless we already have one
         self._lock = threading.RLock()
 
     def _with_span(self, span):
         # type: (Span) -> Context
         """Return a shallow copy of the context with the given span."""
-        return self.__class__(
+        ctx = self.__class__(
             trace_id=span.trace_id,
             span_id=span.span_id,
             meta=self._meta,
@@ -113,6 +118,11 @@ class Context(object):
             lock=self._lock,
             baggage=self._baggage,
         )
+        injected_headers = self._injected_headers
+        if injected_headers is None:
+            injected_headers = self._injected_headers = [None]
+        ctx._injected_headers = injected_headers
+        return ctx
 
     def _update_tags(self, span):
         # type: (Span) -> None
@@ -234,6 +244,7 @@ class Context(object):
         ctx._meta = self._meta
         ctx._metrics = self._metrics
         ctx._baggage = new_baggage
+        ctx._injected_headers = self._injected_headers
         return ctx
 
     def _get_baggage_item(self, key):
@@ -22,7 +22,7 @@ class BufferedEncoder(object):
     def __init__(self, max_size: int, max_item_size: int) -> None: ...
     def __len__(self) -> int: ...
     def put(self, item: Any) -> None: ...
-    def encode(self) -> Optional[bytes]: ...
+    def encode(self) -> Optional[Union[bytes, memoryview]]: ...
     @property
     def size(self) -> int: ...
 
@@ -32,6 +32,7 @@ class ListBufferedEncoder(BufferedEncoder):
 
 class MsgpackEncoderBase(BufferedEncoder):
     content_type: str
+    def encode(self) -> Optional[memoryview]: ...
     def get_bytes(self) -> bytes: ...
     def _decode(self, data: Union[str, bytes]) -> Any: ...
 
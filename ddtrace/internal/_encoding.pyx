@@ -1,6 +1,7 @@
 from cpython cimport *
 from cpython.bytearray cimport PyByteArray_CheckExact
 from libc cimport stdint
+from libc.string cimport memcpy
 from libc.string cimport strlen
 
 from json import dumps as json_dumps
@@ -22,10 +23,17 @@ from ._utils cimport PyBytesLike_Check
 from ..constants import ORIGIN_KEY
 from .constants import SPAN_LINKS_KEY
 from .constants import MAX_UINT_64BITS
+from .constants import SAMPLING_DECISION_TRACE_TAG_KEY
 
 
 DEF MSGPACK_ARRAY_LENGTH_PREFIX_SIZE = 5
 DEF MSGPACK_STRING_TABLE_LENGTH_PREFIX_SIZE = 6
+# Number of payload buffers an encoder keeps around for reuse. Two buffers
+# allow an encoder to fill one buffer while the previous payload is being sent.
+DEF PAYLOAD_BUFFERS = 2
+# Initial size of the buffers of the encoders. Payload buffers that grew larger
+# are freed once the payload is released.
+DEF INITIAL_BUFFER_SIZE = 1 << 20
 
 
 cdef extern from "Python.h":
@@ -131,6 +139,13 @@ cdef inline int pack_text(msgpack_packer *pk, object text) except? -1:
     if text is None:
         return msgpack_pack_nil(pk)
 
+    # DEV: most values are str, check for them before the other text types
+    if PyUnicode_CheckExact(text):
+        ret = msgpack_pack_unicode(pk, text, ITEM_LIMIT)
+        if ret == -2:
+            raise ValueError("unicode string is too large")
+        return ret
+
     if PyBytesLike_Check(text):
         L = len(text)
         if L > ITEM_LIMIT:
@@ -158,6 +173,125 @@ cdef inline int pack_text(msgpack_packer *pk, object text) except? -1:
     raise TypeError("Unhandled text type: %r" % type(text))
 
 
+cdef inline stdint.uint64_t lower_64_bits(object trace_id) except? -1:
+    """Return the lower 64 bits of a trace id, like ``Span._trace_id_64bits``, without a Python call."""
+    if trace_id is None:
+        return 0
+    return PyLong_AsUnsignedLongLongMask(trace_id)
+
+
+cdef inline dict trace_meta_to_propagate(list trace):
+    """Return the propagated ``_dd.p.*`` tags of the trace, or ``None``.
+
+    The propagated tags are stored once on the context of the trace and are
+    added to the tags of each span of the trace when it is encoded, unless the
+    span has a tag with the same name.
+    """
+    cdef dict trace_meta = None
+
+    if not trace:
+        return None
+    ctx = trace[0]._context
+    if ctx is None or not ctx._meta:
+        return None
+
+    # copying the items to avoid RuntimeError: dictionary changed size during iteration
+    for k, v in list(ctx._meta.items()):
+        if isinstance(k, str) and k.startswith("_dd.p.") and k != SAMPLING_DECISION_TRACE_TAG_KEY:
+            if trace_meta is None:
+                trace_meta = {}
+            trace_meta[k] = v
+    return trace_meta
+
+
+cdef inline Py_ssize_t count_trace_meta(dict meta, dict trace_meta):
+    """Return the number of propagated tags to add to the given span tags."""
+    cdef Py_ssize_t n = 0
+
+    if trace_meta is None:
+        return 0
+    for k in trace_meta:
+        if k not in meta:
+            n += 1
+    return n
+
+
+cdef class _PayloadBuffer(object):
+    """Encoded payload exposed as a read-only buffer.
+
+    The memory of a payload is taken over from the buffer of an encoder without
+    copying it, and is handed back to the encoder once no view of the payload is
+    alive anymore. Memory larger than ``max_spare_size`` is freed instead, so
+    that an encoder does not hold on to the memory of a burst of traces.
+    """
+    cdef char *buf
+    cdef size_t buf_size
+    cdef size_t max_spare_size
+    cdef Py_ssize_t start
+    cdef Py_ssize_t end
+    cdef int exports
+
+    def __dealloc__(self):
+        PyMem_Free(self.buf)
+        self.buf = NULL
+
+    def __getbuffer__(self, Py_buffer *view, int flags):
+        PyBuffer_FillInfo(view, self, self.buf + self.start, self.end - self.start, 1, flags)
+        self.exports += 1
+
+    def __releasebuffer__(self, Py_buffer *view):
+        self.exports -= 1
+        if self.exports == 0 and self.buf_size > self.max_spare_size:
+            PyMem_Free(self.buf)
+            self.buf = NULL
+            self.buf_size = 0
+
+
+cdef object hand_over_buffer(msgpack_packer *pk, list payloads, Py_ssize_t start, size_t keep, size_t initial_size):
+    """Return the data packed from ``start`` as a memoryview, without copying it.
+
+    The packer continues with the memory of a payload from ``payloads`` that is
+    no longer in use, or with ``initial_size`` bytes of newly allocated memory.
+    The first ``keep`` bytes of the packed data are copied over to it.
+    """
+    cdef _PayloadBuffer payload = None
+    cdef _PayloadBuffer p
+    cdef char *buf
+    cdef size_t buf_size
+
+    for p in payloads:
+        if p.exports == 0:
+            payload = p
+            break
+
+    if payload is None:
+        payload = _PayloadBuffer()
+        if len(payloads) < PAYLOAD_BUFFERS:
+            payloads.append(payload)
+
+    if payload.buf == NULL:
+        buf_size = initial_size if initial_size > keep else keep
+        buf = <char*> PyMem_Malloc(buf_size)
+        if buf == NULL:
+            raise MemoryError("Unable to allocate internal buffer.")
+    else:
+        buf = payload.buf
+        buf_size = payload.buf_size
+
+    if keep:
+        memcpy(buf, pk.buf, keep)
+
+    payload.buf = pk.buf
+    payload.buf_size = pk.buf_size
+    payload.max_spare_size = initial_size
+    payload.start = start
+    payload.end = pk.length
+    pk.buf = buf
+    pk.buf_size = buf_size
+
+    return memoryview(payload)
+
+
 cdef class StringTable(object):
     cdef dict _table
     cdef stdint.uint32_t _next_id
@@ -174,14 +308,15 @@ cdef class StringTable(object):
         cdef stdint.uint32_t _id
         cdef int ret
 
+        cdef PyObject *_found
+
         if string is None:
             return 0
 
-        ret = PyDict_Contains(self._table, string)
-        if ret == -1:
-            return ret
-        if ret:
-            return PyLong_AsLong(<object>PyDict_GetItem(self._table, string))
+        # DEV: look the string up once, most strings are already in the table
+        _found = PyDict_GetItem(self._table, string)
+        if _found is not NULL:
+            return PyLong_AsLong(<object>_found)
 
         _id = self._next_id
         ret = PyDict_SetItem(self._table, string, PyLong_FromLong(_id))
@@ -229,9 +364,11 @@ cdef class MsgpackStringTable(StringTable):
     cdef stdint.uint32_t _sp_id
     cdef object _lock
     cdef size_t _reset_size
+    cdef size_t _initial_size
+    cdef list _payloads
 
     def __init__(self, max_size):
-        self.pk.buf_size = min(max_size, 1 << 20)
+        self.pk.buf_size = self._initial_size = min(max_size, INITIAL_BUFFER_SIZE)
         self.pk.buf = <char*> PyMem_Malloc(self.pk.buf_size)
         if self.pk.buf == NULL:
             raise MemoryError("Unable to allocate internal buffer.")
@@ -240,6 +377,7 @@ cdef class MsgpackStringTable(StringTable):
         self.pk.length = MSGPACK_STRING_TABLE_LENGTH_PREFIX_SIZE
         self._sp_len = 0
         self._lock = threading.RLock()
+        self._payloads = []
         super(MsgpackStringTable, self).__init__()
 
         self.index(ORIGIN_KEY)
@@ -287,7 +425,11 @@ cdef class MsgpackStringTable(StringTable):
         #    return a 400 status code.
         self._table = {s: idx for s, idx in self._table.items() if idx < self._next_id}
 
-    cdef get_bytes(self):
+    cdef int _update_prefixes(self):
+        """Update the table and root array size prefixes.
+
+        Return the offset of the payload in the buffer, or -1 on error.
+        """
         cdef int ret
         cdef stdint.uint32_t table_size
         cdef int offset
@@ -301,16 +443,36 @@ cdef class MsgpackStringTable(StringTable):
             self.pk.length = offset
             ret = msgpack_pack_array(&self.pk, table_size)
             if ret:
-                return None
+                return -1
             # Add root array size prefix
             self.pk.length = offset = offset - 1
             ret = msgpack_pack_array(&self.pk, 2)
             if ret:
-                return None
+                return -1
             self.pk.length = old_pos
 
+            return offset
+
+    cdef get_bytes(self):
+        cdef int offset
+        with self._lock:
+            offset = self._update_prefixes()
+            if offset < 0:
+                return None
+
             return PyBytes_FromStringAndSize(self.pk.buf + offset, self.pk.length - offset)
 
+    cdef get_payload(self):
+        """Return the payload as a read-only memoryview, without copying it."""
+        cdef int offset
+        with self._lock:
+            offset = self._update_prefixes()
+            if offset < 0:
+                return None
+
+            # Keep the strings the table is reset to
+            return hand_over_buffer(&self.pk, self._payloads, offset, self._reset_size, self._initial_size)
+
     @property
     def size(self):
         with self._lock:
@@ -341,7 +503,7 @@ cdef class MsgpackStringTable(StringTable):
     cpdef flush(self):
         with self._lock:
             try:
-                return self.get_bytes()
+                return self.get_payload()
             finally:
                 self.reset()
 
@@ -418,9 +580,10 @@ cdef class MsgpackEncoderBase(BufferedEncoder):
 
     cdef msgpack_packer pk
     cdef stdint.uint32_t _count
+    cdef list _payloads
 
     def __cinit__(self, size_t max_size, size_t max_item_size):
-        cdef int buf_size = 1024*1024
+        cdef int buf_size = INITIAL_BUFFER_SIZE
         self.pk.buf = <char*> PyMem_Malloc(buf_size)
         if self.pk.buf == NULL:
             raise MemoryError("Unable to allocate internal buffer.")
@@ -429,6 +592,7 @@ cdef class MsgpackEncoderBase(BufferedEncoder):
         self.pk.buf_size = buf_size
         self.max_item_size = max_item_size if max_item_size < max_size else max_size
         self._lock = threading.RLock()
+        self._payloads = []
         self._reset_buffer()
 
     def __dealloc__(self):
@@ -472,6 +636,16 @@ cdef class MsgpackEncoderBase(BufferedEncoder):
         with self._lock:
             return PyBytes_FromStringAndSize(self.pk.buf + offset, self.pk.length - offset)
 
+    cdef get_payload(self):
+        """Return internal buffer contents as a read-only memoryview, without copying them.
+
+        The encoder continues with a buffer that is no longer in use so that
+        traces can be put while the payload is being sent.
+        """
+        cdef int offset = self._update_array_len()
+        with self._lock:
+            return hand_over_buffer(&self.pk, self._payloads, offset, 0, INITIAL_BUFFER_SIZE)
+
     cdef char * get_buffer(self):
         """Return internal buffer."""
         return self.pk.buf + self._update_array_len()
@@ -483,6 +657,7 @@ cdef class MsgpackEncoderBase(BufferedEncoder):
         cdef int ret
         cdef Py_ssize_t L
         cdef void * dd_origin = NULL
+        cdef dict trace_meta
 
         L = len(trace)
         if L > ITEM_LIMIT:
@@ -495,9 +670,11 @@ cdef class MsgpackEncoderBase(BufferedEncoder):
         if L > 0 and trace[0].context is not None and trace[0].context.dd_origin is not None:
             dd_origin = self.get_dd_origin_ref(trace[0].context.dd_origin)
 
+        trace_meta = trace_meta_to_propagate(trace)
+
         for span in trace:
             try:
-                ret = self.pack_span(span, dd_origin)
+                ret = self.pack_span(span, dd_origin, trace_meta)
             except Exception as e:
                 raise RuntimeError("failed to pack span: {!r}. Exception: {}".format(span, e))
 
@@ -547,7 +724,7 @@ cdef class MsgpackEncoderBase(BufferedEncoder):
     cpdef flush(self):
         raise NotImplementedError()
 
-    cdef int pack_span(self, object span, void *dd_origin) except? -1:
+    cdef int pack_span(self, object span, void *dd_origin, dict trace_meta) except? -1:
         raise NotImplementedError()
 
 
@@ -555,7 +732,7 @@ cdef class MsgpackEncoderV03(MsgpackEncoderBase):
     cpdef flush(self):
         with self._lock:
             try:
-                return self.get_bytes()
+                return self.get_payload()
             finally:
                 self._reset_buffer()
 
@@ -606,14 +783,16 @@ cdef class MsgpackEncoderV03(MsgpackEncoderBase):
                     return ret
         return 0
 
-    cdef inline int _pack_meta(self, object meta, char *dd_origin) except? -1:
+    cdef inline int _pack_meta(self, object meta, char *dd_origin, dict trace_meta) except? -1:
         cdef Py_ssize_t L
+        cdef Py_ssize_t n_trace_meta
         cdef int ret
         cdef dict d
 
         if PyDict_CheckExact(meta):
             d = <dict> meta
-            L = len(d)
+            n_trace_meta = count_trace_meta(d, trace_meta)
+            L = len(d) + n_trace_meta
             if dd_origin is not NULL:
                 L += 1
             if L > ITEM_LIMIT:
@@ -628,7 +807,17 @@ cdef class MsgpackEncoderV03(MsgpackEncoderBase):
                     ret = pack_text(&self.pk, v)
                     if ret != 0:
                         break
-                if dd_origin is not NULL:
+                if ret == 0 and n_trace_meta:
+                    for k, v in trace_meta.items():
+                        if k in d:
+                            continue
+                        ret = pack_text(&self.pk, k)
+                        if ret != 0:
+                            break
+                        ret = pack_text(&self.pk, v)
+                        if ret != 0:
+                            break
+                if ret == 0 and dd_origin is not NULL:
                     ret = pack_bytes(&self.pk, _ORIGIN_KEY, _ORIGIN_KEY_LEN)
                     if ret == 0:
                         ret = pack_bytes(&self.pk, dd_origin, strlen(dd_origin))
@@ -660,19 +849,26 @@ cdef class MsgpackEncoderV03(MsgpackEncoderBase):
 
         raise TypeError("Unhandled metrics type: %r" % type(metrics))
 
-    cdef int pack_span(self, object span, void *dd_origin) except? -1:
+    cdef int pack_span(self, object span, void *dd_origin, dict trace_meta) except? -1:
         cdef int ret
         cdef Py_ssize_t L
         cdef int has_span_type
         cdef int has_meta
         cdef int has_metrics
+        # DEV: read each attribute of the span once, the span fields are
+        # accessed through the Python object protocol
+        cdef object meta = span._meta
+        cdef object metrics = span._metrics
+        cdef object links = span._links
+        cdef object parent_id = span.parent_id
+        cdef object span_type = span.span_type
 
         has_error = <bint> (span.error != 0)
-        has_span_type = <bint> (span.span_type is not None)
-        has_meta = <bint> (len(span._meta) > 0 or dd_origin is not NULL)
-        has_metrics = <bint> (len(span._metrics) > 0)
-        has_parent_id = <bint> (span.parent_id is not None)
-        has_links = <bint> (len(span._links) > 0)
+        has_span_type = <bint> (span_type is not None)
+        has_meta = <bint> (len(meta) > 0 or dd_origin is not NULL or trace_meta is not None)
+        has_metrics = <bint> (len(metrics) > 0)
+        has_parent_id = <bint> (parent_id is not None)
+        has_links = <bint> (len(links) > 0)
 
         L = 7 + has_span_type + has_meta + has_metrics + has_error + has_parent_id + has_links
 
@@ -682,7 +878,7 @@ cdef class MsgpackEncoderV03(MsgpackEncoderBase):
             ret = pack_bytes(&self.pk, <char *> b"trace_id", 8)
             if ret != 0:
                 return ret
-            ret = pack_number(&self.pk, span._trace_id_64bits)
+            ret = msgpack_pack_uint64(&self.pk, lower_64_bits(span.trace_id))
             if ret != 0:
                 return ret
 
@@ -690,7 +886,7 @@ cdef class MsgpackEncoderV03(MsgpackEncoderBase):
                 ret = pack_bytes(&self.pk, <char *> b"parent_id", 9)
                 if ret != 0:
                     return ret
-                ret = pack_number(&self.pk, span.parent_id)
+                ret = pack_number(&self.pk, parent_id)
                 if ret != 0:
                     return ret
 
@@ -748,7 +944,7 @@ cdef class MsgpackEncoderV03(MsgpackEncoderBase):
                 ret = pack_bytes(&self.pk, <char *> b"type", 4)
                 if ret != 0:
                     return ret
-                ret = pack_text(&self.pk, span.span_type)
+                ret = pack_text(&self.pk, span_type)
                 if ret != 0:
                     return ret
 
@@ -756,7 +952,7 @@ cdef class MsgpackEncoderV03(MsgpackEncoderBase):
                 ret = pack_bytes(&self.pk, <char *> b"span_links", 10)
                 if ret != 0:
                     return ret
-                ret = self._pack_links(span._links)
+                ret = self._pack_links(links)
                 if ret != 0:
                     return ret
 
@@ -765,7 +961,7 @@ cdef class MsgpackEncoderV03(MsgpackEncoderBase):
                 if ret != 0:
                     return ret
 
-                ret = self._pack_meta(span._meta, <char *> dd_origin)
+                ret = self._pack_meta(meta, <char *> dd_origin, trace_meta)
                 if ret != 0:
                     return ret
 
@@ -773,7 +969,7 @@ cdef class MsgpackEncoderV03(MsgpackEncoderBase):
                 ret = pack_bytes(&self.pk, <char *> b"metrics", 7)
                 if ret != 0:
                     return ret
-                ret = self._pack_metrics(span._metrics)
+                ret = self._pack_metrics(metrics)
                 if ret != 0:
                     return ret
 
@@ -818,8 +1014,14 @@ cdef class MsgpackEncoderV05(MsgpackEncoderBase):
     cdef void * get_dd_origin_ref(self, str dd_origin):
         return <void *> PyLong_AsLong(self._st._index(dd_origin))
 
-    cdef int pack_span(self, object span, void *dd_origin) except? -1:
+    cdef int pack_span(self, object span, void *dd_origin, dict trace_meta) except? -1:
         cdef int ret
+        cdef Py_ssize_t n_trace_meta
+        # DEV: read each attribute of the span once, the span fields are
+        # accessed through the Python object protocol
+        cdef dict meta = span._meta
+        cdef dict metrics = span._metrics
+        cdef object links = span._links
 
         ret = msgpack_pack_array(&self.pk, 12)
         if ret != 0:
@@ -835,8 +1037,7 @@ cdef class MsgpackEncoderV05(MsgpackEncoderBase):
         if ret != 0:
             return ret
 
-        _ = span._trace_id_64bits
-        ret = msgpack_pack_uint64(&self.pk, _ if _ is not None else 0)
+        ret = msgpack_pack_uint64(&self.pk, lower_64_bits(span.trace_id))
         if ret != 0:
             return ret
 
@@ -866,14 +1067,27 @@ cdef class MsgpackEncoderV05(MsgpackEncoderBase):
             return ret
 
         span_links = ""
-        if span._links:
-            span_links = json_dumps([link.to_dict() for link in span._links])
+        if links:
+            span_links = json_dumps([link.to_dict() for link in links])
 
-        ret = msgpack_pack_map(&self.pk, len(span._meta) + (dd_origin is not NULL) + (len(span_links) > 0))
+        n_trace_meta = count_trace_meta(meta, trace_meta)
+        ret = msgpack_pack_map(
+            &self.pk, len(meta) + n_trace_meta + (dd_origin is not NULL) + (len(span_links) > 0)
+        )
         if ret != 0:
             return ret
-        if span._meta:
-            for k, v in span._meta.items():
+        if meta:
+            for k, v in meta.items():
+                ret = self._pack_string(k)
+                if ret != 0:
+                    return ret
+                ret = self._pack_string(v)
+                if ret != 0:
+                    return ret
+        if n_trace_meta:
+            for k, v in trace_meta.items():
+                if k in meta:
+                    continue
                 ret = self._pack_string(k)
                 if ret != 0:
                     return ret
@@ -895,11 +1109,11 @@ cdef class MsgpackEncoderV05(MsgpackEncoderBase):
             if ret != 0:
                 return ret
 
-        ret = msgpack_pack_map(&self.pk, len(span._metrics))
+        ret = msgpack_pack_map(&self.pk, len(metrics))
         if ret != 0:
             return ret
-        if span._metrics:
-            for k, v in span._metrics.items():
+        if metrics:
+            for k, v in metrics.items():
                 ret = self._pack_string(k)
                 if ret != 0:
                     return ret
@@ -1,3 +1,5 @@
 def seed() -> None: ...
 def rand64bits(check_pid: bool = True) -> int: ...
+def refill_rand64bits() -> int: ...
+def pop_rand64bits() -> int: ...
 def rand128bits(check_pid: bool = True) -> int: ...
@@ -63,6 +63,17 @@ cdef extern from "_stdint.h" nogil:
 
 cdef uint64_t state
 
+# Number of IDs generated at once by refill_rand64bits
+DEF BATCH_SIZE = 1024
+
+# Random IDs generated ahead of time, shared by all threads. Popping an item off
+# a list is atomic, so no per-thread buffer or lock is needed.
+cdef list _batch = []
+
+# Bound method handing out the next pre-generated ID. It raises IndexError once
+# the batch is exhausted, after which refill_rand64bits must be called.
+pop_rand64bits = _batch.pop
+
 
 cpdef _getstate():
     return state
@@ -72,6 +83,8 @@ cpdef seed():
     global state
     random.seed()
     state = <uint64_t>random.getrandbits(64) ^ <uint64_t>4101842887655102017
+    # The IDs generated before forking would be handed out by both processes
+    del _batch[:]
 
 
 # We have to reseed the RNG or we will get collisions between the processes as
@@ -87,6 +100,22 @@ cpdef rand64bits():
     return <uint64_t>(state * <uint64_t>2685821657736338717)
 
 
+cpdef refill_rand64bits():
+    """Generate a new batch of random 64-bit integers and return one of them.
+
+    This lets callers pop the IDs with ``pop_rand64bits`` without calling into
+    the generator for every ID::
+
+        try:
+            span_id = pop_rand64bits()
+        except IndexError:
+            span_id = refill_rand64bits()
+    """
+    cdef Py_ssize_t i
+    _batch.extend([rand64bits() for i in range(BATCH_SIZE)])
+    return rand64bits()
+
+
 cpdef rand128bits():
     # Returns a 128bit integer with the following format -> <32-bit unix seconds><32 bits of zero><64 random bits>
     return int(time(NULL)) << 96 | rand64bits()
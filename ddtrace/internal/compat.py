@@ -144,7 +144,7 @@ except ImportError:
 main_thread = threading.main_thread()
 
 
-def make_async_decorator(tracer, coro, *params, **kw_params):
+def make_async_decorator(tracer, coro, *params, budget=None, **kw_params):
     """
     Decorator factory that creates an asynchronous wrapper that yields
     a coroutine result. This factory is required to handle Python 2
@@ -153,11 +153,15 @@ def make_async_decorator(tracer, coro, *params, **kw_params):
     :param object tracer: the tracer instance that is used
     :param function f: the coroutine that must be executed
     :param tuple params: arguments given to the Tracer.trace()
+    :param object budget: an optional sampling budget; the calls that are not
+                          allowed by the budget are not traced
     :param dict kw_params: keyword arguments given to the Tracer.trace()
     """
 
     @functools.wraps(coro)
     async def func_wrapper(*args, **kwargs):
+        if budget is not None and not budget.is_allowed():
+            return await coro(*args, **kwargs)
         with tracer.trace(*params, **kw_params):
             result = await coro(*args, **kwargs)
             return result
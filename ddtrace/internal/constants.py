@@ -35,6 +35,10 @@ SPAN_API_OPENTRACING = "opentracing"
 DEFAULT_BUFFER_SIZE = 20 << 20  # 20 MB
 DEFAULT_MAX_PAYLOAD_SIZE = 20 << 20  # 20 MB
 DEFAULT_PROCESSING_INTERVAL = 1.0
+DEFAULT_MAX_PROCESSING_INTERVAL = 10.0
+DEFAULT_SPOOL_MAX_SIZE = 100 << 20  # 100 MB
+DEFAULT_SPOOL_SEGMENT_SIZE = 8 << 20  # 8 MB
+DEFAULT_SPOOL_MAX_AGE = 3600.0
 DEFAULT_REUSE_CONNECTIONS = False
 BLOCKED_RESPONSE_HTML = """
 <!DOCTYPE html><html lang="en"><head> <meta charset="UTF-8"> <meta name="viewport"
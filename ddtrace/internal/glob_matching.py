@@ -1,3 +1,6 @@
+import re
+import typing  # noqa:F401
+
 from .utils.cache import cachedmethod
 
 
@@ -49,3 +52,19 @@ class GlobMatcher(object):
 
             return False
         return True
+
+
+def glob_to_regex(pattern):
+    # type: (str) -> typing.Pattern[str]
+    """Compile a glob pattern to a regular expression that matches the same subjects as ``GlobMatcher``."""
+    parts = []
+    for char in pattern:
+        if char == "*":
+            # Consecutive wildcards match the same subjects as a single one
+            if not parts or parts[-1] != ".*":
+                parts.append(".*")
+        elif char == "?":
+            parts.append(".")
+        else:
+            parts.append(re.escape(char))
+    return re.compile("".join(parts) + r"\Z", re.DOTALL)
@@ -1,12 +1,28 @@
 # -*- encoding: utf-8 -*-
+from collections import deque
+import os
 import threading
+import time
 import typing  # noqa:F401
+import weakref
 
 import attr
 
 from ddtrace.internal import service
 
 from . import forksafe
+from .logger import get_logger
+from .utils.formats import asbool
+
+
+log = get_logger(__name__)
+
+# Run the periodic services on the threads of a shared scheduler rather than on
+# a thread each.
+SHARED_SCHEDULER_ENABLED = asbool(os.getenv("DD_PERIODIC_SHARED_SCHEDULER_ENABLED", False))
+# The number of threads the periodic functions are run on. With no workers, the
+# functions run on the scheduler thread.
+SHARED_SCHEDULER_WORKERS = int(os.getenv("DD_PERIODIC_SHARED_SCHEDULER_WORKERS", 1))
 
 
 class PeriodicThread(threading.Thread):
@@ -79,8 +95,18 @@ class AwakeablePeriodicThread(PeriodicThread):
         self.served = forksafe.Event()
         self.awake_lock = forksafe.Lock()
 
-    def awake(self):
-        """Awake the thread."""
+    def awake(self, wait=True):
+        # type: (bool) -> None
+        """Awake the thread.
+
+        :param wait: Whether to block until the thread has served the request.
+            Requests that are not waited for can be made from the thread
+            itself.
+        """
+        if not wait:
+            self.request.set()
+            return
+
         with self.awake_lock:
             self.served.clear()
             self.request.set()
@@ -105,6 +131,361 @@ class AwakeablePeriodicThread(PeriodicThread):
             self._on_shutdown()
 
 
+class TimerWheel(object):
+    """Hashed timer wheel.
+
+    Timers are stored in the slot of the tick of their deadline, modulo the
+    number of slots, so that adding a timer and expiring the timers of a tick
+    are O(1). Timers due in a later rotation of the wheel stay in their slot
+    until their rotation comes.
+    """
+
+    def __init__(self, tick=0.05, slots=512, now=None):
+        # type: (float, int, typing.Optional[float]) -> None
+        self.tick = tick
+        self._slots = [[] for _ in range(slots)]  # type: typing.List[typing.List[typing.Tuple[float, typing.Any]]]
+        self._count = 0
+        # The next tick to expire
+        self._current = self._tick(time.monotonic() if now is None else now)
+
+    def __len__(self):
+        # type: () -> int
+        return self._count
+
+    def _tick(self, t):
+        # type: (float) -> int
+        return int(t // self.tick)
+
+    def add(self, deadline, item):
+        # type: (float, typing.Any) -> None
+        """Add a timer for the item at the given deadline."""
+        # DEV: timers in the past are expired with the next tick
+        tick = max(self._tick(deadline), self._current)
+        self._slots[tick % len(self._slots)].append((deadline, item))
+        self._count += 1
+
+    def expire(self, now):
+        # type: (float) -> typing.List[typing.Any]
+        """Remove and return the items of the timers due at ``now``."""
+        last = self._tick(now)
+        if not self._count:
+            self._current = max(last, self._current)
+            return []
+
+        expired = []
+        n = len(self._slots)
+        # DEV: past one rotation every slot has been visited
+        for tick in range(self._current, min(last, self._current + n - 1) + 1):
+            slot = self._slots[tick % n]
+            if not slot:
+                continue
+            due = [timer for timer in slot if timer[0] <= now]
+            if due:
+                slot[:] = [timer for timer in slot if timer[0] > now]
+                self._count -= len(due)
+                expired.extend(item for _, item in sorted(due, key=lambda timer: timer[0]))
+        self._current = max(last, self._current)
+        return expired
+
+    def next_deadline(self):
+        # type: () -> typing.Optional[float]
+        """Return the earliest deadline of the timers, if any."""
+        if not self._count:
+            return None
+
+        n = len(self._slots)
+        for tick in range(self._current, self._current + n):
+            slot = self._slots[tick % n]
+            # Only the timers of the current rotation are due in this slot
+            deadlines = [deadline for deadline, _ in slot if self._tick(deadline) <= tick]
+            if deadlines:
+                return min(deadlines)
+        # All the timers are due in later rotations
+        return min(deadline for slot in self._slots for deadline, _ in slot)
+
+
+class PeriodicScheduler(object):
+    """Scheduler that runs the functions of many periodic tasks from a few threads.
+
+    A single thread waits for the next timer of a ``TimerWheel`` to expire and
+    hands the due tasks over to a small pool of worker threads, so that a
+    function that blocks on I/O does not delay the other ones. With no
+    workers, the functions run on the scheduler thread. The threads are only
+    started once a task is scheduled and are restarted after a fork.
+    """
+
+    def __init__(self, workers=SHARED_SCHEDULER_WORKERS):
+        # type: (int) -> None
+        self.workers = workers
+        self._tasks = weakref.WeakSet()  # type: weakref.WeakSet[ScheduledTask]
+        self._reset()
+        forksafe.register(self._after_fork)
+
+    def _reset(self):
+        # type: () -> None
+        self._lock = threading.Lock()
+        self._timers_changed = threading.Condition(self._lock)
+        self._tasks_ready = threading.Condition(self._lock)
+        self._wheel = TimerWheel()
+        self._ready = deque()  # type: typing.Deque[ScheduledTask]
+        self._threads = []  # type: typing.List[threading.Thread]
+
+    def _after_fork(self):
+        # type: () -> None
+        # The threads of the parent process do not exist in the child process,
+        # and neither do the tasks they were running.
+        self._reset()
+        for task in list(self._tasks):
+            task._finished.set()
+        self._tasks = weakref.WeakSet()
+
+    def _start_threads(self):
+        # type: () -> None
+        if self._threads:
+            return
+        targets = [self._run_timers] + [self._run_tasks] * self.workers
+        for i, target in enumerate(targets):
+            thread = threading.Thread(target=target, name="%s:%s-%d" % (__name__, self.__class__.__name__, i))
+            thread.daemon = True
+            thread._ddtrace_profiling_ignore = True  # type: ignore[attr-defined]
+            self._threads.append(thread)
+            thread.start()
+
+    def _schedule(self, task, delay):
+        # type: (ScheduledTask, float) -> None
+        # DEV: must be called with the lock held
+        task._generation += 1
+        self._wheel.add(time.monotonic() + delay, (task._generation, task))
+        self._timers_changed.notify()
+
+    def _dispatch(self, task):
+        # type: (ScheduledTask) -> None
+        # DEV: must be called with the lock held
+        task._generation += 1
+        task._running = True
+        self._ready.append(task)
+        if self.workers:
+            self._tasks_ready.notify()
+        else:
+            self._timers_changed.notify()
+
+    def add(self, task, delay):
+        # type: (ScheduledTask, float) -> None
+        """Schedule the task to run after ``delay`` seconds."""
+        with self._lock:
+            self._tasks.add(task)
+            self._start_threads()
+            self._schedule(task, delay)
+
+    def _run_timers(self):
+        # type: () -> None
+        while True:
+            with self._lock:
+                for generation, task in self._wheel.expire(time.monotonic()):
+                    # Skip the timers of the tasks that have been rescheduled
+                    if generation == task._generation and not task._running:
+                        self._dispatch(task)
+
+                if self.workers or not self._ready:
+                    deadline = self._wheel.next_deadline()
+                    self._timers_changed.wait(None if deadline is None else max(deadline - time.monotonic(), 0))
+                    continue
+
+                ready, self._ready = self._ready, deque()
+
+            for task in ready:
+                task._run()
+
+    def _run_tasks(self):
+        # type: () -> None
+        while True:
+            with self._lock:
+                while not self._ready:
+                    self._tasks_ready.wait()
+                task = self._ready.popleft()
+            task._run()
+
+    def _done(self, task, failed=False):
+        # type: (ScheduledTask, bool) -> bool
+        """Reschedule a task after it has run and return whether it has been stopped."""
+        with self._lock:
+            task._running = False
+            if failed:
+                task._stopping = True
+            if task._stopping:
+                return True
+            if task._requested:
+                task._requested = False
+                self._schedule(task, 0)
+            else:
+                self._schedule(task, task.interval)
+            return False
+
+
+_scheduler = None  # type: typing.Optional[PeriodicScheduler]
+
+
+def get_scheduler():
+    # type: () -> PeriodicScheduler
+    """Return the scheduler shared by the periodic services."""
+    global _scheduler
+
+    if _scheduler is None:
+        _scheduler = PeriodicScheduler()
+    return _scheduler
+
+
+class ScheduledTask(object):
+    """Periodic task run by a ``PeriodicScheduler``.
+
+    This class has the interface of ``PeriodicThread`` and can be used in its
+    place to run the ``target`` function every ``interval`` seconds without a
+    dedicated thread.
+    """
+
+    def __init__(
+        self,
+        interval,  # type: float
+        target,  # type: typing.Callable[[], typing.Any]
+        name=None,  # type: typing.Optional[str]
+        on_shutdown=None,  # type: typing.Optional[typing.Callable[[], typing.Any]]
+        scheduler=None,  # type: typing.Optional[PeriodicScheduler]
+    ):
+        # type: (...) -> None
+        self.interval = interval
+        self.name = name
+        self._target = target
+        self._on_shutdown = on_shutdown
+        self._scheduler = scheduler or get_scheduler()
+        self._started = False
+        self._running = False
+        self._stopping = False
+        self._requested = False
+        # Incremented every time the task is scheduled or dispatched, to
+        # invalidate the timers of the previous schedule.
+        self._generation = 0
+        self._finished = forksafe.Event()
+
+    def __repr__(self):
+        # type: () -> str
+        return "<%s(%s)>" % (self.__class__.__name__, self.name)
+
+    def _first_delay(self):
+        # type: () -> float
+        return self.interval
+
+    def start(self):
+        # type: () -> None
+        if self._started:
+            raise RuntimeError("tasks can only be started once")
+        self._started = True
+        self._scheduler.add(self, self._first_delay())
+
+    def stop(self):
+        # type: () -> None
+        """Stop the task, running its shutdown function."""
+        scheduler = self._scheduler
+        with scheduler._lock:
+            if not self.is_alive() or self._stopping:
+                return
+            self._stopping = True
+            if not self._running:
+                # Let the scheduler run the shutdown function
+                scheduler._dispatch(self)
+
+    def is_alive(self):
+        # type: () -> bool
+        return self._started and not self._finished.is_set()
+
+    def join(self, timeout=None):
+        # type: (typing.Optional[float]) -> None
+        if self._started:
+            self._finished.wait(timeout)
+
+    def _run(self):
+        # type: () -> None
+        if not self._stopping:
+            try:
+                self._target()
+            except Exception:
+                # Like a periodic thread, the task ends without shutting down
+                log.error("periodic task %r failed", self, exc_info=True)
+                self._scheduler._done(self, failed=True)
+                self._finished.set()
+                return
+            if not self._scheduler._done(self):
+                return
+
+        try:
+            if self._on_shutdown is not None:
+                self._on_shutdown()
+        except Exception:
+            log.error("shutdown of periodic task %r failed", self, exc_info=True)
+        finally:
+            self._finished.set()
+
+
+class AwakeableScheduledTask(ScheduledTask):
+    """Scheduled task that can be awakened on demand.
+
+    This class has the interface of ``AwakeablePeriodicThread``. Like it, the
+    target function is run as soon as the task is started.
+    """
+
+    def __init__(
+        self,
+        interval,  # type: float
+        target,  # type: typing.Callable[[], typing.Any]
+        name=None,  # type: typing.Optional[str]
+        on_shutdown=None,  # type: typing.Optional[typing.Callable[[], typing.Any]]
+        scheduler=None,  # type: typing.Optional[PeriodicScheduler]
+    ):
+        # type: (...) -> None
+        super(AwakeableScheduledTask, self).__init__(interval, target, name, on_shutdown, scheduler)
+        # The events of the callers waiting for the next run of the target function
+        self._waiters = []  # type: typing.List[threading.Event]
+
+    def _first_delay(self):
+        # type: () -> float
+        return 0
+
+    def awake(self, wait=True):
+        # type: (bool) -> None
+        """Awake the task.
+
+        :param wait: Whether to block until the target function has run.
+            Requests that are not waited for can be made from the target
+            function itself.
+        """
+        served = threading.Event() if wait else None
+        scheduler = self._scheduler
+        with scheduler._lock:
+            if self._stopping or not self.is_alive():
+                return
+            if served is not None:
+                self._waiters.append(served)
+            if self._running:
+                # Run again as soon as the current run is over
+                self._requested = True
+            else:
+                scheduler._dispatch(self)
+
+        if served is not None:
+            while not served.wait(0.1):
+                if not self.is_alive():
+                    break
+
+    def _run(self):
+        # type: () -> None
+        with self._scheduler._lock:
+            waiters, self._waiters = self._waiters, []
+        try:
+            super(AwakeableScheduledTask, self)._run()
+        finally:
+            for served in waiters:
+                served.set()
+
+
 @attr.s(eq=False)
 class PeriodicService(service.Service):
     """A service that runs periodically."""
@@ -133,7 +514,11 @@ class PeriodicService(service.Service):
     def _start_service(self, *args, **kwargs):
         # type: (typing.Any, typing.Any) -> None
         """Start the periodic service."""
-        self._worker = self.__thread_class__(
+        thread_class = self.__thread_class__
+        if SHARED_SCHEDULER_ENABLED:
+            # DEV: services that bring their own thread class keep their thread
+            thread_class = _SCHEDULED_TASK_CLASSES.get(thread_class, thread_class)
+        self._worker = thread_class(
             self.interval,
             target=self.periodic,
             name="%s:%s" % (self.__class__.__module__, self.__class__.__name__),
@@ -169,6 +554,13 @@ class AwakeablePeriodicService(PeriodicService):
 
     __thread_class__ = AwakeablePeriodicThread
 
-    def awake(self):
-        # type: (...) -> None
-        self._worker.awake()
+    def awake(self, wait=True):
+        # type: (bool) -> None
+        self._worker.awake(wait)
+
+
+# The scheduled tasks that replace the periodic threads with the shared scheduler
+_SCHEDULED_TASK_CLASSES = {
+    PeriodicThread: ScheduledTask,
+    AwakeablePeriodicThread: AwakeableScheduledTask,
+}  # type: typing.Dict[typing.Type, typing.Type]
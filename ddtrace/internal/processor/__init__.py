@@ -1,4 +1,5 @@
 import abc
+from typing import Any  # noqa:F401
 from typing import List  # noqa:F401
 from typing import Optional  # noqa:F401
 
@@ -11,11 +12,38 @@ from ddtrace.internal.logger import get_logger
 log = get_logger(__name__)
 
 
+def _noop(self, span):
+    pass
+
+
+def _documented_noop(self, span):
+    """The docstring shifts the index of the ``None`` constant on some versions."""
+
+
+_NOOP_CODES = frozenset((_noop.__code__.co_code, _documented_noop.__code__.co_code))
+
+
+def _is_noop(method):
+    # type: (Any) -> bool
+    """Return whether a processor method does nothing.
+
+    Methods whose body is only ``pass`` or a docstring do not need to be called.
+    """
+    code = getattr(getattr(method, "__func__", method), "__code__", None)
+    return code is not None and code.co_code in _NOOP_CODES
+
+
 @attr.s
 class SpanProcessor(metaclass=abc.ABCMeta):
     """A Processor is used to process spans as they are created and finished by a tracer."""
 
     __processors__ = []  # type: List["SpanProcessor"]
+    # Incremented whenever the global list of processors changes
+    _generation = 0
+
+    # Whether the processor is called with the finishing spans of the traces
+    # that are dropped as soon as they start (see DD_TRACE_EARLY_DROP_ENABLED).
+    _process_dropped_spans = False
 
     def __attrs_post_init__(self):
         # type: () -> None
@@ -55,6 +83,16 @@ class SpanProcessor(metaclass=abc.ABCMeta):
         """
         pass
 
+    def on_spans_finish(self, spans):
+        # type: (List[Span]) -> None
+        """Called with a batch of spans that finished at the same time.
+
+        Processors that take a lock for each finishing span can override this
+        method to take it once for the whole batch.
+        """
+        for span in spans:
+            self.on_span_finish(span)
+
     def shutdown(self, timeout):
         # type: (Optional[float]) -> None
         """Called when the processor is done being used.
@@ -67,6 +105,7 @@ class SpanProcessor(metaclass=abc.ABCMeta):
         # type: () -> None
         """Register the processor with the global list of processors."""
         SpanProcessor.__processors__.append(self)
+        SpanProcessor._generation += 1
 
     def unregister(self):
         # type: () -> None
@@ -75,3 +114,4 @@ class SpanProcessor(metaclass=abc.ABCMeta):
             SpanProcessor.__processors__.remove(self)
         except ValueError:
             raise ValueError("Span processor %r not registered" % self)
+        SpanProcessor._generation += 1
@@ -1,6 +1,8 @@
 # coding: utf-8
+from array import array
 from collections import defaultdict
 import os
+import threading
 import typing
 
 from ddsketch import LogCollapsingLowestDenseDDSketch
@@ -24,11 +26,17 @@ from ..writer import _human_size
 from . import SpanProcessor
 
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 if typing.TYPE_CHECKING:  # pragma: no cover
     from typing import DefaultDict  # noqa:F401
     from typing import Dict  # noqa:F401
     from typing import List  # noqa:F401
     from typing import Optional  # noqa:F401
+    from typing import Tuple  # noqa:F401
     from typing import Union  # noqa:F401
 
     from ddtrace import Span  # noqa:F401
@@ -60,6 +68,71 @@ SpanAggrKey = typing.Tuple[
 ]
 
 
+# Number of values a distribution holds before it is converted to a sketch
+_SKETCH_SPARSE_LIMIT = 64
+
+
+def _new_sketch():
+    # type: () -> LogCollapsingLowestDenseDDSketch
+    # Match the relative accuracy of the sketch implementation used in the backend
+    # which is 0.775%.
+    return LogCollapsingLowestDenseDDSketch(0.00775, bin_limit=2048)
+
+
+class _CompactSketch(object):
+    """A distribution of span durations that only allocates a sketch once it holds enough values.
+
+    Most aggregation keys only see a handful of spans per bucket, for which the
+    dense stores of a sketch are mostly empty. The durations are kept in a
+    small array instead and only added to a sketch past
+    ``_SKETCH_SPARSE_LIMIT`` values, or when the distribution is serialized.
+    """
+
+    __slots__ = ("_values", "_sketch")
+
+    def __init__(self):
+        # type: () -> None
+        self._values = None  # type: Optional[array]
+        self._sketch = None  # type: Optional[LogCollapsingLowestDenseDDSketch]
+
+    @property
+    def count(self):
+        # type: () -> float
+        if self._sketch is not None:
+            return self._sketch.count
+        return len(self._values) if self._values is not None else 0
+
+    def add(self, value):
+        # type: (int) -> None
+        if self._sketch is not None:
+            self._sketch.add(value)
+            return
+
+        if self._values is None:
+            self._values = array("q")
+        self._values.append(value)
+        if len(self._values) > _SKETCH_SPARSE_LIMIT:
+            self._sketch = self.to_sketch()
+            self._values = None
+
+    def extend(self, values):
+        # type: (typing.Iterable[int]) -> None
+        for value in values:
+            self.add(value)
+
+    def to_sketch(self):
+        # type: () -> LogCollapsingLowestDenseDDSketch
+        """Return the sketch of the distribution."""
+        if self._sketch is not None:
+            return self._sketch
+
+        sketch = _new_sketch()
+        if self._values is not None:
+            for value in self._values:
+                sketch.add(value)
+        return sketch
+
+
 class SpanAggrStats(object):
     """Aggregated span statistics."""
 
@@ -70,10 +143,8 @@ class SpanAggrStats(object):
         self.top_level_hits = 0
         self.errors = 0
         self.duration = 0
-        # Match the relative accuracy of the sketch implementation used in the backend
-        # which is 0.775%.
-        self.ok_distribution = LogCollapsingLowestDenseDDSketch(0.00775, bin_limit=2048)
-        self.err_distribution = LogCollapsingLowestDenseDDSketch(0.00775, bin_limit=2048)
+        self.ok_distribution = _CompactSketch()
+        self.err_distribution = _CompactSketch()
 
 
 def _span_aggr_key(span):
@@ -87,11 +158,57 @@ def _span_aggr_key(span):
     return span.name, service, resource, _type, int(status_code), synthetics
 
 
+_FLAG_TOP_LEVEL = 1
+_FLAG_ERROR = 2
+
+# Smallest number of records for which grouping them with NumPy pays off
+_NUMPY_MIN_RECORDS = 256
+
+# Number of records after which a thread aggregates its batch into the buckets
+# itself, so that the memory used by the batches does not grow with the span
+# throughput between flushes.
+_BATCH_MAX_RECORDS = 1 << 12
+
+# The recorders are keyed by the id of the native thread: with gevent the
+# thread locals and the Python thread ids are specific to each greenlet.
+_get_thread_id = getattr(threading, "get_native_id", threading.get_ident)
+
+
+class _SpanStatsBatch(object):
+    """Stats of the spans finished by a single thread, waiting to be aggregated.
+
+    Records are stored column-wise. The key of a record is appended last so
+    that the records are complete up to the number of keys.
+    """
+
+    __slots__ = ("keys", "ends", "durations", "flags")
+
+    def __init__(self):
+        # type: () -> None
+        self.keys = []  # type: List[SpanAggrKey]
+        self.ends = array("q")
+        self.durations = array("q")
+        self.flags = array("B")
+
+
+class _SpanStatsRecorder(object):
+    """The batch a thread records the stats of its spans to."""
+
+    __slots__ = ("batch",)
+
+    def __init__(self):
+        # type: () -> None
+        self.batch = _SpanStatsBatch()
+
+
 class SpanStatsProcessorV06(PeriodicService, SpanProcessor):
     """SpanProcessor for computing, collecting and submitting span metrics to the Datadog Agent."""
 
-    def __init__(self, agent_url, interval=None, timeout=1.0, retry_attempts=3):
-        # type: (str, Optional[float], float, int) -> None
+    # Stats are computed on all the spans, including the ones of dropped traces
+    _process_dropped_spans = True
+
+    def __init__(self, agent_url, interval=None, timeout=1.0, retry_attempts=3, batched=None):
+        # type: (str, Optional[float], float, int, Optional[bool]) -> None
         if interval is None:
             interval = float(os.getenv("_DD_TRACE_STATS_WRITER_INTERVAL") or 10.0)
         super(SpanStatsProcessorV06, self).__init__(interval=interval)
@@ -104,6 +221,9 @@ class SpanStatsProcessorV06(PeriodicService, SpanProcessor):
         self._buckets = defaultdict(
             lambda: defaultdict(SpanAggrStats)
         )  # type: DefaultDict[int, DefaultDict[SpanAggrKey, SpanAggrStats]]
+        # Aggregation keys are interned so that the buckets, and the batches in
+        # batched mode, share a single copy of each key.
+        self._keys = {}  # type: Dict[SpanAggrKey, SpanAggrKey]
         self._headers = {
             "Datadog-Meta-Lang": "python",
             "Datadog-Meta-Tracer-Version": ddtrace.__version__,
@@ -113,6 +233,16 @@ class SpanStatsProcessorV06(PeriodicService, SpanProcessor):
         self._lock = Lock()
         self._enabled = True
 
+        # In batched mode each thread records the stats of its spans to its own
+        # batch, without locking, and the batches are aggregated on flush.
+        self._batched = config._trace_compute_stats_batched if batched is None else batched
+        self._recorders = {}  # type: Dict[int, _SpanStatsRecorder]
+        # Batches swapped out on the previous flush along with the number of
+        # records aggregated from them. Records appended by threads that were
+        # about to record when the batch was swapped out, or when their idle
+        # recorder was dropped, are aggregated on the next flush.
+        self._retired = []  # type: List[Tuple[_SpanStatsBatch, int]]
+
         self._flush_stats_with_backoff = fibonacci_backoff_with_jitter(
             attempts=retry_attempts,
             initial_wait=0.618 * self.interval / (1.618**retry_attempts) / 2,
@@ -133,23 +263,165 @@ class SpanStatsProcessorV06(PeriodicService, SpanProcessor):
         if not is_top_level and not _is_measured(span):
             return
 
+        if self._batched:
+            self._record(span, is_top_level)
+            return
+
         with self._lock:
-            # Align the span into the corresponding stats bucket
-            assert span.duration_ns is not None
-            span_end_ns = span.start_ns + span.duration_ns
-            bucket_time_ns = span_end_ns - (span_end_ns % self._bucket_size_ns)
-            aggr_key = _span_aggr_key(span)
-            stats = self._buckets[bucket_time_ns][aggr_key]
-
-            stats.hits += 1
-            stats.duration += span.duration_ns
-            if is_top_level:
-                stats.top_level_hits += 1
-            if span.error:
-                stats.errors += 1
-                stats.err_distribution.add(span.duration_ns)
-            else:
-                stats.ok_distribution.add(span.duration_ns)
+            self._aggregate(span, is_top_level)
+
+    def on_spans_finish(self, spans):
+        # type: (List[Span]) -> None
+        if not self._enabled:
+            return
+
+        if self._batched:
+            for span in spans:
+                is_top_level = _is_top_level(span)
+                if is_top_level or _is_measured(span):
+                    self._record(span, is_top_level)
+            return
+
+        with self._lock:
+            for span in spans:
+                is_top_level = _is_top_level(span)
+                if is_top_level or _is_measured(span):
+                    self._aggregate(span, is_top_level)
+
+    def _aggregate(self, span, is_top_level):
+        # type: (Span, bool) -> None
+        """Add a finished span to its stats bucket.
+
+        Must be called with the lock held.
+        """
+        # Align the span into the corresponding stats bucket
+        assert span.duration_ns is not None
+        span_end_ns = span.start_ns + span.duration_ns
+        bucket_time_ns = span_end_ns - (span_end_ns % self._bucket_size_ns)
+        aggr_key = self._intern_key(_span_aggr_key(span))
+        stats = self._buckets[bucket_time_ns][aggr_key]
+
+        stats.hits += 1
+        stats.duration += span.duration_ns
+        if is_top_level:
+            stats.top_level_hits += 1
+        if span.error:
+            stats.errors += 1
+            stats.err_distribution.add(span.duration_ns)
+        else:
+            stats.ok_distribution.add(span.duration_ns)
+
+    def _record(self, span, is_top_level):
+        # type: (Span, bool) -> None
+        thread_id = _get_thread_id()
+        recorder = self._recorders.get(thread_id)
+        if recorder is None:
+            with self._lock:
+                recorder = self._recorders.setdefault(thread_id, _SpanStatsRecorder())
+        batch = recorder.batch
+
+        assert span.duration_ns is not None
+        batch.ends.append(span.start_ns + span.duration_ns)
+        batch.durations.append(span.duration_ns)
+        batch.flags.append((_FLAG_TOP_LEVEL if is_top_level else 0) | (_FLAG_ERROR if span.error else 0))
+        batch.keys.append(self._intern_key(_span_aggr_key(span)))
+
+        if len(batch.keys) >= _BATCH_MAX_RECORDS:
+            with self._lock:
+                batch = recorder.batch
+                # The batch might have been swapped out by a flush in the meantime
+                if len(batch.keys) >= _BATCH_MAX_RECORDS:
+                    recorder.batch = _SpanStatsBatch()
+                    self._aggregate_batch(batch, 0)
+
+    def _intern_key(self, key):
+        # type: (SpanAggrKey) -> SpanAggrKey
+        return self._keys.setdefault(key, key)
+
+    def _aggregate_batches(self):
+        # type: () -> None
+        """Aggregate the stats recorded by every thread into the buckets."""
+        for batch, start in self._retired:
+            self._aggregate_batch(batch, start)
+
+        retired = []
+        recorders = {}
+        for thread_id, recorder in self._recorders.items():
+            batch = recorder.batch
+            if not batch.keys:
+                # Drop the recorders of the threads that did not record since
+                # the previous flush, e.g. of threads that have exited.
+                retired.append((batch, 0))
+                continue
+            recorder.batch = _SpanStatsBatch()
+            retired.append((batch, self._aggregate_batch(batch, 0)))
+            recorders[thread_id] = recorder
+        self._retired = retired
+        self._recorders = recorders
+
+    def _aggregate_batch(self, batch, start):
+        # type: (_SpanStatsBatch, int) -> int
+        """Aggregate the records of a batch from ``start`` and return the number of records aggregated."""
+        end = len(batch.keys)
+        if end <= start:
+            return start
+
+        keys = batch.keys[start:end]
+        ends = batch.ends[start:end]
+        durations = batch.durations[start:end]
+        flags = batch.flags[start:end]
+
+        if numpy is not None and end - start >= _NUMPY_MIN_RECORDS:
+            self._aggregate_records_numpy(keys, ends, durations, flags)
+        else:
+            bucket_size_ns = self._bucket_size_ns
+            for key, span_end_ns, duration, flag in zip(keys, ends, durations, flags):
+                stats = self._buckets[span_end_ns - (span_end_ns % bucket_size_ns)][key]
+                stats.hits += 1
+                stats.duration += duration
+                if flag & _FLAG_TOP_LEVEL:
+                    stats.top_level_hits += 1
+                if flag & _FLAG_ERROR:
+                    stats.errors += 1
+                    stats.err_distribution.add(duration)
+                else:
+                    stats.ok_distribution.add(duration)
+
+        return end
+
+    def _aggregate_records_numpy(self, keys, ends, durations, flags):
+        # type: (List[SpanAggrKey], array, array, array) -> None
+        """Group the records by bucket and key with NumPy and aggregate each group at once."""
+        key_ids = {}  # type: Dict[SpanAggrKey, int]
+        ids = numpy.fromiter(
+            (key_ids.setdefault(key, len(key_ids)) for key in keys), dtype=numpy.int64, count=len(keys)
+        )
+        unique_keys = list(key_ids)
+
+        ends_ = numpy.frombuffer(ends, dtype=numpy.int64)
+        durations_ = numpy.frombuffer(durations, dtype=numpy.int64)
+        flags_ = numpy.frombuffer(flags, dtype=numpy.uint8)
+        bucket_times = ends_ - (ends_ % self._bucket_size_ns)
+
+        order = numpy.lexsort((ids, bucket_times))
+        bucket_times = bucket_times[order]
+        ids = ids[order]
+        durations_ = durations_[order]
+        flags_ = flags_[order]
+
+        boundaries = numpy.flatnonzero((numpy.diff(bucket_times) != 0) | (numpy.diff(ids) != 0)) + 1
+        starts = numpy.concatenate(([0], boundaries)).tolist()
+        stops = numpy.concatenate((boundaries, [len(order)])).tolist()
+        for i, j in zip(starts, stops):
+            group_durations = durations_[i:j]
+            errors = (flags_[i:j] & _FLAG_ERROR) != 0
+            stats = self._buckets[int(bucket_times[i])][unique_keys[ids[i]]]
+            stats.hits += j - i
+            stats.duration += int(group_durations.sum())
+            stats.top_level_hits += int(numpy.count_nonzero(flags_[i:j] & _FLAG_TOP_LEVEL))
+            stats.errors += int(numpy.count_nonzero(errors))
+            stats.err_distribution.extend(group_durations[errors].tolist())
+            stats.ok_distribution.extend(group_durations[~errors].tolist())
 
     def _serialize_buckets(self):
         # type: () -> List[Dict]
@@ -174,8 +446,8 @@ class SpanStatsProcessorV06(PeriodicService, SpanProcessor):
                     "TopLevelHits": stat_aggr.top_level_hits,
                     "Duration": stat_aggr.duration,
                     "Errors": stat_aggr.errors,
-                    "OkSummary": DDSketchProto.to_proto(stat_aggr.ok_distribution).SerializeToString(),
-                    "ErrorSummary": DDSketchProto.to_proto(stat_aggr.err_distribution).SerializeToString(),
+                    "OkSummary": DDSketchProto.to_proto(stat_aggr.ok_distribution.to_sketch()).SerializeToString(),
+                    "ErrorSummary": DDSketchProto.to_proto(stat_aggr.err_distribution.to_sketch()).SerializeToString(),
                 }
                 if service:
                     serialized_bucket["Service"] = compat.ensure_text(service)
@@ -194,6 +466,9 @@ class SpanStatsProcessorV06(PeriodicService, SpanProcessor):
         for key in serialized_bucket_keys:
             del self._buckets[key]
 
+        # Only keep the keys that are still in use
+        self._keys = {key: key for bucket in self._buckets.values() for key in bucket}
+
         return serialized_buckets
 
     def _flush_stats(self, payload):
@@ -227,6 +502,8 @@ class SpanStatsProcessorV06(PeriodicService, SpanProcessor):
         # type: (...) -> None
 
         with self._lock:
+            if self._batched:
+                self._aggregate_batches()
             serialized_stats = self._serialize_buckets()
 
         if not serialized_stats:
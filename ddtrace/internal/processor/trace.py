@@ -1,7 +1,9 @@
 import abc
 from collections import defaultdict
+from functools import partial
 from threading import Lock
 from threading import RLock
+from threading import get_ident
 from typing import Dict  # noqa:F401
 from typing import Iterable  # noqa:F401
 from typing import List  # noqa:F401
@@ -15,6 +17,7 @@ from ddtrace.constants import BASE_SERVICE_KEY
 from ddtrace.constants import SAMPLING_PRIORITY_KEY
 from ddtrace.constants import SPAN_KIND
 from ddtrace.constants import USER_KEEP
+from ddtrace.internal import compat
 from ddtrace.internal import gitmetadata
 from ddtrace.internal import telemetry
 from ddtrace.internal.constants import HIGHER_ORDER_TRACE_ID_BITS
@@ -166,92 +169,288 @@ class SpanAggregator(SpanProcessor):
           the trace_id have finished; or
         - A minimum threshold of spans (``partial_flush_min_spans``) have been
           finished in the collection and ``partial_flush_enabled`` is True.
+
+    Open traces are partitioned by trace_id into ``num_shards`` shards, each
+    with its own lock, so that threads working on different traces do not
+    serialize on a single lock.
+
+    The memory used by traces that are never finished can be bounded with
+    ``max_traces``, ``max_spans_per_trace`` and ``max_trace_age``. When a limit
+    is exceeded, the finished spans of a trace are flushed and, if needed, the
+    trace is evicted: its unfinished spans are no longer tracked and are
+    flushed on their own when they finish.
     """
 
     @attr.s
     class _Trace(object):
         spans = attr.ib(default=attr.Factory(list))  # type: List[Span]
         num_finished = attr.ib(type=int, default=0)  # type: int
+        created = attr.ib(type=float, factory=compat.monotonic)
+
+    @attr.s
+    class _Shard(object):
+        """A partition of the aggregated traces guarded by its own lock.
+
+        Traces are assigned to a shard by their ``trace_id`` so that spans of
+        unrelated traces finishing on different threads do not contend for the
+        same lock.
+        """
+
+        traces = attr.ib(
+            factory=lambda: defaultdict(lambda: SpanAggregator._Trace()),
+            type=DefaultDict[int, "SpanAggregator._Trace"],
+            repr=False,
+        )
+        if config._span_aggregator_rlock:
+            lock = attr.ib(factory=RLock, repr=False, type=Union[RLock, Lock])
+        else:
+            lock = attr.ib(factory=Lock, repr=False, type=Union[RLock, Lock])
+        # The thread that is handing a trace chunk of the shard to the writer,
+        # with the lock held
+        writing_thread = attr.ib(default=None, type=Optional[int], repr=False)
+        # Tracks the number of spans created and tags each count with the api that was used
+        # ex: otel api, opentracing api, datadog api
+        span_metrics = attr.ib(
+            factory=lambda: {
+                "spans_created": defaultdict(int),
+                "spans_finished": defaultdict(int),
+                "traces_evicted": defaultdict(int),
+                "spans_evicted": defaultdict(int),
+            },
+            type=Dict[str, DefaultDict],
+            repr=False,
+        )
+        # The ids of the unfinished spans of the evicted traces, oldest first.
+        # They are written on their own when they finish, even if a new span
+        # of their trace has been started since.
+        evicted_span_ids = attr.ib(factory=dict, type=Dict[int, None], repr=False)
 
     _partial_flush_enabled = attr.ib(type=bool)
     _partial_flush_min_spans = attr.ib(type=int)
     _trace_processors = attr.ib(type=Iterable[TraceProcessor])
     _writer = attr.ib(type=TraceWriter)
-    _traces = attr.ib(
-        factory=lambda: defaultdict(lambda: SpanAggregator._Trace()),
-        init=False,
-        type=DefaultDict[int, "_Trace"],
-        repr=False,
-    )
-    if config._span_aggregator_rlock:
-        _lock = attr.ib(init=False, factory=RLock, repr=False, type=Union[RLock, Lock])
-    else:
-        _lock = attr.ib(init=False, factory=Lock, repr=False, type=Union[RLock, Lock])
-    # Tracks the number of spans created and tags each count with the api that was used
-    # ex: otel api, opentracing api, datadog api
-    _span_metrics = attr.ib(
-        init=False,
-        factory=lambda: {
-            "spans_created": defaultdict(int),
-            "spans_finished": defaultdict(int),
-        },
-        type=Dict[str, DefaultDict],
-    )
+    _num_shards = attr.ib(type=int, default=attr.Factory(lambda: config._span_aggregator_shards))
+    _max_traces = attr.ib(type=int, default=attr.Factory(lambda: config._span_aggregator_max_traces))
+    _max_spans_per_trace = attr.ib(type=int, default=attr.Factory(lambda: config._span_aggregator_max_spans_per_trace))
+    _max_trace_age = attr.ib(type=float, default=attr.Factory(lambda: config._span_aggregator_max_trace_age))
+    _shards = attr.ib(init=False, repr=False, type=List["SpanAggregator._Shard"])
+
+    # The maximum number of evicted spans remembered by each shard
+    _MAX_EVICTED_SPANS = 1 << 14
+
+    @_num_shards.validator
+    def _check_num_shards(self, attribute, value):
+        # type: (attr.Attribute, int) -> None
+        if value < 1:
+            raise ValueError("SpanAggregator requires at least one shard, got %d" % value)
+
+    @_shards.default
+    def _default_shards(self):
+        # type: () -> List[SpanAggregator._Shard]
+        return [self._Shard() for _ in range(self._num_shards)]
+
+    def _shard(self, trace_id):
+        # type: (int) -> SpanAggregator._Shard
+        # DEV: trace ids are random so the lower bits are evenly distributed.
+        return self._shards[trace_id % self._num_shards]
 
     def on_span_start(self, span):
         # type: (Span) -> None
-        with self._lock:
-            trace = self._traces[span.trace_id]
+        shard = self._shard(span.trace_id)
+        with shard.lock:
+            if self._max_traces or self._max_trace_age:
+                self._evict_traces(shard, span.trace_id)
+            trace = shard.traces[span.trace_id]
             trace.spans.append(span)
-            self._span_metrics["spans_created"][span._span_api] += 1
-            self._queue_span_count_metrics("spans_created", "integration_name")
+            if self._max_spans_per_trace and len(trace.spans) > self._max_spans_per_trace:
+                self._limit_trace_spans(shard, span.trace_id, trace)
+            shard.span_metrics["spans_created"][span._span_api] += 1
+            self._queue_span_count_metrics(shard, "spans_created", "integration_name")
+
+    def _evict_traces(self, shard, trace_id):
+        # type: (SpanAggregator._Shard, int) -> None
+        """Evict the traces of the shard that are too old, and the oldest ones
+        to make room for the trace of the starting span if it is new.
+        """
+        traces = shard.traces
+        if self._max_trace_age:
+            expiry = compat.monotonic() - self._max_trace_age
+            # DEV: the traces are ordered by creation time
+            while traces:
+                oldest_id = next(iter(traces))
+                if traces[oldest_id].created > expiry:
+                    break
+                self._evict(shard, oldest_id, "max_trace_age")
+        if self._max_traces and trace_id not in traces:
+            max_shard_traces = -(-self._max_traces // self._num_shards)
+            while len(traces) >= max_shard_traces:
+                self._evict(shard, next(iter(traces)), "max_traces")
+
+    def _limit_trace_spans(self, shard, trace_id, trace):
+        # type: (SpanAggregator._Shard, int, SpanAggregator._Trace) -> None
+        """Flush the finished spans of a trace that has too many spans, evicting
+        it if its unfinished spans alone exceed the limit.
+        """
+        if len(trace.spans) - trace.num_finished > self._max_spans_per_trace:
+            self._evict(shard, trace_id, "max_spans_per_trace")
+            return
+
+        finished = [s for s in trace.spans if s.finished]
+        trace.spans = [s for s in trace.spans if not s.finished]
+        trace.num_finished = 0
+        log.debug("Partially flushing %d spans for trace %d with too many spans", len(finished), trace_id)
+        finished[0].set_metric("_dd.py.partial_flush", len(finished))
+        self._write(shard, finished)
+
+    def _evict(self, shard, trace_id, reason):
+        # type: (SpanAggregator._Shard, int, str) -> None
+        """Flush the finished spans of a trace and stop tracking its unfinished spans."""
+        trace = shard.traces.pop(trace_id)
+        finished = []
+        evicted_span_ids = shard.evicted_span_ids
+        for s in trace.spans:
+            if s.finished:
+                finished.append(s)
+            else:
+                evicted_span_ids[s.span_id] = None
+        num_unfinished = len(trace.spans) - len(finished)
+        while len(evicted_span_ids) > self._MAX_EVICTED_SPANS:
+            del evicted_span_ids[next(iter(evicted_span_ids))]
+        log.debug(
+            "Evicting trace %d (%s): flushing %d finished spans, %d unfinished spans are no longer tracked",
+            trace_id,
+            reason,
+            len(finished),
+            num_unfinished,
+        )
+
+        shard.span_metrics["traces_evicted"][reason] += 1
+        self._queue_span_count_metrics(shard, "traces_evicted", "reason", None)
+        if num_unfinished:
+            shard.span_metrics["spans_evicted"][reason] += num_unfinished
+            self._queue_span_count_metrics(shard, "spans_evicted", "reason", None)
+
+        if finished:
+            finished[0].set_metric("_dd.py.partial_flush", len(finished))
+            self._write(shard, finished)
+
+    def _write(self, shard, spans):
+        # type: (SpanAggregator._Shard, List[Span]) -> None
+        if isinstance(self._writer, TraceWriter):
+            # The writer decides whether the trace processors run
+            # here or on its background thread.
+            shard.writing_thread = get_ident()
+            try:
+                self._writer.write_unprocessed(spans, partial(self._process_shard_trace, shard))
+            finally:
+                shard.writing_thread = None
+            return
+
+        processed = self._process_trace(spans)
+        if processed is None:
+            return
+        self._queue_span_count_metrics(shard, "spans_finished", "integration_name")
+        self._writer.write(processed)
+
+    def _process_shard_trace(self, shard, spans):
+        # type: (SpanAggregator._Shard, List[Span]) -> Optional[List[Span]]
+        """Apply the trace processors to a trace chunk of the given shard.
+
+        The finished spans are only reported once the trace chunk has been
+        kept by the trace processors.
+        """
+        processed = self._process_trace(spans)
+        if processed is not None:
+            if shard.writing_thread == get_ident():
+                # Processed inline by _write, which holds the lock of the shard
+                self._queue_span_count_metrics(shard, "spans_finished", "integration_name")
+            else:
+                with shard.lock:
+                    self._queue_span_count_metrics(shard, "spans_finished", "integration_name")
+        return processed
 
     def on_span_finish(self, span):
         # type: (Span) -> None
-        with self._lock:
-            self._span_metrics["spans_finished"][span._span_api] += 1
-            trace = self._traces[span.trace_id]
-            trace.num_finished += 1
-            should_partial_flush = self._partial_flush_enabled and trace.num_finished >= self._partial_flush_min_spans
-            if trace.num_finished == len(trace.spans) or should_partial_flush:
-                trace_spans = trace.spans
-                trace.spans = []
-                if trace.num_finished < len(trace_spans):
-                    finished = []
-                    for s in trace_spans:
-                        if s.finished:
-                            finished.append(s)
-                        else:
-                            trace.spans.append(s)
-                else:
-                    finished = trace_spans
-
-                num_finished = len(finished)
-
-                if should_partial_flush:
-                    log.debug("Partially flushing %d spans for trace %d", num_finished, span.trace_id)
-                    finished[0].set_metric("_dd.py.partial_flush", num_finished)
-
-                trace.num_finished -= num_finished
-
-                if len(trace.spans) == 0:
-                    del self._traces[span.trace_id]
-
-                spans = finished  # type: Optional[List[Span]]
-                for tp in self._trace_processors:
-                    try:
-                        if spans is None:
-                            return
-                        spans = tp.process_trace(spans)
-                    except Exception:
-                        log.error("error applying processor %r", tp, exc_info=True)
-
-                self._queue_span_count_metrics("spans_finished", "integration_name")
-                self._writer.write(spans)
-                return
-
-            log.debug("trace %d has %d spans, %d finished", span.trace_id, len(trace.spans), trace.num_finished)
-            return None
+        shard = self._shard(span.trace_id)
+        with shard.lock:
+            self._finish_span(shard, span)
+
+    def on_spans_finish(self, spans):
+        # type: (List[Span]) -> None
+        if self._num_shards == 1:
+            shard = self._shards[0]
+            with shard.lock:
+                for span in spans:
+                    self._finish_span(shard, span)
+            return
+
+        shard_spans = defaultdict(list)  # type: DefaultDict[int, List[Span]]
+        for span in spans:
+            shard_spans[span.trace_id % self._num_shards].append(span)
+        for index, batch in shard_spans.items():
+            shard = self._shards[index]
+            with shard.lock:
+                for span in batch:
+                    self._finish_span(shard, span)
+
+    def _finish_span(self, shard, span):
+        # type: (SpanAggregator._Shard, Span) -> None
+        """Record a finished span, writing its trace if it is complete.
+
+        Must be called with the lock of the shard of the span held.
+        """
+        shard.span_metrics["spans_finished"][span._span_api] += 1
+        if shard.evicted_span_ids and shard.evicted_span_ids.pop(span.span_id, 0) is None:
+            # The trace of the span has been evicted
+            self._write(shard, [span])
+            return
+        trace = shard.traces.get(span.trace_id)
+        if trace is None:
+            # The span was started before this aggregator was created
+            self._write(shard, [span])
+            return
+        trace.num_finished += 1
+        should_partial_flush = self._partial_flush_enabled and trace.num_finished >= self._partial_flush_min_spans
+        if trace.num_finished == len(trace.spans) or should_partial_flush:
+            trace_spans = trace.spans
+            trace.spans = []
+            if trace.num_finished < len(trace_spans):
+                finished = []
+                for s in trace_spans:
+                    if s.finished:
+                        finished.append(s)
+                    else:
+                        trace.spans.append(s)
+            else:
+                finished = trace_spans
+
+            num_finished = len(finished)
+
+            if should_partial_flush:
+                log.debug("Partially flushing %d spans for trace %d", num_finished, span.trace_id)
+                finished[0].set_metric("_dd.py.partial_flush", num_finished)
+
+            trace.num_finished -= num_finished
+
+            if len(trace.spans) == 0:
+                del shard.traces[span.trace_id]
+
+            self._write(shard, finished)
+            return
+
+        log.debug("trace %d has %d spans, %d finished", span.trace_id, len(trace.spans), trace.num_finished)
+
+    def _process_trace(self, spans):
+        # type: (Optional[List[Span]]) -> Optional[List[Span]]
+        """Apply the trace processors to a finished trace chunk."""
+        for tp in self._trace_processors:
+            try:
+                if spans is None:
+                    return None
+                spans = tp.process_trace(spans)
+            except Exception:
+                log.error("error applying processor %r", tp, exc_info=True)
+        return spans
 
     def shutdown(self, timeout):
         # type: (Optional[float]) -> None
@@ -263,19 +462,23 @@ class SpanAggregator(SpanProcessor):
             before exiting or :obj:`None` to block until flushing has successfully completed (default: :obj:`None`)
         :type timeout: :obj:`int` | :obj:`float` | :obj:`None`
         """
-        if self._span_metrics["spans_created"] or self._span_metrics["spans_finished"]:
+        if any(s.span_metrics["spans_created"] or s.span_metrics["spans_finished"] for s in self._shards):
             if config._telemetry_enabled:
                 # Telemetry writer is disabled when a process shutsdown. This is to support py3.12.
                 # Here we submit the remanining span creation metrics without restarting the periodic thread.
                 # Note - Due to how atexit hooks are registered the telemetry writer is shutdown before the tracer.
                 telemetry.telemetry_writer._is_periodic = False
                 telemetry.telemetry_writer._enabled = True
-                # on_span_start queue span created counts in batches of 100. This ensures all remaining counts are sent
-                # before the tracer is shutdown.
-                self._queue_span_count_metrics("spans_created", "integration_name", None)
-                # on_span_finish(...) queues span finish metrics in batches of 100.
-                # This ensures all remaining counts are sent before the tracer is shutdown.
-                self._queue_span_count_metrics("spans_finished", "integration_name", None)
+                for shard in self._shards:
+                    with shard.lock:
+                        # on_span_start queue span created counts in batches of 100. This ensures all remaining
+                        # counts are sent before the tracer is shutdown.
+                        self._queue_span_count_metrics(shard, "spans_created", "integration_name", None)
+                        # on_span_finish(...) queues span finish metrics in batches of 100.
+                        # This ensures all remaining counts are sent before the tracer is shutdown.
+                        self._queue_span_count_metrics(shard, "spans_finished", "integration_name", None)
+                        self._queue_span_count_metrics(shard, "traces_evicted", "reason", None)
+                        self._queue_span_count_metrics(shard, "spans_evicted", "reason", None)
                 telemetry.telemetry_writer.periodic(True)
                 # Disable the telemetry writer so no events/metrics/logs are queued during process shutdown
                 telemetry.telemetry_writer.disable()
@@ -286,17 +489,18 @@ class SpanAggregator(SpanProcessor):
             # It's possible the writer never got started in the first place :(
             pass
 
-    def _queue_span_count_metrics(self, metric_name, tag_name, min_count=100):
-        # type: (str, str, Optional[int]) -> None
+    def _queue_span_count_metrics(self, shard, metric_name, tag_name, min_count=100):
+        # type: (SpanAggregator._Shard, str, str, Optional[int]) -> None
         """Queues a telemetry count metric for span created and span finished"""
         # perf: telemetry_metrics_writer.add_count_metric(...) is an expensive operation.
         # We should avoid calling this method on every invocation of span finish and span start.
-        if min_count is None or sum(self._span_metrics[metric_name].values()) >= min_count:
-            for tag_value, count in self._span_metrics[metric_name].items():
+        span_metrics = shard.span_metrics
+        if min_count is None or sum(span_metrics[metric_name].values()) >= min_count:
+            for tag_value, count in span_metrics[metric_name].items():
                 telemetry.telemetry_writer.add_count_metric(
                     TELEMETRY_NAMESPACE_TAG_TRACER, metric_name, count, tags=((tag_name, tag_value),)
                 )
-            self._span_metrics[metric_name] = defaultdict(int)
+            span_metrics[metric_name] = defaultdict(int)
 
 
 @attr.s
@@ -321,15 +525,29 @@ class SpanSamplingProcessor(SpanProcessor):
         # type: (Span) -> None
         # only sample if the span isn't already going to be sampled by trace sampler
         if span.context.sampling_priority is not None and span.context.sampling_priority <= 0:
-            for rule in self.rules:
-                if rule.match(span):
-                    rule.sample(span)
-                    # If stats computation is enabled, we won't send all spans to the agent.
-                    # In order to ensure that the agent does not update priority sampling rates
-                    # due to single spans sampling, we set all of these spans to manual keep.
-                    if config._trace_compute_stats:
-                        span.set_metric(SAMPLING_PRIORITY_KEY, USER_KEEP)
-                    break
+            self._sample(span)
+
+    def on_spans_finish(self, spans):
+        # type: (List[Span]) -> None
+        if not self.rules:
+            return
+
+        for span in spans:
+            priority = span.context.sampling_priority
+            if priority is not None and priority <= 0:
+                self._sample(span)
+
+    def _sample(self, span):
+        # type: (Span) -> None
+        for rule in self.rules:
+            if rule.match(span):
+                rule.sample(span)
+                # If stats computation is enabled, we won't send all spans to the agent.
+                # In order to ensure that the agent does not update priority sampling rates
+                # due to single spans sampling, we set all of these spans to manual keep.
+                if config._trace_compute_stats:
+                    span.set_metric(SAMPLING_PRIORITY_KEY, USER_KEEP)
+                break
 
 
 class PeerServiceProcessor(TraceProcessor):
@@ -173,6 +173,47 @@ class RateLimiter(object):
     __str__ = __repr__
 
 
+class SamplingBudget(object):
+    """A lock-free token bucket allowing up to ``rate_limit`` calls per second.
+
+    Unlike :class:`RateLimiter`, no lock is taken and no statistics are kept, so
+    that the budget can be checked on every call of hot functions. Concurrent
+    calls may race to update the budget, which makes the limit approximate.
+    """
+
+    __slots__ = ("rate_limit", "max_tokens", "tokens", "last_update")
+
+    def __init__(self, rate_limit):
+        # type: (float) -> None
+        """
+        :param rate_limit: The maximum number of calls allowed per second. No
+            calls are allowed if it is 0. A budget of at least one call is kept
+            for rates lower than one call per second.
+        :type rate_limit: :obj:`float`
+        """
+        self.rate_limit = rate_limit
+        self.max_tokens = max(rate_limit, 1.0) if rate_limit > 0 else 0.0
+        self.tokens = self.max_tokens  # type: float
+        self.last_update = compat.monotonic()
+
+    def is_allowed(self):
+        # type: () -> bool
+        """Return whether the current call is allowed, consuming a token if it is."""
+        now = compat.monotonic()
+        tokens = self.tokens + (now - self.last_update) * self.rate_limit
+        if tokens > self.max_tokens:
+            tokens = self.max_tokens
+        self.last_update = now
+        if tokens >= 1.0:
+            self.tokens = tokens - 1.0
+            return True
+        self.tokens = tokens
+        return False
+
+    def __repr__(self):
+        return "{}(rate_limit={!r}, tokens={!r})".format(self.__class__.__name__, self.rate_limit, self.tokens)
+
+
 class RateLimitExceeded(Exception):
     pass
 
@@ -1,3 +1,4 @@
+from collections import OrderedDict
 import json
 import re
 from typing import TYPE_CHECKING  # noqa:F401
@@ -18,11 +19,13 @@ from ddtrace.constants import SAMPLING_AGENT_DECISION
 from ddtrace.constants import SAMPLING_LIMIT_DECISION
 from ddtrace.constants import SAMPLING_RULE_DECISION
 from ddtrace.constants import USER_REJECT
+from ddtrace.internal.compat import pattern_type
 from ddtrace.internal.constants import _CATEGORY_TO_PRIORITIES
 from ddtrace.internal.constants import _KEEP_PRIORITY_INDEX
 from ddtrace.internal.constants import _REJECT_PRIORITY_INDEX
 from ddtrace.internal.constants import SAMPLING_DECISION_TRACE_TAG_KEY
 from ddtrace.internal.glob_matching import GlobMatcher
+from ddtrace.internal.glob_matching import glob_to_regex
 from ddtrace.internal.logger import get_logger
 from ddtrace.sampling_rule import SamplingRule  # noqa:F401
 from ddtrace.settings import _config as config
@@ -43,6 +46,7 @@ if TYPE_CHECKING:  # pragma: no cover
     from typing import Dict  # noqa:F401
     from typing import List  # noqa:F401
     from typing import Text  # noqa:F401
+    from typing import Tuple  # noqa:F401
 
     from ddtrace.context import Context  # noqa:F401
     from ddtrace.span import Span  # noqa:F401
@@ -308,6 +312,213 @@ def _set_priority(span, priority):
     span.sampled = priority > 0  # Positive priorities mean it was kept
 
 
+# Maximum number of sampling decisions cached by a SamplingRuleMatcher
+SAMPLING_RULE_MATCHER_CACHE_SIZE = 4096
+
+
+# The methods that a subclass of SamplingRule can override to change how spans are matched
+_SAMPLING_RULE_MATCH_METHODS = ("matches", "glob_matches", "tag_match", "_matches", "_pattern_matches")
+
+
+class _FieldIndex(object):
+    """Index of the rules by the exact value they expect for a span field.
+
+    ``lookup`` returns the bitset of the rules that can match a value: those
+    that expect the value exactly, and those that do not expect an exact value.
+    """
+
+    __slots__ = ("exact", "other")
+
+    def __init__(self):
+        # type: () -> None
+        self.exact = {}  # type: Dict[Any, int]
+        self.other = 0
+
+    def lookup(self, value):
+        # type: (Any) -> int
+        try:
+            return self.exact.get(value, 0) | self.other
+        except TypeError:
+            # Unhashable values cannot be equal to any of the indexed ones
+            return self.other
+
+
+class _CompiledRule(object):
+    __slots__ = ("rule", "complex_fields", "tag_mask", "tag_regexes")
+
+    def __init__(self, rule, complex_fields, tag_mask, tag_regexes):
+        # type: (SamplingRule, List[Tuple[int, Any]], int, List[Tuple[str, re.Pattern]]) -> None
+        self.rule = rule
+        # The fields matched with a regular expression or a function
+        self.complex_fields = complex_fields
+        # The bitset of the tag keys the rule requires
+        self.tag_mask = tag_mask
+        self.tag_regexes = tag_regexes
+
+
+class SamplingRuleMatcher(object):
+    """Find the first sampling rule of a list of rules that matches a span.
+
+    The rules are compiled into an index of the exact service, name and
+    resource values they expect and of the tag keys they require, so that only
+    the rules that can match a span are evaluated. Tag value globs are compiled
+    to regular expressions. The index of the matching rule is cached, in a
+    bounded LRU cache, by the service, name, resource and values of the tags
+    the rules look at.
+
+    Subclasses of ``SamplingRule`` that override how spans are matched are
+    evaluated for every span with ``SamplingRule.matches``, and disable the
+    cache.
+    """
+
+    def __init__(self, rules, cache_size=SAMPLING_RULE_MATCHER_CACHE_SIZE):
+        # type: (List[SamplingRule], int) -> None
+        self.rules = rules
+        self._size = len(rules)
+        self._cache_size = cache_size
+        self._cache = OrderedDict()  # type: OrderedDict[Tuple, int]
+        self._indexes = (_FieldIndex(), _FieldIndex(), _FieldIndex())
+        # The bit of each tag key in the tag masks, and the rules that require it
+        self._tag_bits = {}  # type: Dict[str, int]
+        self._tag_rules = {}  # type: Dict[str, int]
+        # The rules that do not require any tag
+        self._untagged = 0
+        self._compiled = []  # type: List[Optional[_CompiledRule]]
+        self._opaque = 0
+
+        for i, rule in enumerate(rules):
+            bit = 1 << i
+            if not self._is_compilable(rule):
+                self._opaque |= bit
+                self._untagged |= bit
+                for index in self._indexes:
+                    index.other |= bit
+                self._compiled.append(None)
+                continue
+
+            complex_fields = []
+            for field, (index, pattern) in enumerate(zip(self._indexes, (rule.service, rule.name, rule.resource))):
+                if pattern is SamplingRule.NO_RULE:
+                    index.other |= bit
+                    continue
+                if not callable(pattern) and not isinstance(pattern, pattern_type):
+                    try:
+                        index.exact[pattern] = index.exact.get(pattern, 0) | bit
+                        continue
+                    except TypeError:
+                        # Unhashable values are compared for every span
+                        pass
+                index.other |= bit
+                complex_fields.append((field, pattern))
+
+            tag_mask = 0
+            tag_regexes = []
+            for key, matcher in rule._tag_value_matchers.items():
+                if key not in self._tag_bits:
+                    self._tag_bits[key] = 1 << len(self._tag_bits)
+                tag_mask |= self._tag_bits[key]
+                self._tag_rules[key] = self._tag_rules.get(key, 0) | bit
+                tag_regexes.append((key, glob_to_regex(matcher.pattern)))
+            if not tag_mask:
+                self._untagged |= bit
+
+            self._compiled.append(_CompiledRule(rule, complex_fields, tag_mask, tag_regexes))
+
+    @staticmethod
+    def _is_compilable(rule):
+        # type: (SamplingRule) -> bool
+        """Return whether the rule matches spans the way ``SamplingRule`` does."""
+        for cls in type(rule).__mro__:
+            if cls is SamplingRule:
+                return True
+            if any(name in vars(cls) for name in _SAMPLING_RULE_MATCH_METHODS):
+                return False
+        return False
+
+    def compiled_for(self, rules):
+        # type: (List[SamplingRule]) -> bool
+        """Return whether the matcher was compiled for the given list of rules."""
+        return rules is self.rules and len(rules) == self._size
+
+    def match(self, span):
+        # type: (Span) -> Optional[SamplingRule]
+        """Return the first rule that matches the span, if any."""
+        if not self._compiled:
+            return None
+
+        values = (span.service, span.name, span.resource)
+        # The values of the tags the rules look at
+        tags = {}  # type: Dict[str, str]
+        if self._tag_bits:
+            tag_bits = self._tag_bits
+            for key, value in span.get_tags().items():
+                if key in tag_bits and value is not None:
+                    tags[key] = value
+
+        if self._opaque:
+            i = self._match(span, values, tags)
+            return self.rules[i] if i >= 0 else None
+
+        cache = self._cache
+        key = values + tuple(sorted(tags.items())) if tags else values
+        try:
+            i = cache[key]
+        except TypeError:
+            # Unhashable values cannot be cached
+            i = self._match(span, values, tags)
+        except KeyError:
+            i = cache[key] = self._match(span, values, tags)
+            # DEV: spans can be sampled concurrently, tolerate keys evicted
+            # by other threads.
+            while len(cache) > self._cache_size:
+                try:
+                    cache.popitem(last=False)
+                except KeyError:
+                    break
+        else:
+            try:
+                cache.move_to_end(key)
+            except KeyError:
+                pass
+        return self.rules[i] if i >= 0 else None
+
+    def _match(self, span, values, tags):
+        # type: (Span, Tuple[Any, Any, Any], Dict[str, str]) -> int
+        """Return the index of the first rule that matches the span, or -1."""
+        service_index, name_index, resource_index = self._indexes
+        service, name, resource = values
+        candidates = service_index.lookup(service) & name_index.lookup(name) & resource_index.lookup(resource)
+
+        tag_mask = 0
+        tagged = self._untagged
+        for key in tags:
+            tag_mask |= self._tag_bits[key]
+            tagged |= self._tag_rules[key]
+        candidates &= tagged
+
+        while candidates:
+            lowest = candidates & -candidates
+            candidates ^= lowest
+            i = lowest.bit_length() - 1
+
+            compiled = self._compiled[i]
+            if compiled is None:
+                if self.rules[i].matches(span):
+                    return i
+                continue
+
+            if compiled.tag_mask & tag_mask != compiled.tag_mask:
+                continue
+            rule = compiled.rule
+            if not all(rule._pattern_matches(values[field], pattern) for field, pattern in compiled.complex_fields):
+                continue
+            if not all(regex.match(tags[key]) for key, regex in compiled.tag_regexes):
+                continue
+            return i
+
+        return -1
+
+
 def _get_highest_precedence_rule_matching(span, rules):
     # type: (Span, List[SamplingRule]) -> Optional[SamplingRule]
     if not rules:
@@ -0,0 +1,102 @@
+import threading
+from typing import TYPE_CHECKING  # noqa:F401
+import zlib
+
+from ..logger import get_logger
+
+
+if TYPE_CHECKING:  # pragma: no cover
+    from typing import Optional  # noqa:F401
+    from typing import Union  # noqa:F401
+
+
+log = get_logger(__name__)
+
+
+class PayloadCompressor(object):
+    """Compress payloads for the ``Content-Encoding`` given by ``encoding``."""
+
+    encoding = ""  # type: str
+
+    def __init__(self, level=None):
+        # type: (Optional[int]) -> None
+        self.level = level
+
+    def compress(self, payload):
+        # type: (Union[bytes, memoryview]) -> bytes
+        raise NotImplementedError()
+
+
+class GzipCompressor(PayloadCompressor):
+    encoding = "gzip"
+
+    # Favour speed over ratio: encoded traces compress well even at the lowest levels
+    DEFAULT_LEVEL = 1
+
+    def compress(self, payload):
+        # type: (Union[bytes, memoryview]) -> bytes
+        # DEV: compress the buffer in place, without copying it to bytes first.
+        compressor = zlib.compressobj(
+            self.DEFAULT_LEVEL if self.level is None else self.level,
+            zlib.DEFLATED,
+            16 + zlib.MAX_WBITS,  # gzip container
+        )
+        return compressor.compress(payload) + compressor.flush()
+
+
+class ZstdCompressor(PayloadCompressor):
+    encoding = "zstd"
+
+    DEFAULT_LEVEL = 3
+
+    def __init__(self, level=None):
+        # type: (Optional[int]) -> None
+        import zstandard
+
+        super(ZstdCompressor, self).__init__(level)
+        self._zstandard = zstandard
+        # zstandard compressors cannot be used by several threads at once and
+        # payloads can be compressed concurrently by the upload threads.
+        self._local = threading.local()
+
+    def compress(self, payload):
+        # type: (Union[bytes, memoryview]) -> bytes
+        try:
+            compressor = self._local.compressor
+        except AttributeError:
+            compressor = self._local.compressor = self._zstandard.ZstdCompressor(
+                level=self.DEFAULT_LEVEL if self.level is None else self.level
+            )
+        return compressor.compress(payload)
+
+
+COMPRESSORS = {
+    "gzip": GzipCompressor,
+    "zstd": ZstdCompressor,
+}
+
+
+def get_compressor(name, level=None):
+    # type: (Optional[str], Optional[int]) -> Optional[PayloadCompressor]
+    """Return the compressor for the given algorithm, or ``None`` to send payloads uncompressed.
+
+    The ``zstd`` algorithm requires the ``zstandard`` package. The standard
+    library ``gzip`` algorithm is used instead if it is not installed.
+    """
+    if not name:
+        return None
+
+    try:
+        compressor_class = COMPRESSORS[name.lower()]
+    except KeyError:
+        raise ValueError(
+            "Unsupported compression algorithm: '%s'. The supported algorithms are: %s"
+            % (name, ", ".join(sorted(COMPRESSORS.keys())))
+        )
+
+    try:
+        return compressor_class(level)
+    except ImportError:
+        log.warning("%s compression is not available, using gzip compression instead", name)
+        # DEV: compression levels are specific to each algorithm
+        return GzipCompressor()
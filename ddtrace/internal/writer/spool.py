@@ -0,0 +1,315 @@
+import mmap
+import os
+import struct
+import threading
+from typing import TYPE_CHECKING  # noqa:F401
+
+from ..compat import time_ns
+from ..logger import get_logger
+
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    # Segment files can only be shared between processes on platforms that
+    # support advisory file locks.
+    fcntl = None  # type: ignore[assignment]
+
+
+if TYPE_CHECKING:  # pragma: no cover
+    from typing import Callable  # noqa:F401
+    from typing import Deque  # noqa:F401
+    from typing import List  # noqa:F401
+    from typing import Optional  # noqa:F401
+    from typing import Union  # noqa:F401
+
+
+log = get_logger(__name__)
+
+# Record header: payload length, number of traces, creation timestamp (seconds),
+# length of the endpoint the payload is for and flags. The header is written
+# after the endpoint and the payload so that a record is only visible once it
+# is complete. A zero length marks the end of the records of a segment.
+_HEADER = struct.Struct("<IIdHB")
+# The flags are the last byte of the header and are updated in place
+_FLAGS_OFFSET = _HEADER.size - 1
+# Set once the payload of the record has been consumed
+_FLAG_CONSUMED = 0x01
+_SEGMENT_SUFFIX = ".seg"
+
+
+class SpooledPayload(object):
+    """A payload stored in a segment file of the spool."""
+
+    __slots__ = ("endpoint", "n_traces", "timestamp", "size", "_segment", "_header", "_offset")
+
+    def __init__(self, endpoint, n_traces, timestamp, size, segment, header, offset):
+        # type: (str, int, float, int, _Segment, int, int) -> None
+        self.endpoint = endpoint
+        self.n_traces = n_traces
+        self.timestamp = timestamp
+        self.size = size
+        self._segment = segment
+        self._header = header
+        self._offset = offset
+
+    def read(self):
+        # type: () -> bytes
+        """Read the payload from the segment file."""
+        return self._segment.read(self._offset, self.size)
+
+
+class _Segment(object):
+    """A memory-mapped, fixed-capacity file that payloads are appended to."""
+
+    def __init__(self, path, capacity=None):
+        # type: (str, Optional[int]) -> None
+        """Open the segment file at ``path``.
+
+        A new file of ``capacity`` bytes is created if ``capacity`` is given,
+        otherwise the existing file is opened. Raises ``BlockingIOError`` if the
+        file is in use by another spool.
+        """
+        self.path = path
+        self.pending = 0
+        self._file = open(path, "w+b" if capacity is not None else "r+b")
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            if capacity is not None:
+                self._file.truncate(capacity)
+            self.capacity = os.fstat(self._file.fileno()).st_size
+            self._mmap = mmap.mmap(self._file.fileno(), self.capacity)
+        except Exception:
+            self._file.close()
+            raise
+        self.length = 0
+
+    def records(self):
+        # type: () -> List[SpooledPayload]
+        """Parse the records stored in the segment that were not consumed yet."""
+        records = []
+        offset = 0
+        while offset + _HEADER.size <= self.capacity:
+            size, n_traces, timestamp, endpoint_size, flags = _HEADER.unpack_from(self._mmap, offset)
+            if size == 0:
+                break
+            start = offset + _HEADER.size
+            end = start + endpoint_size + size
+            if end > self.capacity:
+                log.warning("spool segment %s is corrupted, ignoring records past offset %d", self.path, offset)
+                break
+            if not flags & _FLAG_CONSUMED:
+                endpoint = self._mmap[start : start + endpoint_size].decode("utf-8")
+                records.append(SpooledPayload(endpoint, n_traces, timestamp, size, self, offset, start + endpoint_size))
+            offset = end
+        self.length = offset
+        self.pending = len(records)
+        return records
+
+    def fits(self, size):
+        # type: (int) -> bool
+        return self.length + size <= self.capacity
+
+    def append(self, endpoint, payload, n_traces, timestamp):
+        # type: (bytes, Union[bytes, memoryview], int, float) -> SpooledPayload
+        start = self.length + _HEADER.size
+        offset = start + len(endpoint)
+        size = len(payload)
+        self._mmap[start:offset] = endpoint
+        self._mmap[offset : offset + size] = payload
+        header = self.length
+        _HEADER.pack_into(self._mmap, header, size, n_traces, timestamp, len(endpoint), 0)
+        self.length = offset + size
+        self.pending += 1
+        return SpooledPayload(endpoint.decode("utf-8"), n_traces, timestamp, size, self, header, offset)
+
+    def consume(self, record):
+        # type: (SpooledPayload) -> None
+        """Mark the record as consumed so that it is skipped once the segment is reopened."""
+        flags = record._header + _FLAGS_OFFSET
+        self._mmap[flags] |= _FLAG_CONSUMED
+        self.pending -= 1
+
+    def read(self, offset, size):
+        # type: (int, int) -> bytes
+        return self._mmap[offset : offset + size]
+
+    def close(self):
+        # type: () -> None
+        try:
+            self._mmap.flush()
+            self._mmap.close()
+        finally:
+            # Closing the file releases the lock for other spools
+            self._file.close()
+
+    def remove(self):
+        # type: () -> None
+        try:
+            os.remove(self.path)
+        except OSError:
+            log.debug("failed to remove spool segment %s", self.path, exc_info=True)
+        finally:
+            self.close()
+
+
+class PayloadSpool(object):
+    """Bounded on-disk spool of encoded payloads.
+
+    Payloads are appended to memory-mapped segment files in ``directory`` and
+    are read back in the order they were appended. Segments are deleted once
+    all their payloads have been consumed. The oldest segments are evicted when
+    the spool exceeds ``max_size`` bytes and payloads older than ``max_age``
+    seconds are evicted when they are read.
+
+    Segments left over by processes that have exited are taken over when the
+    spool is created, on platforms that support advisory file locks.
+    """
+
+    def __init__(
+        self,
+        directory,  # type: str
+        max_size,  # type: int
+        segment_size,  # type: int
+        max_age,  # type: float
+        on_evict=None,  # type: Optional[Callable[[SpooledPayload, str], None]]
+    ):
+        # type: (...) -> None
+        self.directory = directory
+        self.max_size = max_size
+        self.segment_size = segment_size
+        self.max_age = max_age
+        self._on_evict = on_evict
+        self._lock = threading.Lock()
+        self._segments = []  # type: List[_Segment]
+        self._records = []  # type: List[SpooledPayload]
+        self._head = 0
+        self._seq = 0
+
+        os.makedirs(directory, exist_ok=True)
+        if fcntl is not None:
+            self._adopt_segments()
+
+    def __len__(self):
+        # type: () -> int
+        with self._lock:
+            return len(self._records) - self._head
+
+    @property
+    def size(self):
+        # type: () -> int
+        """Return the number of bytes of disk space used by the spool."""
+        with self._lock:
+            return sum(segment.capacity for segment in self._segments)
+
+    def _adopt_segments(self):
+        # type: () -> None
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(_SEGMENT_SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                segment = _Segment(path)
+            except (BlockingIOError, ValueError):
+                # In use by another spool, or empty
+                continue
+            except OSError:
+                log.debug("failed to open spool segment %s", path, exc_info=True)
+                continue
+
+            records = segment.records()
+            if not records:
+                segment.remove()
+                continue
+            self._segments.append(segment)
+            self._records.extend(records)
+
+    def _new_segment(self, capacity):
+        # type: (int) -> _Segment
+        self._seq += 1
+        name = "%020d-%d-%d%s" % (time_ns(), os.getpid(), self._seq, _SEGMENT_SUFFIX)
+        segment = _Segment(os.path.join(self.directory, name), capacity)
+        self._segments.append(segment)
+        return segment
+
+    def _evict(self, record, reason):
+        # type: (SpooledPayload, str) -> None
+        if self._on_evict is not None:
+            self._on_evict(record, reason)
+
+    def _release(self, record):
+        # type: (SpooledPayload) -> None
+        segment = record._segment
+        segment.consume(record)
+        if segment.pending == 0:
+            segment.remove()
+            self._segments.remove(segment)
+        # Compact the list of records once the consumed ones dominate
+        if self._head > 64 and self._head * 2 > len(self._records):
+            del self._records[: self._head]
+            self._head = 0
+
+    def append(self, endpoint, payload, n_traces):
+        # type: (str, Union[bytes, memoryview], int) -> bool
+        """Append a payload to the spool.
+
+        Return ``False`` if the payload cannot fit in the spool.
+        """
+        endpoint_bytes = endpoint.encode("utf-8")
+        record_size = _HEADER.size + len(endpoint_bytes) + len(payload)
+        if record_size > self.max_size:
+            return False
+
+        with self._lock:
+            segment = self._segments[-1] if self._segments else None
+            if segment is None or not segment.fits(record_size):
+                capacity = max(self.segment_size, record_size)
+                # Make room for the new segment by evicting the oldest ones
+                while self._segments and sum(s.capacity for s in self._segments) + capacity > self.max_size:
+                    oldest = self._segments[0]
+                    while self._head < len(self._records) and self._records[self._head]._segment is oldest:
+                        record = self._records[self._head]
+                        self._head += 1
+                        self._evict(record, "size")
+                        self._release(record)
+                    if self._segments and self._segments[0] is oldest:
+                        # The segment has no records left to consume
+                        self._segments.pop(0)
+                        oldest.remove()
+                segment = self._new_segment(capacity)
+
+            self._records.append(segment.append(endpoint_bytes, payload, n_traces, time_ns() / 1e9))
+        return True
+
+    def peek(self):
+        # type: () -> Optional[SpooledPayload]
+        """Return the oldest payload of the spool, evicting the expired ones."""
+        with self._lock:
+            expiry = time_ns() / 1e9 - self.max_age
+            while self._head < len(self._records):
+                record = self._records[self._head]
+                if record.timestamp >= expiry:
+                    return record
+                self._head += 1
+                self._evict(record, "age")
+                self._release(record)
+        return None
+
+    def pop(self, record):
+        # type: (SpooledPayload) -> None
+        """Remove the oldest payload, as returned by ``peek``, from the spool."""
+        with self._lock:
+            if self._head < len(self._records) and self._records[self._head] is record:
+                self._head += 1
+                self._release(record)
+
+    def close(self):
+        # type: () -> None
+        """Close the segment files, keeping the pending payloads on disk."""
+        with self._lock:
+            for segment in self._segments:
+                segment.close()
+            self._segments = []
+            self._records = []
+            self._head = 0
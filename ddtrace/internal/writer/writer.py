@@ -1,6 +1,7 @@
 import abc
 import binascii
 from collections import defaultdict
+from collections import deque
 import logging
 import os
 import sys
@@ -36,6 +37,8 @@ from ..runtime import container
 from ..serverless import in_azure_function_consumption_plan
 from ..serverless import in_gcp_function
 from ..sma import SimpleMovingAverage
+from .compression import get_compressor
+from .spool import PayloadSpool
 from .writer_client import WRITER_CLIENTS
 from .writer_client import AgentWriterClientV3
 from .writer_client import AgentWriterClientV4
@@ -43,12 +46,17 @@ from .writer_client import WriterClientBase  # noqa:F401
 
 
 if TYPE_CHECKING:  # pragma: no cover
+    from concurrent.futures import Future  # noqa:F401
+    from concurrent.futures import ThreadPoolExecutor  # noqa:F401
     from typing import Callable  # noqa:F401
+    from typing import Deque  # noqa:F401
     from typing import Tuple  # noqa:F401
 
     from ddtrace import Span  # noqa:F401
 
+    from .._encoding import BufferedEncoder  # noqa:F401
     from .agent import ConnectionType  # noqa:F401
+    from .spool import SpooledPayload  # noqa:F401
 
 
 log = get_logger(__name__)
@@ -78,7 +86,21 @@ def _human_size(nbytes):
     return "%s%s" % (f, suffixes[i])
 
 
+def _buffer_fill_ratio(encoder):
+    # type: (BufferedEncoder) -> Optional[float]
+    """Return the fraction of the encoder buffer in use, or ``None`` if the encoder does not track its size."""
+    try:
+        return float(encoder.size) / encoder.max_size
+    except (AttributeError, TypeError, ZeroDivisionError):
+        return None
+
+
 class TraceWriter(metaclass=abc.ABCMeta):
+    # Whether the spans are encoded with an encoder that adds the propagated
+    # ``_dd.p.*`` tags of the trace to each of its spans. When they are not,
+    # the tracer copies these tags to every span when it starts.
+    _merges_propagated_tags = False
+
     @abc.abstractmethod
     def recreate(self):
         # type: () -> TraceWriter
@@ -99,6 +121,19 @@ class TraceWriter(metaclass=abc.ABCMeta):
         # type: () -> None
         pass
 
+    def write_unprocessed(self, spans, process):
+        # type: (List[Span], Callable[[List[Span]], Optional[List[Span]]]) -> None
+        """Write spans that still have to go through the trace processors.
+
+        ``process`` applies the trace processor chain to the spans and returns
+        the spans to write, or ``None`` if they should be dropped. Writers
+        process the spans inline by default; writers with a background worker
+        can defer the processing to it.
+        """
+        processed = process(spans)
+        if processed is not None:
+            self.write(processed)
+
 
 class LogWriter(TraceWriter):
     def __init__(
@@ -137,7 +172,7 @@ class LogWriter(TraceWriter):
         pass
 
 
-class HTTPWriter(periodic.PeriodicService, TraceWriter):
+class HTTPWriter(periodic.AwakeablePeriodicService, TraceWriter):
     """Writer to an arbitrary HTTP intake endpoint."""
 
     RETRY_ATTEMPTS = 3
@@ -158,6 +193,9 @@ class HTTPWriter(periodic.PeriodicService, TraceWriter):
         sync_mode=False,  # type: bool
         reuse_connections=None,  # type: Optional[bool]
         headers=None,  # type: Optional[Dict[str, str]]
+        async_processing=None,  # type: Optional[bool]
+        connection_pool_size=None,  # type: Optional[int]
+        compression=None,  # type: Optional[str]
     ):
         # type: (...) -> None
 
@@ -166,6 +204,7 @@ class HTTPWriter(periodic.PeriodicService, TraceWriter):
         if timeout is None:
             timeout = config._agent_timeout_seconds
         super(HTTPWriter, self).__init__(interval=processing_interval)
+        self._base_interval = processing_interval
         self.intake_url = intake_url
         self._buffer_size = buffer_size
         self._max_payload_size = max_payload_size
@@ -177,11 +216,33 @@ class HTTPWriter(periodic.PeriodicService, TraceWriter):
         self._metrics = defaultdict(int)  # type: Dict[str, int]
         self._drop_sma = SimpleMovingAverage(DEFAULT_SMA_WINDOW)
         self._sync_mode = sync_mode
-        self._conn = None  # type: Optional[ConnectionType]
-        # The connection has to be locked since there exists a race between
-        # the periodic thread of HTTPWriter and other threads that might
-        # force a flush with `flush_queue()`.
+
+        if connection_pool_size is None:
+            connection_pool_size = config._trace_writer_connection_pool_size
+        if connection_pool_size <= 0:
+            raise ValueError("Writer connection pool size must be positive")
+        self._connection_pool_size = connection_pool_size
+        # Each slot of the pool holds at most one connection, along with the
+        # intake URL it is connected to. A slot is checked out for the whole
+        # duration of a request, so the periodic thread of HTTPWriter, the
+        # upload workers and other threads that might force a flush with
+        # `flush_queue()` never share a connection.
+        self._conns = [None] * connection_pool_size  # type: List[Optional[Tuple[str, ConnectionType]]]
+        self._conn_slots = compat.Queue()  # type: compat.Queue
+        for slot in range(connection_pool_size):
+            self._conn_slots.put(slot)
         self._conn_lck = threading.RLock()  # type: threading.RLock
+        # Payloads are uploaded in the background when the pool has more than
+        # one connection, so that encoding the next payload overlaps with
+        # sending the previous ones.
+        self._upload_executor = None  # type: Optional[ThreadPoolExecutor]
+        self._uploads = deque()  # type: Deque[Future]
+        # Payloads are sent inline once the writer is shutting down since new
+        # uploads cannot be scheduled after the interpreter shutdown started.
+        self._uploads_closed = False
+        # Guards the state of the writer that the upload threads update: the
+        # metrics, the drop rate, the compressor and the clients.
+        self._state_lck = threading.Lock()
 
         self._send_payload_with_backoff = fibonacci_backoff_with_jitter(  # type ignore[assignment]
             attempts=self.RETRY_ATTEMPTS,
@@ -193,6 +254,50 @@ class HTTPWriter(periodic.PeriodicService, TraceWriter):
             config._trace_writer_connection_reuse if reuse_connections is None else reuse_connections
         )
 
+        # Payloads are compressed right before being sent, possibly on the
+        # upload threads, and the intake is told with the Content-Encoding
+        # header. Compression is disabled if the intake does not support it.
+        self._compression = compression
+        self._compressor = get_compressor(compression, config._trace_writer_compression_level)
+
+        # In asynchronous processing mode trace chunks are queued unprocessed
+        # and the trace processors and the encoding run on the writer thread.
+        # Synchronous writers must process and send the traces before
+        # returning, so the mode is never enabled for them.
+        if async_processing is None:
+            async_processing = config._trace_writer_async_processing
+        self._async_processing = async_processing and not sync_mode
+        self._pending_max_size = config._trace_writer_async_queue_size
+        self._pending = deque()  # type: Deque[Tuple[List[Span], Callable[[List[Span]], Optional[List[Span]]]]]
+
+        # With adaptive flushing the writer thread is awakened as soon as an
+        # encoder buffer fills past the high-water mark, and the flush
+        # interval is doubled, up to a maximum, while there is nothing to send.
+        self._adaptive_flush = config._trace_writer_adaptive_flush and not sync_mode
+        self._flush_high_watermark = config._trace_writer_flush_high_watermark
+        self._max_interval = max(config._trace_writer_max_interval_seconds, processing_interval)
+        if not self._adaptive_flush:
+            # Only flush on the interval, without running the periodic function on start.
+            self.__thread_class__ = periodic.PeriodicThread
+
+        # Payloads that cannot be sent are stored on disk, when enabled, and
+        # are sent again in order once the intake is reachable.
+        self._spool = None  # type: Optional[PayloadSpool]
+        if config._trace_writer_spool_dir and not sync_mode:
+            spool_dir = os.path.join(config._trace_writer_spool_dir, self.STATSD_NAMESPACE)
+            try:
+                self._spool = PayloadSpool(
+                    spool_dir,
+                    max_size=config._trace_writer_spool_max_size,
+                    segment_size=config._trace_writer_spool_segment_size,
+                    max_age=config._trace_writer_spool_max_age_seconds,
+                    on_evict=self._on_spool_evict,
+                )
+            except OSError:
+                log.warning(
+                    "failed to create the payload spool in %s, payloads will not be spooled", spool_dir, exc_info=True
+                )
+
     def _intake_endpoint(self, client=None):
         return "{}/{}".format(self._intake_url(client), client.ENDPOINT if client else self._endpoint)
 
@@ -210,51 +315,70 @@ class HTTPWriter(periodic.PeriodicService, TraceWriter):
         return self.intake_url
 
     def _metrics_dist(self, name, count=1, tags=None):
-        # type: (str, int, Optional[List]) -> None
+        # type: (str, float, Optional[List]) -> None
         if config.health_metrics_enabled and self.dogstatsd:
             self.dogstatsd.distribution("datadog.%s.%s" % (self.STATSD_NAMESPACE, name), count, tags=tags)
 
     def _set_drop_rate(self):
         # type: () -> None
-        accepted = self._metrics["accepted_traces"]
-        sent = self._metrics["sent_traces"]
-        encoded = sum([len(client.encoder) for client in self._clients])
-        # The number of dropped traces is the number of accepted traces minus the number of traces in the encoder
-        # This calculation is a best effort. Due to race conditions it may result in a slight underestimate.
-        dropped = max(accepted - sent - encoded, 0)  # dropped spans should never be negative
-        self._drop_sma.set(dropped, accepted)
-        self._metrics["sent_traces"] = 0  # reset sent traces for the next interval
-        self._metrics["accepted_traces"] = encoded  # sets accepted traces to number of spans in encoders
+        with self._state_lck:
+            accepted = self._metrics["accepted_traces"]
+            sent = self._metrics["sent_traces"]
+            encoded = sum([len(client.encoder) for client in self._clients])
+            # The number of dropped traces is the number of accepted traces minus the number of traces in the encoder
+            # This calculation is a best effort. Due to race conditions it may result in a slight underestimate.
+            dropped = max(accepted - sent - encoded, 0)  # dropped spans should never be negative
+            # Traces dropped before they were accepted, when the pending trace queue is full
+            queue_dropped = self._metrics.pop("dropped_traces", 0)
+            self._drop_sma.set(dropped + queue_dropped, accepted + queue_dropped)
+            self._metrics["sent_traces"] = 0  # reset sent traces for the next interval
+            self._metrics["accepted_traces"] = encoded  # sets accepted traces to number of spans in encoders
 
     def _set_keep_rate(self, trace):
         if trace:
             trace[0].set_metric(KEEP_SPANS_RATE_KEY, 1.0 - self._drop_sma.get())
 
-    def _reset_connection(self):
-        # type: () -> None
+    def _reset_connection(self, slot=None):
+        # type: (Optional[int]) -> None
+        """Close the connection of the given pool slot, or of all of them."""
         with self._conn_lck:
-            if self._conn:
-                self._conn.close()
-                self._conn = None
+            for i in range(len(self._conns)) if slot is None else (slot,):
+                entry = self._conns[i]
+                if entry is not None:
+                    entry[1].close()
+                    self._conns[i] = None
+
+    def _get_connection(self, slot, client, no_trace):
+        # type: (int, WriterClientBase, bool) -> ConnectionType
+        intake_url = self._intake_url(client)
+        entry = self._conns[slot]
+        if entry is not None and entry[0] != intake_url:
+            self._reset_connection(slot)
+            entry = None
+        if entry is None:
+            log.debug("creating new intake connection to %s with timeout %d", intake_url, self._timeout)
+            conn = get_connection(intake_url, self._timeout)
+            setattr(conn, _HTTPLIB_NO_TRACE_REQUEST, no_trace)
+            self._conns[slot] = (intake_url, conn)
+            return conn
+        return entry[1]
 
     def _put(self, data, headers, client, no_trace):
         # type: (bytes, Dict[str, str], WriterClientBase, bool) -> Response
         sw = StopWatch()
         sw.start()
-        with self._conn_lck:
-            if self._conn is None:
-                log.debug("creating new intake connection to %s with timeout %d", self.intake_url, self._timeout)
-                self._conn = get_connection(self._intake_url(client), self._timeout)
-                setattr(self._conn, _HTTPLIB_NO_TRACE_REQUEST, no_trace)
+        slot = self._conn_slots.get()
+        try:
+            conn = self._get_connection(slot, client, no_trace)
             try:
                 log.debug("Sending request: %s %s %s", self.HTTP_METHOD, client.ENDPOINT, headers)
-                self._conn.request(
+                conn.request(
                     self.HTTP_METHOD,
                     client.ENDPOINT,
                     data,
                     headers,
                 )
-                resp = compat.get_connection_response(self._conn)
+                resp = compat.get_connection_response(conn)
                 log.debug("Got response: %s %s", resp.status, resp.reason)
                 t = sw.elapsed()
                 if t >= self.interval:
@@ -262,16 +386,19 @@ class HTTPWriter(periodic.PeriodicService, TraceWriter):
                 else:
                     log_level = logging.DEBUG
                 log.log(log_level, "sent %s in %.5fs to %s", _human_size(len(data)), t, self._intake_endpoint(client))
+                self._metrics_dist("http.connection.latency", t, tags=["connection:%d" % slot])
             except Exception:
                 # Always reset the connection when an exception occurs
-                self._reset_connection()
+                self._reset_connection(slot)
                 raise
             else:
                 return Response.from_http_response(resp)
             finally:
                 # Reset the connection if reusing connections is disabled.
                 if not self._reuse_connections:
-                    self._reset_connection()
+                    self._reset_connection(slot)
+        finally:
+            self._conn_slots.put(slot)
 
     def _get_finalized_headers(self, count, client):
         # type: (int, WriterClientBase) -> dict
@@ -287,13 +414,32 @@ class HTTPWriter(periodic.PeriodicService, TraceWriter):
 
         self._metrics_dist("http.requests")
 
-        response = self._put(payload, headers, client, no_trace=True)
+        compressor = self._compressor
+        if compressor is None:
+            response = self._put(payload, headers, client, no_trace=True)
+        else:
+            body = compressor.compress(payload)
+            self._metrics_dist("http.compressed.bytes", len(body), tags=["encoding:%s" % compressor.encoding])
+            headers["Content-Encoding"] = compressor.encoding
+            response = self._put(body, headers, client, no_trace=True)
+            if response.status == 415:
+                with self._state_lck:
+                    if self._compressor is compressor:
+                        log.warning(
+                            "intake at %s does not support %s compressed payloads, disabling compression",
+                            self._intake_endpoint(client),
+                            compressor.encoding,
+                        )
+                        self._compressor = None
+                del headers["Content-Encoding"]
+                response = self._put(payload, headers, client, no_trace=True)
 
         if response.status >= 400:
             self._metrics_dist("http.errors", tags=["type:%s" % response.status])
         else:
             self._metrics_dist("http.sent.bytes", len(payload))
-            self._metrics["sent_traces"] += count
+            with self._state_lck:
+                self._metrics["sent_traces"] += count
 
         if response.status not in (404, 415) and response.status >= 400:
             msg = "failed to send traces to intake at %s: HTTP error status %s, reason %s"
@@ -305,8 +451,8 @@ class HTTPWriter(periodic.PeriodicService, TraceWriter):
             # Append the payload if requested
             if config._trace_writer_log_err_payload:
                 msg += ", payload %s"
-                # If the payload is bytes then hex encode the value before logging
-                if isinstance(payload, bytes):
+                # If the payload is binary then hex encode the value before logging
+                if isinstance(payload, (bytes, memoryview)):
                     log_args += (binascii.hexlify(payload).decode(),)  # type: ignore
                 else:
                     log_args += (payload,)  # type: ignore
@@ -322,19 +468,63 @@ class HTTPWriter(periodic.PeriodicService, TraceWriter):
         if self._sync_mode:
             self.flush_queue()
 
+    def write_unprocessed(self, spans, process):
+        # type: (List[Span], Callable[[List[Span]], Optional[List[Span]]]) -> None
+        if not self._async_processing:
+            return super(HTTPWriter, self).write_unprocessed(spans, process)
+
+        self._start_if_not_running()
+
+        if len(self._pending) >= self._pending_max_size:
+            log.warning(
+                "pending trace queue is full (%d traces), dropping trace (writer status: %s)",
+                len(self._pending),
+                self.status.value,
+            )
+            # Reflect the dropped trace in the keep rate
+            self._metrics["dropped_traces"] += 1
+            self._metrics_dist("queue.dropped.traces", 1, tags=["reason:full"])
+            self._metrics_dist("queue.dropped.spans", len(spans), tags=["reason:full"])
+            return
+
+        self._pending.append((spans, process))
+        self._metrics_dist("queue.accepted.traces", 1)
+
+    def _process_pending(self):
+        # type: () -> None
+        """Run the trace processors on the queued trace chunks and encode them."""
+        while True:
+            try:
+                spans, process = self._pending.popleft()
+            except IndexError:
+                return
+
+            try:
+                processed = process(spans)
+            except Exception:
+                log.error("failed to process trace with %d spans, dropping", len(spans), exc_info=True)
+                continue
+
+            for client in self._clients:
+                self._write_with_client(client, spans=processed)
+
+    def _start_if_not_running(self):
+        # type: () -> None
+        # Start the HTTPWriter on first write.
+        try:
+            if self.status != service.ServiceStatus.RUNNING:
+                self.start()
+
+        except service.ServiceStatusError:
+            pass
+
     def _write_with_client(self, client, spans=None):
         # type: (WriterClientBase, Optional[List[Span]]) -> None
         if spans is None:
             return
 
         if self._sync_mode is False:
-            # Start the HTTPWriter on first write.
-            try:
-                if self.status != service.ServiceStatus.RUNNING:
-                    self.start()
-
-            except service.ServiceStatusError:
-                pass
+            self._start_if_not_running()
 
         self._metrics_dist("writer.accepted.traces")
         self._metrics["accepted_traces"] += 1
@@ -369,10 +559,54 @@ class HTTPWriter(periodic.PeriodicService, TraceWriter):
             self._metrics_dist("buffer.accepted.traces", 1)
             self._metrics_dist("buffer.accepted.spans", len(spans))
 
-    def flush_queue(self, raise_exc=False):
+        if self._adaptive_flush:
+            fill_ratio = _buffer_fill_ratio(client.encoder)
+            if fill_ratio is not None and fill_ratio >= self._flush_high_watermark:
+                self._request_flush()
+
+    def _request_flush(self):
+        # type: () -> None
+        """Awake the writer thread to flush the buffers ahead of the next interval."""
+        worker = self._worker
+        if isinstance(worker, (periodic.AwakeablePeriodicThread, periodic.AwakeableScheduledTask)):
+            # Never block: this can be called from the writer thread itself
+            # when the trace processors run asynchronously.
+            worker.awake(wait=False)
+
+    def _adapt_interval(self):
+        # type: () -> None
+        """Report the fill ratio of the encoder buffers and adjust the flush interval."""
+        idle = not self._pending and not self._spool
+        for client in self._clients:
+            encoder = client.encoder
+            if len(encoder):
+                idle = False
+            fill_ratio = _buffer_fill_ratio(encoder)
+            if fill_ratio is not None:
+                self._metrics_dist("buffer.fill_ratio", fill_ratio)
+
+        if not self._adaptive_flush:
+            return
+
+        if idle:
+            interval = min(self.interval * 2, self._max_interval)
+        else:
+            interval = self._base_interval
+        if interval != self.interval:
+            self.interval = interval
+
+    def flush_queue(self, raise_exc=False, wait=True):
+        """Encode and send the buffered traces.
+
+        When payloads are uploaded in the background, ``wait`` controls
+        whether to block until all the uploads in flight have completed.
+        """
         try:
+            self._process_pending()
             for client in self._clients:
                 self._flush_queue_with_client(client, raise_exc=raise_exc)
+            if wait:
+                self._wait_for_uploads()
         finally:
             self._set_drop_rate()
 
@@ -388,10 +622,68 @@ class HTTPWriter(periodic.PeriodicService, TraceWriter):
             self._metrics_dist("encoder.dropped.traces", n_traces)
             return
 
+        # Errors can only be raised to the caller when sending inline.
+        if self._connection_pool_size > 1 and not self._sync_mode and not raise_exc and not self._uploads_closed:
+            self._submit_upload(encoded, n_traces, client)
+        else:
+            self._send_encoded(encoded, n_traces, client, raise_exc=raise_exc)
+
+    def _submit_upload(self, encoded, n_traces, client):
+        # type: (bytes, int, WriterClientBase) -> None
+        if self._upload_executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+
+            self._upload_executor = ThreadPoolExecutor(
+                max_workers=self._connection_pool_size, thread_name_prefix="ddtrace.internal.writer"
+            )
+        # Bound the number of payloads held in memory by waiting for the
+        # oldest upload when every connection is busy.
+        while len(self._uploads) >= self._connection_pool_size:
+            self._wait_for_upload(self._uploads.popleft())
+        try:
+            upload = self._upload_executor.submit(self._send_encoded, encoded, n_traces, client)
+        except RuntimeError:
+            # The interpreter is shutting down
+            log.debug("cannot upload payload in the background, sending it inline", exc_info=True)
+            self._send_encoded(encoded, n_traces, client)
+        else:
+            self._uploads.append(upload)
+
+    @staticmethod
+    def _wait_for_upload(future):
+        # type: (Future) -> None
+        try:
+            future.result()
+        except Exception:
+            log.debug("background upload failed", exc_info=True)
+
+    def _wait_for_uploads(self):
+        # type: () -> None
+        while True:
+            try:
+                future = self._uploads.popleft()
+            except IndexError:
+                return
+            self._wait_for_upload(future)
+
+    def _send_encoded(self, encoded, n_traces, client, raise_exc=False):
+        # type: (bytes, int, WriterClientBase, bool) -> None
+        # Keep the payloads in order while older ones are waiting in the spool
+        if not raise_exc and self._spool and self._spool_payload(encoded, n_traces, client):
+            return
+
         try:
             self._send_payload_with_backoff(encoded, n_traces, client)
         except Exception:
             self._metrics_dist("http.errors", tags=["type:err"])
+            if not raise_exc and self._spool_payload(encoded, n_traces, client):
+                log.warning(
+                    "failed to send %d traces to intake at %s after %d retries, spooled to disk",
+                    n_traces,
+                    self._intake_endpoint(client),
+                    self.RETRY_ATTEMPTS,
+                )
+                return
             self._metrics_dist("http.dropped.bytes", len(encoded))
             self._metrics_dist("http.dropped.traces", n_traces)
             if raise_exc:
@@ -407,8 +699,69 @@ class HTTPWriter(periodic.PeriodicService, TraceWriter):
             self._metrics_dist("http.sent.bytes", len(encoded))
             self._metrics_dist("http.sent.traces", n_traces)
 
+    def _spool_payload(self, encoded, n_traces, client):
+        # type: (bytes, int, WriterClientBase) -> bool
+        """Store a payload in the spool, if enabled, and return whether it was stored."""
+        if self._spool is None:
+            return False
+
+        try:
+            spooled = self._spool.append(client.ENDPOINT, encoded, n_traces)
+        except Exception:
+            log.warning("failed to spool %d traces", n_traces, exc_info=True)
+            return False
+
+        if spooled:
+            self._metrics_dist("spool.spooled.bytes", len(encoded))
+            self._metrics_dist("spool.spooled.traces", n_traces)
+        return spooled
+
+    def _on_spool_evict(self, payload, reason):
+        # type: (SpooledPayload, str) -> None
+        log.warning("evicting %d spooled traces (reason: %s)", payload.n_traces, reason)
+        self._metrics_dist("spool.evicted.bytes", payload.size, tags=["reason:%s" % reason])
+        self._metrics_dist("spool.evicted.traces", payload.n_traces, tags=["reason:%s" % reason])
+
+    def _replay_spool(self):
+        # type: () -> None
+        """Send the spooled payloads in order, until the intake cannot be reached."""
+        spool = self._spool
+        if spool is None:
+            return
+
+        while True:
+            payload = spool.peek()
+            if payload is None:
+                return
+
+            for client in self._clients:
+                if client.ENDPOINT == payload.endpoint:
+                    break
+            else:
+                # The payload was encoded for an endpoint the writer no longer
+                # uses, e.g. after a downgrade of the API version.
+                spool.pop(payload)
+                self._on_spool_evict(payload, "incompatible")
+                continue
+
+            try:
+                self._send_payload(payload.read(), payload.n_traces, client)
+            except Exception:
+                log.debug(
+                    "failed to send spooled payload to intake at %s", self._intake_endpoint(client), exc_info=True
+                )
+                return
+
+            spool.pop(payload)
+            self._metrics_dist("spool.replayed.bytes", payload.size)
+            self._metrics_dist("spool.replayed.traces", payload.n_traces)
+
     def periodic(self):
-        self.flush_queue(raise_exc=False)
+        self._adapt_interval()
+        self._replay_spool()
+        # Uploads in flight are left running so that they overlap with the
+        # encoding of the next payloads.
+        self.flush_queue(raise_exc=False, wait=False)
 
     def _stop_service(
         self,
@@ -420,10 +773,18 @@ class HTTPWriter(periodic.PeriodicService, TraceWriter):
         self.join(timeout=timeout)
 
     def on_shutdown(self):
+        self._uploads_closed = True
         try:
             self.periodic()
+            self._wait_for_uploads()
         finally:
+            if self._upload_executor is not None:
+                self._upload_executor.shutdown(wait=False)
+                self._upload_executor = None
             self._reset_connection()
+            if self._spool is not None:
+                # Leave the pending payloads on disk for the next process
+                self._spool.close()
 
 
 class AgentResponse(object):
@@ -443,6 +804,8 @@ class AgentWriter(HTTPWriter):
     RETRY_ATTEMPTS = 3
     HTTP_METHOD = "PUT"
     STATSD_NAMESPACE = "tracer"
+    # All the agent API versions are encoded with the msgpack encoders
+    _merges_propagated_tags = True
 
     def __init__(
         self,
@@ -461,6 +824,9 @@ class AgentWriter(HTTPWriter):
         reuse_connections=None,  # type: Optional[bool]
         headers=None,  # type: Optional[Dict[str, str]]
         response_callback=None,  # type: Optional[Callable[[AgentResponse], None]]
+        async_processing=None,  # type: Optional[bool]
+        connection_pool_size=None,  # type: Optional[int]
+        compression=None,  # type: Optional[str]
     ):
         # type: (...) -> None
         if processing_interval is None:
@@ -521,6 +887,8 @@ class AgentWriter(HTTPWriter):
         if additional_header_str is not None:
             _headers.update(parse_tags_str(additional_header_str))
         self._response_cb = response_callback
+        if compression is None:
+            compression = config._trace_writer_compression
         super(AgentWriter, self).__init__(
             intake_url=agent_url,
             clients=[client],
@@ -532,19 +900,25 @@ class AgentWriter(HTTPWriter):
             sync_mode=sync_mode,
             reuse_connections=reuse_connections,
             headers=_headers,
+            async_processing=async_processing,
+            connection_pool_size=connection_pool_size,
+            compression=compression,
         )
 
     def recreate(self):
         # type: () -> HTTPWriter
         return self.__class__(
             agent_url=self.agent_url,
-            processing_interval=self._interval,
+            processing_interval=self._base_interval,
             buffer_size=self._buffer_size,
             max_payload_size=self._max_payload_size,
             timeout=self._timeout,
             dogstatsd=self.dogstatsd,
             sync_mode=self._sync_mode,
             api_version=self._api_version,
+            async_processing=self._async_processing,
+            connection_pool_size=self._connection_pool_size,
+            compression=self._compression,
         )
 
     @property
@@ -580,7 +954,13 @@ class AgentWriter(HTTPWriter):
         if response.status in [404, 415]:
             log.debug("calling endpoint '%s' but received %s; downgrading API", client.ENDPOINT, response.status)
             try:
-                payload = self._downgrade(payload, response, client)
+                with self._state_lck:
+                    if self._clients[0] is client:
+                        payload = self._downgrade(payload, response, client)
+                    elif client.ENDPOINT == "v0.5/traces":
+                        # Another upload already downgraded the API version
+                        # and the payload cannot be converted.
+                        payload = None
             except ValueError:
                 log.error(
                     "unsupported endpoint '%s': received response %s from intake (%s)",
@@ -8,6 +8,30 @@ from ddtrace.profiling.event import DDFrame
 log = get_logger(__name__)
 
 
+# The maximum number of frames kept in the frame cache. The cache is cleared
+# when it is full.
+DEF MAX_CACHED_FRAMES = 16384
+
+# The frames of the stacks collected so far, by code object id, line number
+# and class name. Samples share the frame tuples rather than each holding a
+# copy of them. The code object is kept with its frame so that its id cannot be
+# reused by another code object while the frame is cached.
+cdef dict _frame_cache = {}
+
+
+cdef object _get_frame(object code, object lineno, object class_name):
+    key = (id(code), lineno, class_name)
+    cached = _frame_cache.get(key)
+    if cached is not None:
+        return (<tuple>cached)[1]
+
+    frame = DDFrame(code.co_filename, lineno, code.co_name, class_name)
+    if len(_frame_cache) >= MAX_CACHED_FRAMES:
+        _frame_cache.clear()
+    _frame_cache[key] = (code, frame)
+    return frame
+
+
 cpdef _extract_class_name(frame):
     # type: (...) -> str
     """Extract class name from a frame, if possible.
@@ -16,6 +40,10 @@ cpdef _extract_class_name(frame):
     """
     if frame.f_code.co_varnames:
         argname = frame.f_code.co_varnames[0]
+        # DEV: accessing f_locals creates a dictionary of the frame locals,
+        # only do it when the class name can be found
+        if argname != "self" and argname != "cls":
+            return ""
         try:
             value = frame.f_locals[argname]
         except KeyError:
@@ -45,7 +73,7 @@ cpdef traceback_to_frames(traceback, max_nframes):
             frame = tb.tb_frame
             code = frame.f_code
             lineno = 0 if frame.f_lineno is None else frame.f_lineno
-            frames.insert(0, DDFrame(code.co_filename, lineno, code.co_name, _extract_class_name(frame)))
+            frames.insert(0, _get_frame(code, lineno, _extract_class_name(frame)))
         nframes += 1
         tb = tb.tb_next
     return frames, nframes
@@ -89,7 +117,7 @@ cpdef pyframe_to_frames(frame, max_nframes):
                     return [], 0
 
             lineno = 0 if frame.f_lineno is None else frame.f_lineno
-            frames.append(DDFrame(code.co_filename, lineno, code.co_name, _extract_class_name(frame)))
+            frames.append(_get_frame(code, lineno, _extract_class_name(frame)))
         nframes += 1
         frame = frame.f_back
     return frames, nframes
@@ -164,6 +164,7 @@ _Location_Key_T = typing.Tuple[typing.Tuple[int, ...], _Label_List_T]
 
 
 HashableStackTraceType = typing.Tuple[event.DDFrame, ...]
+_Stack_Key_T = typing.Tuple[HashableStackTraceType, int]
 
 
 @attr.s
@@ -177,6 +178,12 @@ class _PprofConverter(object):
     _locations = attr.ib(init=False, factory=dict, type=typing.Dict[typing.Tuple[str, int, str], pprof_LocationType])
     _string_table = attr.ib(init=False, factory=_StringTable)
 
+    # The location ids of the stacks converted so far: the same stack is usually
+    # found in the samples of many threads, spans or tasks.
+    _stack_locations = attr.ib(
+        init=False, factory=dict, repr=False, type=typing.Dict[_Stack_Key_T, typing.Tuple[int, ...]]
+    )
+
     _last_location_id = attr.ib(init=False, factory=lambda: itertools.count(1))
     _last_func_id = attr.ib(init=False, factory=lambda: itertools.count(1))
 
@@ -246,6 +253,12 @@ class _PprofConverter(object):
         nframes,  # type: int
     ):
         # type: (...) -> typing.Tuple[int, ...]
+        key = (tuple(frames), nframes)
+        try:
+            return self._stack_locations[key]
+        except KeyError:
+            pass
+
         locations = [
             self._to_Location(filename, lineno, funcname).id for filename, lineno, funcname, class_name in frames
         ]
@@ -256,7 +269,8 @@ class _PprofConverter(object):
                 self._to_Location("", 0, "<%d frame%s omitted>" % (omitted, ("s" if omitted > 1 else ""))).id
             )
 
-        return tuple(locations)
+        self._stack_locations[key] = stack_locations = tuple(locations)
+        return stack_locations
 
     def convert_stack_event(
         self,
@@ -1,4 +1,4 @@
-import re
+from typing import Callable  # noqa:F401
 from typing import Dict  # noqa:F401
 from typing import FrozenSet  # noqa:F401
 from typing import List  # noqa:F401
@@ -12,6 +12,7 @@ from ddtrace.tracing._span_link import SpanLink
 
 from ..constants import AUTO_KEEP
 from ..constants import AUTO_REJECT
+from ..constants import SAMPLING_PRIORITY_KEY
 from ..constants import USER_KEEP
 from ..context import Context
 from ..internal._tagset import TagsetDecodeError
@@ -69,40 +70,40 @@ POSSIBLE_HTTP_HEADER_TRACE_IDS = _possible_header(HTTP_HEADER_TRACE_ID)
 POSSIBLE_HTTP_HEADER_PARENT_IDS = _possible_header(HTTP_HEADER_PARENT_ID)
 POSSIBLE_HTTP_HEADER_SAMPLING_PRIORITIES = _possible_header(HTTP_HEADER_SAMPLING_PRIORITY)
 POSSIBLE_HTTP_HEADER_ORIGIN = _possible_header(HTTP_HEADER_ORIGIN)
-_POSSIBLE_HTTP_HEADER_TAGS = frozenset([_HTTP_HEADER_TAGS, get_wsgi_header(_HTTP_HEADER_TAGS).lower()])
-_POSSIBLE_HTTP_HEADER_B3_SINGLE_HEADER = _possible_header(_HTTP_HEADER_B3_SINGLE)
-_POSSIBLE_HTTP_HEADER_B3_TRACE_IDS = _possible_header(_HTTP_HEADER_B3_TRACE_ID)
-_POSSIBLE_HTTP_HEADER_B3_SPAN_IDS = _possible_header(_HTTP_HEADER_B3_SPAN_ID)
-_POSSIBLE_HTTP_HEADER_B3_SAMPLEDS = _possible_header(_HTTP_HEADER_B3_SAMPLED)
-_POSSIBLE_HTTP_HEADER_B3_FLAGS = _possible_header(_HTTP_HEADER_B3_FLAGS)
-_POSSIBLE_HTTP_HEADER_TRACEPARENT = _possible_header(_HTTP_HEADER_TRACEPARENT)
-_POSSIBLE_HTTP_HEADER_TRACESTATE = _possible_header(_HTTP_HEADER_TRACESTATE)
-
-
-# https://www.w3.org/TR/trace-context/#traceparent-header-field-values
-# Future proofing: The traceparent spec is additive, future traceparent versions may contain more than 4 values
-# The regex below matches the version, trace id, span id, sample flag, and end-string/future values (if version>00)
-_TRACEPARENT_HEX_REGEX = re.compile(
-    r"""
-     ^                  # Start of string
-     ([a-f0-9]{2})-     # 2 character hex version
-     ([a-f0-9]{32})-    # 32 character hex trace id
-     ([a-f0-9]{16})-    # 16 character hex span id
-     ([a-f0-9]{2})      # 2 character hex sample flag
-     (-.+)?             # optional, start of any additional values
-     $                  # end of string
-     """,
-    re.VERBOSE,
-)
-
-
-def _extract_header_value(possible_header_names, headers, default=None):
-    # type: (FrozenSet[str], Dict[str, str], Optional[str]) -> Optional[str]
-    for header in possible_header_names:
-        if header in headers:
-            return ensure_text(headers[header], errors="backslashreplace")
-
-    return default
+
+
+_LOWER_HEX_DIGITS = frozenset("0123456789abcdef")
+
+
+def _parse_traceparent(tp):
+    # type: (str) -> Optional[Tuple[str, str, str, str, Optional[str]]]
+    """Split a traceparent into its version, trace id, span id, sample flag and future values.
+
+    The format is ``vv-{32 hex trace id}-{16 hex span id}-ff``, all in lowercase hex.
+    Future proofing: the traceparent spec is additive, future traceparent versions may
+    contain more than 4 values. See
+    https://www.w3.org/TR/trace-context/#traceparent-header-field-values
+
+    Returns ``None`` if the traceparent is malformed.
+    """
+    if len(tp) < 55 or tp[2] != "-" or tp[35] != "-" or tp[52] != "-":
+        return None
+    version, trace_id_hex, span_id_hex, trace_flags_hex = tp[:2], tp[3:35], tp[36:52], tp[53:55]
+    if not _LOWER_HEX_DIGITS.issuperset(version + trace_id_hex + span_id_hex + trace_flags_hex):
+        return None
+    future_vals = tp[55:] or None
+    if future_vals is not None and (len(future_vals) < 2 or future_vals[0] != "-" or "\n" in future_vals):
+        return None
+    return version, trace_id_hex, span_id_hex, trace_flags_hex, future_vals
+
+
+def _get_header_value(headers, header, default=None):
+    # type: (Dict[str, str], str, Optional[str]) -> Optional[str]
+    """Return the value of a header collected by ``_ExtractHeaderTable``."""
+    value = headers.get(header)
+    if value is None:
+        return default
+    return ensure_text(value, errors="backslashreplace")
 
 
 def _attach_baggage_to_context(headers: Dict[str, str], context: Context):
@@ -161,11 +162,7 @@ class _DatadogMultiHeader:
     @staticmethod
     def _get_tags_value(headers):
         # type: (Dict[str, str]) -> Optional[str]
-        return _extract_header_value(
-            _POSSIBLE_HTTP_HEADER_TAGS,
-            headers,
-            default="",
-        )
+        return _get_header_value(headers, _HTTP_HEADER_TAGS, default="")
 
     @staticmethod
     def _extract_meta(tags_value):
@@ -266,7 +263,7 @@ class _DatadogMultiHeader:
     @staticmethod
     def _extract(headers):
         # type: (Dict[str, str]) -> Optional[Context]
-        trace_id_str = _extract_header_value(POSSIBLE_HTTP_HEADER_TRACE_IDS, headers)
+        trace_id_str = _get_header_value(headers, HTTP_HEADER_TRACE_ID)
         if trace_id_str is None:
             return None
         try:
@@ -280,19 +277,9 @@ class _DatadogMultiHeader:
             )
             return None
 
-        parent_span_id = _extract_header_value(
-            POSSIBLE_HTTP_HEADER_PARENT_IDS,
-            headers,
-            default="0",
-        )
-        sampling_priority = _extract_header_value(
-            POSSIBLE_HTTP_HEADER_SAMPLING_PRIORITIES,
-            headers,
-        )
-        origin = _extract_header_value(
-            POSSIBLE_HTTP_HEADER_ORIGIN,
-            headers,
-        )
+        parent_span_id = _get_header_value(headers, HTTP_HEADER_PARENT_ID, default="0")
+        sampling_priority = _get_header_value(headers, HTTP_HEADER_SAMPLING_PRIORITY)
+        origin = _get_header_value(headers, HTTP_HEADER_ORIGIN)
 
         meta = None
 
@@ -409,25 +396,13 @@ class _B3MultiHeader:
     @staticmethod
     def _extract(headers):
         # type: (Dict[str, str]) -> Optional[Context]
-        trace_id_val = _extract_header_value(
-            _POSSIBLE_HTTP_HEADER_B3_TRACE_IDS,
-            headers,
-        )
+        trace_id_val = _get_header_value(headers, _HTTP_HEADER_B3_TRACE_ID)
         if trace_id_val is None:
             return None
 
-        span_id_val = _extract_header_value(
-            _POSSIBLE_HTTP_HEADER_B3_SPAN_IDS,
-            headers,
-        )
-        sampled = _extract_header_value(
-            _POSSIBLE_HTTP_HEADER_B3_SAMPLEDS,
-            headers,
-        )
-        flags = _extract_header_value(
-            _POSSIBLE_HTTP_HEADER_B3_FLAGS,
-            headers,
-        )
+        span_id_val = _get_header_value(headers, _HTTP_HEADER_B3_SPAN_ID)
+        sampled = _get_header_value(headers, _HTTP_HEADER_B3_SAMPLED)
+        flags = _get_header_value(headers, _HTTP_HEADER_B3_FLAGS)
 
         # Try to parse values into their expected types
         try:
@@ -525,7 +500,7 @@ class _B3SingleHeader:
     @staticmethod
     def _extract(headers):
         # type: (Dict[str, str]) -> Optional[Context]
-        single_header = _extract_header_value(_POSSIBLE_HTTP_HEADER_B3_SINGLE_HEADER, headers)
+        single_header = _get_header_value(headers, _HTTP_HEADER_B3_SINGLE)
         if not single_header:
             return None
 
@@ -640,17 +615,11 @@ class _TraceContext:
         Otherwise we extract the trace-id, span-id, and sampling priority from the
         traceparent header.
         """
-        valid_tp_values = _TRACEPARENT_HEX_REGEX.match(tp.strip())
+        valid_tp_values = _parse_traceparent(tp.strip())
         if valid_tp_values is None:
             raise ValueError("Invalid traceparent version: %s" % tp)
 
-        (
-            version,
-            trace_id_hex,
-            span_id_hex,
-            trace_flags_hex,
-            future_vals,
-        ) = valid_tp_values.groups()  # type: Tuple[str, str, str, str, Optional[str]]
+        version, trace_id_hex, span_id_hex, trace_flags_hex, future_vals = valid_tp_values
 
         if version == "ff":
             # https://www.w3.org/TR/trace-context/#version
@@ -743,7 +712,7 @@ class _TraceContext:
         # type: (Dict[str, str]) -> Optional[Context]
 
         try:
-            tp = _extract_header_value(_POSSIBLE_HTTP_HEADER_TRACEPARENT, headers)
+            tp = _get_header_value(headers, _HTTP_HEADER_TRACEPARENT)
             if tp is None:
                 log.debug("no traceparent header")
                 return None
@@ -754,7 +723,7 @@ class _TraceContext:
         origin = None
         meta = {W3C_TRACEPARENT_KEY: tp}  # type: _MetaDictType
 
-        ts = _extract_header_value(_POSSIBLE_HTTP_HEADER_TRACESTATE, headers)
+        ts = _get_header_value(headers, _HTTP_HEADER_TRACESTATE)
 
         if ts:
             # whitespace is allowed, but whitespace to start or end values should be trimmed
@@ -763,7 +732,7 @@ class _TraceContext:
             ts = ",".join(ts_l)
             # the value MUST contain only ASCII characters in the
             # range of 0x20 to 0x7E
-            if re.search(r"[^\x20-\x7E]+", ts):
+            if not (ts.isascii() and ts.isprintable()):
                 log.debug("received invalid tracestate header: %r", ts)
             else:
                 # store tracestate so we keep other vendor data for injection, even if dd ends up being invalid
@@ -825,6 +794,142 @@ _PROP_STYLES = {
 }
 
 
+# The formatting of the span id in the injected headers that depend on it
+_SPAN_ID_HEADERS = {
+    HTTP_HEADER_PARENT_ID: str,
+    _HTTP_HEADER_B3_SPAN_ID: _dd_id_to_b3_id,
+    _HTTP_HEADER_B3_SINGLE: _dd_id_to_b3_id,
+    _HTTP_HEADER_TRACEPARENT: "{:016x}".format,
+}
+
+
+def _injected_headers_key(span_context):
+    # type: (Context) -> Tuple
+    """Return the state of the trace and of the configuration the injected headers depend on."""
+    sampling_priority = span_context._metrics.get(SAMPLING_PRIORITY_KEY)
+    return (
+        span_context.trace_id,
+        # DEV: 1 == 1.0 but they are not rendered the same way
+        type(sampling_priority),
+        sampling_priority,
+        tuple(span_context._meta.items()),
+        tuple(config._propagation_style_inject),
+        config._x_datadog_tags_enabled,
+        config._x_datadog_tags_max_length,
+    )
+
+
+def _render_injected_headers(span_context):
+    # type: (Context) -> Tuple[Tuple[str, str, Optional[Callable[[int], str]], str], ...]
+    """Render the headers of the configured propagation styles for the context.
+
+    Each header is returned as a ``(name, prefix, format_span_id, suffix)``
+    tuple. The value of the headers that depend on the span id is split
+    around the span id, so that the headers can be reused for the other
+    spans of the trace. ``format_span_id`` is ``None`` for the other headers,
+    whose value is ``prefix``.
+    """
+    rendered = {}  # type: Dict[str, str]
+    if PROPAGATION_STYLE_DATADOG in config._propagation_style_inject:
+        _DatadogMultiHeader._inject(span_context, rendered)
+    if PROPAGATION_STYLE_B3_MULTI in config._propagation_style_inject:
+        _B3MultiHeader._inject(span_context, rendered)
+    if PROPAGATION_STYLE_B3_SINGLE in config._propagation_style_inject:
+        _B3SingleHeader._inject(span_context, rendered)
+    if _PROPAGATION_STYLE_W3C_TRACECONTEXT in config._propagation_style_inject:
+        _TraceContext._inject(span_context, rendered)
+
+    span_id = cast(int, span_context.span_id)
+    headers = []
+    for name, value in rendered.items():
+        format_span_id = _SPAN_ID_HEADERS.get(name)
+        if format_span_id is not None:
+            formatted_span_id = format_span_id(span_id)
+            # DEV: the span id comes after the trace id in the values
+            start = value.rfind(formatted_span_id)
+            if start >= 0:
+                headers.append((name, value[:start], format_span_id, value[start + len(formatted_span_id) :]))
+                continue
+        headers.append((name, value, None, ""))
+    return tuple(headers)
+
+
+# The headers read by the propagators of each style. A context can only be
+# extracted when the first one is present.
+_PROP_STYLE_HEADERS = {
+    PROPAGATION_STYLE_DATADOG: (
+        HTTP_HEADER_TRACE_ID,
+        HTTP_HEADER_PARENT_ID,
+        HTTP_HEADER_SAMPLING_PRIORITY,
+        HTTP_HEADER_ORIGIN,
+        _HTTP_HEADER_TAGS,
+    ),
+    PROPAGATION_STYLE_B3_MULTI: (
+        _HTTP_HEADER_B3_TRACE_ID,
+        _HTTP_HEADER_B3_SPAN_ID,
+        _HTTP_HEADER_B3_SAMPLED,
+        _HTTP_HEADER_B3_FLAGS,
+    ),
+    PROPAGATION_STYLE_B3_SINGLE: (_HTTP_HEADER_B3_SINGLE,),
+    _PROPAGATION_STYLE_W3C_TRACECONTEXT: (_HTTP_HEADER_TRACEPARENT, _HTTP_HEADER_TRACESTATE),
+    _PROPAGATION_STYLE_NONE: (),
+}  # type: Dict[str, Tuple[str, ...]]
+
+
+class _ExtractHeaderTable(object):
+    """Lookup table of the headers read by the configured extraction styles.
+
+    The lowercase names of the headers, as sent or as WSGI environment
+    variables, are mapped to the names the propagators look up, so that the
+    incoming headers are scanned once.
+    """
+
+    __slots__ = ("styles", "names", "extractors")
+
+    def __init__(self, styles):
+        # type: (List[str]) -> None
+        self.styles = styles
+        self.names = {}  # type: Dict[str, str]
+        # The propagator of each style, with the header required to extract a context
+        self.extractors = []  # type: List[Tuple[str, type, Optional[str]]]
+        for style in styles:
+            headers = _PROP_STYLE_HEADERS[style]
+            for header in headers:
+                self.names[header] = header
+                self.names[get_wsgi_header(header).lower()] = header
+            self.extractors.append((style, _PROP_STYLES[style], headers[0] if headers else None))
+
+    def collect(self, headers):
+        # type: (Dict[str, str]) -> Dict[str, str]
+        """Return the incoming headers read by the propagators, and the baggage headers if enabled."""
+        names = self.names
+        baggage = config.propagation_http_baggage_enabled is True
+        collected = {}
+        for name, value in headers.items():
+            lower_name = name.lower()
+            header = names.get(lower_name)
+            if header is not None:
+                collected[header] = value
+            elif baggage and lower_name[: len(_HTTP_BAGGAGE_PREFIX)] == _HTTP_BAGGAGE_PREFIX:
+                collected[lower_name] = value
+        return collected
+
+
+_extract_header_table = None  # type: Optional[_ExtractHeaderTable]
+
+
+def _get_extract_header_table():
+    # type: () -> _ExtractHeaderTable
+    """Return the header table of the extraction styles, built again when they are reconfigured."""
+    global _extract_header_table
+
+    styles = config._propagation_style_extract
+    table = _extract_header_table
+    if table is None or table.styles is not styles:
+        table = _extract_header_table = _ExtractHeaderTable(styles)
+    return table
+
+
 class HTTPPropagator(object):
     """A HTTP Propagator using HTTP headers as carrier."""
 
@@ -832,8 +937,10 @@ class HTTPPropagator(object):
     def _extract_configured_contexts_avail(normalized_headers):
         contexts = []
         styles_w_ctx = []
-        for prop_style in config._propagation_style_extract:
-            propagator = _PROP_STYLES[prop_style]
+        for prop_style, propagator, required_header in _get_extract_header_table().extractors:
+            # DEV: the propagators return no context without their required header
+            if required_header is None or required_header not in normalized_headers:
+                continue
             context = propagator._extract(normalized_headers)
             if context:
                 contexts.append(context)
@@ -866,7 +973,7 @@ class HTTPPropagator(object):
             # add the tracestate to the primary context
             elif style_w_ctx == _PROPAGATION_STYLE_W3C_TRACECONTEXT:
                 # extract and add the raw ts value to the primary_context
-                ts = _extract_header_value(_POSSIBLE_HTTP_HEADER_TRACESTATE, normalized_headers)
+                ts = _get_header_value(normalized_headers, _HTTP_HEADER_TRACESTATE)
                 if ts:
                     primary_context._meta[W3C_TRACESTATE_KEY] = ts
         primary_context._span_links = links
@@ -902,14 +1009,20 @@ class HTTPPropagator(object):
             for key in span_context._baggage:
                 headers[_HTTP_BAGGAGE_PREFIX + key] = span_context._baggage[key]
 
-        if PROPAGATION_STYLE_DATADOG in config._propagation_style_inject:
-            _DatadogMultiHeader._inject(span_context, headers)
-        if PROPAGATION_STYLE_B3_MULTI in config._propagation_style_inject:
-            _B3MultiHeader._inject(span_context, headers)
-        if PROPAGATION_STYLE_B3_SINGLE in config._propagation_style_inject:
-            _B3SingleHeader._inject(span_context, headers)
-        if _PROPAGATION_STYLE_W3C_TRACECONTEXT in config._propagation_style_inject:
-            _TraceContext._inject(span_context, headers)
+        # The headers are only rendered again when the state of the trace they
+        # depend on changes, e.g. its sampling priority, origin or propagated tags.
+        injected_headers = span_context._injected_headers
+        if injected_headers is None:
+            injected_headers = span_context._injected_headers = [None]
+        cached = injected_headers[0]
+        if cached is None or cached[0] != _injected_headers_key(span_context):
+            rendered = _render_injected_headers(span_context)
+            # DEV: rendering the headers can update the propagated tags
+            cached = injected_headers[0] = (_injected_headers_key(span_context), rendered)
+
+        span_id = span_context.span_id
+        for name, prefix, format_span_id, suffix in cached[1]:
+            headers[name] = prefix if format_span_id is None else prefix + format_span_id(span_id) + suffix
 
     @staticmethod
     def extract(headers):
@@ -938,7 +1051,8 @@ class HTTPPropagator(object):
         if not headers:
             return Context()
         try:
-            normalized_headers = {name.lower(): v for name, v in headers.items()}
+            # Only keep the headers the configured styles read, under the names they look up
+            normalized_headers = _get_extract_header_table().collect(headers)
 
             # tracer configured to extract first only
             if config._propagation_extract_first:
@@ -950,7 +1064,7 @@ class HTTPPropagator(object):
                         _attach_baggage_to_context(normalized_headers, context)
                     return context
             # loop through all extract propagation styles
-            else:
+            elif normalized_headers:
                 contexts, styles_w_ctx = HTTPPropagator._extract_configured_contexts_avail(normalized_headers)
 
                 if contexts:
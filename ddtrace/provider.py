@@ -36,6 +36,8 @@ class BaseContextProvider(metaclass=abc.ABCMeta):
     def __init__(self):
         # type: (...) -> None
         self._hooks = _hooks.Hooks()
+        # Whether functions are registered to execute when a span is activated
+        self._has_activate_hooks = False
 
     @abc.abstractmethod
     def _has_active_context(self):
@@ -61,6 +63,7 @@ class BaseContextProvider(metaclass=abc.ABCMeta):
                      The activated span will be passed as argument.
         """
         self._hooks.register(self.activate, func)
+        self._has_activate_hooks = True
         return func
 
     def _deregister_on_activate(self, func):
@@ -73,6 +76,7 @@ class BaseContextProvider(metaclass=abc.ABCMeta):
         """
 
         self._hooks.deregister(self.activate, func)
+        self._has_activate_hooks = bool(self._hooks._hooks.get(self.activate))
         return func
 
     def __call__(self, *args, **kwargs):
@@ -129,13 +133,15 @@ class DefaultContextProvider(BaseContextProvider, DatadogContextMixin):
         # type: (Optional[Union[Span, Context]]) -> None
         """Makes the given context active in the current execution."""
         _DD_CONTEXTVAR.set(ctx)
-        super(DefaultContextProvider, self).activate(ctx)
+        if self._has_activate_hooks:
+            super(DefaultContextProvider, self).activate(ctx)
 
     def active(self):
         # type: () -> Optional[Union[Context, Span]]
         """Returns the active span or context for the current execution."""
         item = _DD_CONTEXTVAR.get()
-        if isinstance(item, Span):
+        # DEV: the active span is only replaced by its parent once it has finished
+        if isinstance(item, Span) and item.duration_ns is not None:
             return self._update_active(item)
         return item
 
@@ -155,15 +155,12 @@ class SamplingRule(object):
         if tags is None:
             return False
 
-        tag_match = False
-        for tag_key in self._tag_value_matchers.keys():
+        for tag_key, matcher in self._tag_value_matchers.items():
             value = tags.get(tag_key)
-            if value is not None:
-                tag_match = self._tag_value_matchers[tag_key].match(value)
-            else:
-                # if we don't match with all specified tags for a rule, it's not a match
+            # if we don't match with all specified tags for a rule, it's not a match
+            if value is None or not matcher.match(value):
                 return False
-        return tag_match
+        return True
 
     def sample(self, span, allow_false=True):
         # type: (Span, bool) -> bool
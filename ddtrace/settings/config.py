@@ -21,9 +21,13 @@ from ..internal import gitmetadata
 from ..internal.constants import _PROPAGATION_STYLE_DEFAULT
 from ..internal.constants import DEFAULT_BUFFER_SIZE
 from ..internal.constants import DEFAULT_MAX_PAYLOAD_SIZE
+from ..internal.constants import DEFAULT_MAX_PROCESSING_INTERVAL
 from ..internal.constants import DEFAULT_PROCESSING_INTERVAL
 from ..internal.constants import DEFAULT_REUSE_CONNECTIONS
 from ..internal.constants import DEFAULT_SAMPLING_RATE_LIMIT
+from ..internal.constants import DEFAULT_SPOOL_MAX_AGE
+from ..internal.constants import DEFAULT_SPOOL_MAX_SIZE
+from ..internal.constants import DEFAULT_SPOOL_SEGMENT_SIZE
 from ..internal.constants import DEFAULT_TIMEOUT
 from ..internal.constants import PROPAGATION_STYLE_ALL
 from ..internal.constants import PROPAGATION_STYLE_B3_SINGLE
@@ -384,7 +388,30 @@ class Config(object):
         self._trace_writer_connection_reuse = asbool(
             os.getenv("DD_TRACE_WRITER_REUSE_CONNECTIONS", DEFAULT_REUSE_CONNECTIONS)
         )
+        self._trace_writer_connection_pool_size = int(os.getenv("DD_TRACE_WRITER_CONNECTION_POOL_SIZE", default=1))
         self._trace_writer_log_err_payload = asbool(os.environ.get("_DD_TRACE_WRITER_LOG_ERROR_PAYLOADS", False))
+        self._trace_writer_async_processing = asbool(os.getenv("DD_TRACE_WRITER_ASYNC_PROCESSING", default=False))
+        self._trace_writer_async_queue_size = int(os.getenv("DD_TRACE_WRITER_ASYNC_QUEUE_SIZE", default=1000))
+        self._trace_writer_adaptive_flush = asbool(os.getenv("DD_TRACE_WRITER_ADAPTIVE_FLUSH", default=False))
+        self._trace_writer_flush_high_watermark = float(os.getenv("DD_TRACE_WRITER_FLUSH_HIGH_WATERMARK", default=0.75))
+        if not 0.0 < self._trace_writer_flush_high_watermark <= 1.0:
+            raise ValueError("DD_TRACE_WRITER_FLUSH_HIGH_WATERMARK must be greater than 0 and at most 1")
+        self._trace_writer_max_interval_seconds = float(
+            os.getenv("DD_TRACE_WRITER_MAX_INTERVAL_SECONDS", default=DEFAULT_MAX_PROCESSING_INTERVAL)
+        )
+        self._trace_writer_compression = os.getenv("DD_TRACE_WRITER_COMPRESSION", default="")
+        _compression_level = os.getenv("DD_TRACE_WRITER_COMPRESSION_LEVEL")
+        self._trace_writer_compression_level = int(_compression_level) if _compression_level else None
+        self._trace_writer_spool_dir = os.getenv("DD_TRACE_WRITER_SPOOL_DIR")
+        self._trace_writer_spool_max_size = int(
+            os.getenv("DD_TRACE_WRITER_SPOOL_MAX_SIZE_BYTES", default=DEFAULT_SPOOL_MAX_SIZE)
+        )
+        self._trace_writer_spool_segment_size = int(
+            os.getenv("DD_TRACE_WRITER_SPOOL_SEGMENT_SIZE_BYTES", default=DEFAULT_SPOOL_SEGMENT_SIZE)
+        )
+        self._trace_writer_spool_max_age_seconds = float(
+            os.getenv("DD_TRACE_WRITER_SPOOL_MAX_AGE_SECONDS", default=DEFAULT_SPOOL_MAX_AGE)
+        )
 
         self._trace_agent_hostname = os.environ.get("DD_AGENT_HOST", os.environ.get("DD_TRACE_AGENT_HOSTNAME"))
         self._trace_agent_port = os.environ.get("DD_AGENT_PORT", os.environ.get("DD_TRACE_AGENT_PORT"))
@@ -488,6 +515,8 @@ class Config(object):
                 "DD_TRACE_COMPUTE_STATS", os.getenv("DD_TRACE_STATS_COMPUTATION_ENABLED", trace_compute_stats_default)
             )
         )
+        self._trace_compute_stats_batched = asbool(os.getenv("DD_TRACE_STATS_COMPUTATION_BATCHED", False))
+        self._trace_early_drop_enabled = asbool(os.getenv("DD_TRACE_EARLY_DROP_ENABLED", False))
         self._data_streams_enabled = asbool(os.getenv("DD_DATA_STREAMS_ENABLED", False))
 
         dd_trace_obfuscation_query_string_regexp = os.getenv(
@@ -520,6 +549,19 @@ class Config(object):
         self._ddtrace_bootstrapped = False
         self._subscriptions = []  # type: List[Tuple[List[str], Callable[[Config, List[str]], None]]]
         self._span_aggregator_rlock = asbool(os.getenv("DD_TRACE_SPAN_AGGREGATOR_RLOCK", True))
+        span_aggregator_shards = int(os.getenv("DD_TRACE_SPAN_AGGREGATOR_SHARDS", default=1))
+        if span_aggregator_shards < 1:
+            raise ValueError(
+                "Invalid value {!r} provided for DD_TRACE_SPAN_AGGREGATOR_SHARDS, only positive values allowed".format(
+                    span_aggregator_shards
+                )
+            )
+        self._span_aggregator_shards = span_aggregator_shards
+        self._span_aggregator_max_traces = int(os.getenv("DD_TRACE_SPAN_AGGREGATOR_MAX_TRACES", default=0))
+        self._span_aggregator_max_spans_per_trace = int(
+            os.getenv("DD_TRACE_SPAN_AGGREGATOR_MAX_SPANS_PER_TRACE", default=0)
+        )
+        self._span_aggregator_max_trace_age = float(os.getenv("DD_TRACE_SPAN_AGGREGATOR_MAX_TRACE_AGE", default=0.0))
 
         self.trace_methods = os.getenv("DD_TRACE_METHODS")
 
@@ -31,14 +31,16 @@ from .constants import VERSION_KEY
 from .context import Context
 from .ext import http
 from .ext import net
-from .internal._rand import rand64bits as _rand64bits
+from .internal._rand import pop_rand64bits as _pop_rand64bits
 from .internal._rand import rand128bits as _rand128bits
+from .internal._rand import refill_rand64bits as _refill_rand64bits
 from .internal.compat import NumericType
 from .internal.compat import StringIO
 from .internal.compat import ensure_text
 from .internal.compat import is_integer
 from .internal.compat import time_ns
 from .internal.constants import MAX_UINT_64BITS as _MAX_UINT_64BITS
+from .internal.constants import SAMPLING_DECISION_TRACE_TAG_KEY
 from .internal.constants import SPAN_API_DATADOG
 from .internal.logger import get_logger
 from .internal.sampling import SamplingMechanism
@@ -65,6 +67,12 @@ def _get_64_highest_order_bits_as_hex(large_int):
     return "{:032x}".format(large_int)[:16]
 
 
+def _is_propagated_tag(key):
+    # type: (Any) -> bool
+    """Whether the given tag of a context is one of the tags propagated to its spans"""
+    return isinstance(key, str) and key.startswith("_dd.p.") and key != SAMPLING_DECISION_TRACE_TAG_KEY
+
+
 class Span(object):
     __slots__ = [
         # Public span attributes
@@ -156,13 +164,23 @@ class Span(object):
         self.duration_ns = None  # type: Optional[int]
 
         # tracing
+        # DEV: random IDs are popped from a pre-generated batch, which is
+        # refilled once it is exhausted.
         if trace_id is not None:
             self.trace_id = trace_id  # type: int
         elif config._128_bit_trace_id_enabled:
             self.trace_id = _rand128bits()
         else:
-            self.trace_id = _rand64bits()
-        self.span_id = span_id or _rand64bits()  # type: int
+            try:
+                self.trace_id = _pop_rand64bits()
+            except IndexError:
+                self.trace_id = _refill_rand64bits()
+        if not span_id:
+            try:
+                span_id = _pop_rand64bits()
+            except IndexError:
+                span_id = _refill_rand64bits()
+        self.span_id = span_id  # type: int
         self.parent_id = parent_id  # type: Optional[int]
         self._on_finish_callbacks = [] if on_finish is None else on_finish
 
@@ -385,11 +403,21 @@ class Span(object):
 
     def get_tag(self, key: _TagNameType) -> Optional[Text]:
         """Return the given tag or None if it doesn't exist."""
-        return self._meta.get(key, None)
+        value = self._meta.get(key, None)
+        if value is None and self._context is not None and _is_propagated_tag(key):
+            # The propagated tags of the trace are only added to the span when
+            # it is encoded by the writers that support it.
+            return self._context._meta.get(key, None)
+        return value
 
     def get_tags(self) -> _MetaDictType:
         """Return all tags."""
-        return self._meta.copy()
+        tags = self._meta.copy()
+        if self._context is not None:
+            for k, v in list(self._context._meta.items()):
+                if _is_propagated_tag(k):
+                    tags.setdefault(k, v)
+        return tags
 
     def set_tags(self, tags: Dict[_TagNameType, Any]) -> None:
         """Set a dictionary of tags on the given span. Keys and values
@@ -5,6 +5,7 @@ import os
 from os import environ
 from os import getpid
 from threading import RLock
+from types import FunctionType
 from typing import TYPE_CHECKING
 from typing import Any
 from typing import Callable
@@ -28,7 +29,10 @@ from ddtrace.settings.peer_service import _ps_config
 from . import _hooks
 from .constants import ENV_KEY
 from .constants import HOSTNAME_KEY
+from .constants import MANUAL_DROP_KEY
+from .constants import MANUAL_KEEP_KEY
 from .constants import PID
+from .constants import SERVICE_KEY
 from .constants import VERSION_KEY
 from .context import Context
 from .internal import agent
@@ -43,6 +47,7 @@ from .internal.constants import SPAN_API_DATADOG
 from .internal.dogstatsd import get_dogstatsd_client
 from .internal.logger import get_logger
 from .internal.processor import SpanProcessor
+from .internal.processor import _is_noop
 from .internal.processor.trace import BaseServiceProcessor
 from .internal.processor.trace import PeerServiceProcessor
 from .internal.processor.trace import SpanAggregator
@@ -51,6 +56,7 @@ from .internal.processor.trace import TopLevelSpanProcessor
 from .internal.processor.trace import TraceProcessor
 from .internal.processor.trace import TraceSamplingProcessor
 from .internal.processor.trace import TraceTagsProcessor
+from .internal.rate_limiter import SamplingBudget
 from .internal.runtime import get_runtime_id
 from .internal.serverless import has_aws_lambda_agent_extension
 from .internal.serverless import in_aws_lambda
@@ -178,6 +184,60 @@ def _default_span_processors_factory(
     return span_processors, appsec_processor, deferred_processors
 
 
+# Global tags that change more than the tags of a span, or that could clash with the tags set before them.
+_SPAN_DEFAULTS_EXCLUDED_TAGS = frozenset(
+    (MANUAL_DROP_KEY, MANUAL_KEEP_KEY, SERVICE_KEY, PID, HOSTNAME_KEY, "runtime-id")
+)
+
+
+class _SpanDefaults(object):
+    """The tags set on every span by the tracer, resolved once.
+
+    The global tags and the environment are applied to a template span so that
+    new spans only need to copy its tags and metrics. The tags with side
+    effects on the span are still set one by one.
+    """
+
+    __slots__ = ("tags", "env", "meta", "metrics", "tags_to_set")
+
+    def __init__(self, tags, env):
+        # type: (Dict[str, Any], Optional[str]) -> None
+        self.tags = tags
+        self.env = env
+
+        template = Span("")
+        self.tags_to_set = {}  # type: Dict[str, Any]
+        for k, v in tags.items():
+            if k in _SPAN_DEFAULTS_EXCLUDED_TAGS or (isinstance(k, str) and k.startswith("_dd.p.")):
+                self.tags_to_set[k] = v
+            else:
+                template.set_tag(k, v)
+        if env:
+            template.set_tag_str(ENV_KEY, env)
+        self.meta = template._meta
+        self.metrics = template._metrics
+
+
+class _SpanProcessorHooks(object):
+    """The span processor methods called by the tracer, resolved once.
+
+    The hooks are resolved from the processors of the tracer and the globally
+    registered ones, in the order they run. The methods that do nothing are
+    left out.
+    """
+
+    __slots__ = ("generation", "on_span_start", "on_span_finish", "on_spans_finish", "on_dropped_span_finish")
+
+    def __init__(self, processors, generation):
+        # type: (List[SpanProcessor], int) -> None
+        self.generation = generation
+        self.on_span_start = tuple(p.on_span_start for p in processors if not _is_noop(p.on_span_start))
+        finishing = [p for p in processors if not _is_noop(p.on_span_finish)]
+        self.on_span_finish = tuple(p.on_span_finish for p in finishing)
+        self.on_spans_finish = tuple(p.on_spans_finish for p in finishing)
+        self.on_dropped_span_finish = tuple(p.on_span_finish for p in finishing if p._process_dropped_spans)
+
+
 class Tracer(object):
     """
     Tracer is used to create, sample and submit spans that measure the
@@ -212,6 +272,8 @@ class Tracer(object):
 
         # globally set tags
         self._tags = config.tags.copy()
+        self._span_defaults: Optional[_SpanDefaults] = None
+        self._span_processor_hooks: Optional[_SpanProcessorHooks] = None
 
         # collection of services seen, used for runtime metrics tags
         # a buffer for service info so we don't perpetually send the same things
@@ -497,6 +559,7 @@ class Tracer(object):
                 self._agent_url,
                 self._endpoint_call_counter_span_processor,
             )
+            self._span_processor_hooks = None
 
         if context_provider is not None:
             self.context_provider = context_provider
@@ -562,6 +625,7 @@ class Tracer(object):
             self._agent_url,
             self._endpoint_call_counter_span_processor,
         )
+        self._span_processor_hooks = None
 
         self._new_process = True
 
@@ -695,11 +759,19 @@ class Tracer(object):
                 span._parent = parent
                 span._local_root = parent._local_root
 
+                if config._trace_early_drop_enabled and self._is_dropped_early(span):
+                    # The span is only kept to propagate the trace context and to compute stats
+                    span._on_finish_callbacks = [self._on_dropped_span_finish]
+                    if activate:
+                        self.context_provider.activate(span)
+                    return span
+
             if span._local_root is None:
                 span._local_root = span
-            for k, v in _get_metas_to_propagate(context):
-                if k != SAMPLING_DECISION_TRACE_TAG_KEY:
-                    span._meta[k] = v
+            if not getattr(self._writer, "_merges_propagated_tags", False):
+                for k, v in _get_metas_to_propagate(context):
+                    if k != SAMPLING_DECISION_TRACE_TAG_KEY:
+                        span._meta[k] = v
         else:
             # this is the root span of a new trace
             span = Span(
@@ -716,19 +788,25 @@ class Tracer(object):
                 span.set_tag_str(HOSTNAME_KEY, hostname.get_hostname())
 
         if not span._parent:
-            span.set_tag_str("runtime-id", get_runtime_id())
+            span._meta["runtime-id"] = get_runtime_id()
             span._metrics[PID] = self._pid
 
-        # Apply default global tags.
-        if self._tags:
-            span.set_tags(self._tags)
-
-        if config.env:
-            span.set_tag_str(ENV_KEY, config.env)
+        # Apply default global tags and the environment.
+        defaults = self._span_defaults
+        if defaults is None or defaults.tags is not self._tags or defaults.env != config.env:
+            defaults = self._span_defaults = _SpanDefaults(self._tags, config.env)
+        if defaults.meta:
+            span._meta.update(defaults.meta)
+        if defaults.metrics:
+            span._metrics.update(defaults.metrics)
+        if defaults.tags_to_set:
+            span.set_tags(defaults.tags_to_set)
 
         # Only set the version tag on internal spans.
         if config.version:
-            root_span = self.current_root_span()
+            # DEV: the local root of a child span is the root span of its parent,
+            # so there is no need to look up the active span.
+            root_span = parent._local_root if parent is not None else self.current_root_span()
             # if: 1. the span is the root span and the span's service matches the global config; or
             #     2. the span is not the root, but the root span's service matches the span's service
             #        and the root span has a version tag
@@ -750,14 +828,44 @@ class Tracer(object):
 
         # Only call span processors if the tracer is enabled
         if self.enabled:
-            for p in chain(self._span_processors, SpanProcessor.__processors__, self._deferred_processors):
-                p.on_span_start(span)
+            hooks = self._span_processor_hooks
+            if hooks is None or hooks.generation != SpanProcessor._generation:
+                hooks = self._resolve_span_processor_hooks()
+            for on_span_start in hooks.on_span_start:
+                on_span_start(span)
         self._hooks.emit(self.__class__.start_span, span)
 
         return span
 
     start_span = _start_span
 
+    def _is_dropped_early(self, span: Span) -> bool:
+        """Return whether the local child span belongs to a trace that is known to be dropped."""
+        if self._asm_enabled or self._iast_enabled:
+            # The sampling decision can be changed to keep the trace
+            return False
+        if span.sampled:
+            # Rejected traces are only dropped by the tracer when it computes stats
+            priority = span.context.sampling_priority
+            if not self._compute_stats or priority is None or priority > 0:
+                return False
+        return not any(rule.match(span) for rule in self._single_span_sampling_rules)
+
+    def _resolve_span_processor_hooks(self) -> _SpanProcessorHooks:
+        """Resolve the span processor hooks after the processors have changed."""
+        generation = SpanProcessor._generation
+        processors = list(chain(self._span_processors, SpanProcessor.__processors__, self._deferred_processors))
+        hooks = self._span_processor_hooks = _SpanProcessorHooks(processors, generation)
+        return hooks
+
+    def _on_dropped_span_finish(self, span: Span) -> None:
+        if self.enabled:
+            hooks = self._span_processor_hooks
+            if hooks is None or hooks.generation != SpanProcessor._generation:
+                hooks = self._resolve_span_processor_hooks()
+            for on_span_finish in hooks.on_dropped_span_finish:
+                on_span_finish(span)
+
     def _on_span_finish(self, span: Span) -> None:
         active = self.current_span()
         # Debug check: if the finishing span has a parent and its parent
@@ -767,12 +875,47 @@ class Tracer(object):
 
         # Only call span processors if the tracer is enabled
         if self.enabled:
-            for p in chain(self._span_processors, SpanProcessor.__processors__, self._deferred_processors):
-                p.on_span_finish(span)
+            hooks = self._span_processor_hooks
+            if hooks is None or hooks.generation != SpanProcessor._generation:
+                hooks = self._resolve_span_processor_hooks()
+            for on_span_finish in hooks.on_span_finish:
+                on_span_finish(span)
 
         if log.isEnabledFor(logging.DEBUG):
             log.debug("finishing span %s (enabled:%s)", span._pprint(), self.enabled)
 
+    def _finish_spans(self, spans: List[Span], finish_time: Optional[float] = None) -> None:
+        """Finish a batch of spans at once.
+
+        This is an internal API for integrations that finish many spans in a
+        row, like the commands of a pipeline. The span processors receive the
+        spans of this tracer as a single batch, so that they take their locks
+        once. The spans that are already finished are skipped, and the other
+        spans are finished one by one.
+        """
+        finish_time_ns = compat.time_ns() if finish_time is None else int(finish_time * 1e9)
+        on_span_finish = self._on_span_finish
+        batch = []
+        for span in spans:
+            if span.duration_ns is not None:
+                continue
+            callbacks = span._on_finish_callbacks
+            if len(callbacks) != 1 or callbacks[0] != on_span_finish:
+                span._finish_ns(finish_time_ns)
+                continue
+            span.duration_ns = finish_time_ns - (span.start_ns or finish_time_ns)
+            batch.append(span)
+
+        if batch and self.enabled:
+            hooks = self._span_processor_hooks
+            if hooks is None or hooks.generation != SpanProcessor._generation:
+                hooks = self._resolve_span_processor_hooks()
+            for on_spans_finish in hooks.on_spans_finish:
+                on_spans_finish(batch)
+
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("finishing %d spans (enabled:%s)", len(batch), self.enabled)
+
     def _log_compat(self, level, msg):
         """Logs a message for the given level.
 
@@ -890,6 +1033,8 @@ class Tracer(object):
         service: Optional[str] = None,
         resource: Optional[str] = None,
         span_type: Optional[str] = None,
+        hot: bool = False,
+        max_spans_per_second: Optional[float] = None,
     ) -> Callable[[AnyCallable], AnyCallable]:
         """
         A decorator used to trace an entire function. If the traced function
@@ -904,6 +1049,15 @@ class Tracer(object):
                             it will inherit the service from it's parent.
         :param str resource: an optional name of the resource being tracked.
         :param str span_type: an optional operation type.
+        :param bool hot: reduce the overhead of tracing functions that are called
+                         very frequently. The code of the function is instrumented
+                         in place instead of being wrapped in a new function. Only
+                         applies to functions that are not coroutines. The named
+                         parameters of the function are passed to a ``wrap_executor``
+                         as positional arguments.
+        :param float max_spans_per_second: the maximum number of spans created per
+                                           second for the function. The calls over
+                                           the limit are not traced.
 
         >>> @tracer.wrap('my.wrapped.function', service='my.service')
             def run():
@@ -936,6 +1090,7 @@ class Tracer(object):
         def wrap_decorator(f: AnyCallable) -> AnyCallable:
             # FIXME[matt] include the class name for methods.
             span_name = name if name else "%s.%s" % (f.__module__, f.__name__)
+            budget = SamplingBudget(max_spans_per_second) if max_spans_per_second is not None else None
 
             # detect if the the given function is a coroutine to use the
             # right decorator; this initial check ensures that the
@@ -952,11 +1107,17 @@ class Tracer(object):
                     service=service,
                     resource=resource,
                     span_type=span_type,
+                    budget=budget,
                 )
+            elif hot and isinstance(f, FunctionType):
+                func_wrapper = self._wrap_hot(f, span_name, service, resource, span_type, budget)
             else:
 
                 @functools.wraps(f)
                 def func_wrapper(*args, **kwargs):
+                    if budget is not None and not budget.is_allowed():
+                        return f(*args, **kwargs)
+
                     # if a wrap executor has been configured, it is used instead
                     # of the default tracing function
                     if getattr(self, "_wrap_executor", None):
@@ -979,6 +1140,44 @@ class Tracer(object):
 
         return wrap_decorator
 
+    def _wrap_hot(
+        self,
+        f: FunctionType,
+        span_name: str,
+        service: Optional[str],
+        resource: Optional[str],
+        span_type: Optional[str],
+        budget: Optional[SamplingBudget],
+    ) -> FunctionType:
+        """Instrument the code of the function in place to trace its calls.
+
+        The wrapper is called directly by the instrumented code, without an
+        extra Python-level closure, and starts the span without going through
+        ``Tracer.trace``.
+        """
+        from ddtrace.internal.wrapping import wrap as wrap_function
+
+        def traced(wrapped, args, kwargs):
+            if budget is not None and not budget.is_allowed():
+                return wrapped(*args, **kwargs)
+
+            if getattr(self, "_wrap_executor", None):
+                return self._wrap_executor(
+                    self, wrapped, args, kwargs, span_name, service=service, resource=resource, span_type=span_type
+                )
+
+            with self.start_span(
+                span_name,
+                child_of=self.context_provider.active(),
+                service=service,
+                resource=resource,
+                span_type=span_type,
+                activate=True,
+            ):
+                return wrapped(*args, **kwargs)
+
+        return wrap_function(f, traced)
+
     def set_tags(self, tags: Dict[str, str]) -> None:
         """Set some tags at the tracer level.
         This will append those tags to each span created by the tracer.
@@ -986,6 +1185,7 @@ class Tracer(object):
         :param dict tags: dict of tags to set at tracer level
         """
         self._tags.update(tags)
+        self._span_defaults = None
 
     def shutdown(self, timeout: Optional[float] = None) -> None:
         """Shutdown the tracer and flush finished traces. Avoid calling shutdown multiple times.
@@ -1000,6 +1200,7 @@ class Tracer(object):
             deferred_processors = self._deferred_processors
             self._span_processors = []
             self._deferred_processors = []
+            self._span_processor_hooks = None
             for processor in chain(span_processors, SpanProcessor.__processors__, deferred_processors):
                 if hasattr(processor, "shutdown"):
                     processor.shutdown(timeout)
@@ -5,6 +5,7 @@ import msgpack
 import pytest
 
 import ddtrace
+from ddtrace.context import Context
 from ddtrace.contrib.pytest.plugin import is_enabled
 from ddtrace.internal.ci_visibility import CIVisibility
 from ddtrace.internal.ci_visibility.constants import COVERAGE_TAG_NAME
@@ -14,7 +15,9 @@ from ddtrace.internal.ci_visibility.encoder import CIVisibilityCoverageEncoderV0
 from ddtrace.internal.ci_visibility.encoder import CIVisibilityEncoderV01
 from ddtrace.internal.encoding import JSONEncoder
 from ddtrace.span import Span
+from ddtrace.tracer import Tracer
 from tests.ci_visibility.util import _patch_dummy_writer
+from tests.utils import DummyCIVisibilityWriter
 from tests.utils import TracerTestCase
 from tests.utils import override_env
 
@@ -458,3 +461,23 @@ class PytestEncodingTestCase(TracerTestCase):
             b"version": CIVisibilityEncoderV01.TEST_SUITE_EVENT_VERSION,
         }
         assert given_test_session_event == expected_test_session_event
+
+
+def test_encode_traces_civisibility_propagated_tags():
+    writer = DummyCIVisibilityWriter(intake_url="http://localhost:9126")
+    assert not writer._merges_propagated_tags
+    tracer = Tracer()
+    tracer.configure(writer=writer)
+    context = Context(trace_id=1, span_id=2, meta={"_dd.p.usr.id": "abc", "_dd.p.dm": "-4"})
+    with tracer.start_span("test", child_of=context) as root:
+        with tracer.start_span("child", child_of=root) as child:
+            pass
+
+    encoder = CIVisibilityEncoderV01(0, 0)
+    encoder.put([root, child])
+    decoded = msgpack.unpackb(encoder.encode(), raw=True, strict_map_key=False)
+    events = {event[b"content"][b"span_id"]: event[b"content"][b"meta"] for event in decoded[b"events"]}
+    # The child of the remote context carries the sampling decision
+    assert events[root.span_id][b"_dd.p.dm"] == b"-4"
+    assert events[root.span_id][b"_dd.p.usr.id"] == b"abc"
+    assert events[child.span_id][b"_dd.p.usr.id"] == b"abc"
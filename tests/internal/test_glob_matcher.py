@@ -1,6 +1,7 @@
 import pytest
 
 from ddtrace.internal.glob_matching import GlobMatcher
+from ddtrace.internal.glob_matching import glob_to_regex
 
 
 @pytest.mark.parametrize(
@@ -33,3 +34,4 @@ from ddtrace.internal.glob_matching import GlobMatcher
 def test_matching(pattern, string, result):
     glob_matcher = GlobMatcher(pattern)
     assert result == glob_matcher.match(string)
+    assert result == bool(glob_to_regex(pattern).match(string))
@@ -20,3 +20,31 @@ def test_check_traceback_to_frames():
         (this_file, 7, "_x", ""),
         (this_file, 15, "test_check_traceback_to_frames", ""),
     ]
+
+
+class _C(object):
+    def method(self):
+        return sys._getframe()
+
+    @classmethod
+    def class_method(cls):
+        return sys._getframe()
+
+
+def _f(arg):
+    return sys._getframe()
+
+
+def test_pyframe_to_frames_class_name():
+    for frame, class_name in ((_C().method(), "_C"), (_C.class_method(), "_C"), (_f(_C()), "")):
+        frames, _ = _traceback.pyframe_to_frames(frame, 1)
+        assert frames[0].class_name == class_name
+
+
+def test_pyframe_to_frames_shared():
+    frame = sys._getframe()
+    # DEV: convert the stack twice on the same line, the line number of this frame changes otherwise
+    (frames, nframes), (other_frames, other_nframes) = [_traceback.pyframe_to_frames(frame, 10) for _ in range(2)]
+    assert (frames, nframes) == (other_frames, other_nframes)
+    # The frames are shared between the stacks
+    assert all(f is o for f, o in zip(frames, other_frames))
@@ -680,6 +680,19 @@ def test_to_str_none():
     assert id1 == id2 != id_o
 
 
+def test_to_locations_cached():
+    c = pprof._PprofConverter()
+    frames = (("foo.py", 1, "foo", ""), ("bar.py", 2, "bar", "Bar"))
+    locations = c._to_locations(frames, 3)
+    assert len(locations) == 3
+
+    # The locations of a stack are only converted once
+    with mock.patch.object(c, "_to_Location") as to_location:
+        assert c._to_locations(list(frames), 3) is locations
+        assert c._to_locations(frames, 2) != locations
+    assert to_location.call_count == 2
+
+
 @mock.patch("ddtrace.internal.utils.config.get_application_name")
 def test_pprof_exporter(gan):
     gan.return_value = "bonjour"
@@ -1,9 +1,11 @@
 # -*- coding: utf-8 -*-
 import contextlib
+from io import StringIO
 import json
 import random
 import string
 import threading
+import tracemalloc
 from unittest import TestCase
 
 from hypothesis import given
@@ -29,7 +31,9 @@ from ddtrace.internal.encoding import JSONEncoderV2
 from ddtrace.internal.encoding import MsgpackEncoderV03
 from ddtrace.internal.encoding import MsgpackEncoderV05
 from ddtrace.internal.encoding import _EncoderBase
+from ddtrace.internal.writer import LogWriter
 from ddtrace.span import Span
+from ddtrace.tracer import Tracer
 from ddtrace.tracing._span_link import SpanLink
 from tests.utils import DummyTracer
 
@@ -247,9 +251,10 @@ class TestEncoders(TestCase):
         spans = encoder.encode()
         items = encoder._decode(spans)
 
-        # test the encoded output that should be a string
-        # and the output must be flatten
-        assert isinstance(spans, bytes)
+        # test the encoded output that should be a read-only view
+        # of the encoder buffer and the output must be flatten
+        assert isinstance(spans, memoryview)
+        assert spans.readonly
         assert len(items) == 3
         assert len(items[0]) == 2
         assert len(items[1]) == 2
@@ -544,6 +549,60 @@ def test_encoder_propagates_dd_origin(Encoder, item):
     assert all((_[item][_ORIGIN_KEY] == b"ciapp-test" for _ in decoded_trace[0]))
 
 
+@pytest.mark.parametrize(
+    "Encoder,item",
+    [
+        (MsgpackEncoderV03, b"meta"),
+        (MsgpackEncoderV05, 9),
+    ],
+)
+def test_encoder_propagates_trace_meta(Encoder, item):
+    tracer = DummyTracer()
+    encoder = Encoder(1 << 20, 1 << 20)
+    context = Context(trace_id=1, span_id=2, meta={"_dd.p.test": "value", "_dd.p.other": "value", "other": "value"})
+    context._meta["_dd.p.dm"] = "-4"
+    with tracer.start_span("root", child_of=context) as root:
+        with tracer.start_span("child", child_of=root) as child:
+            child.set_tag_str("_dd.p.other", "child-value")
+    trace = tracer._writer.pop()
+
+    # The propagated tags are not copied to each span but are still returned as its tags
+    assert "_dd.p.test" not in child._meta
+    assert child.get_tag("_dd.p.test") == "value"
+    assert child.get_tag("_dd.p.other") == "child-value"
+    assert child.get_tag("_dd.p.dm") is None
+    assert child.get_tags() == {"_dd.p.test": "value", "_dd.p.other": "child-value"}
+
+    encoder.put(trace)
+    [[encoded_root, encoded_child]] = decode(encoder.encode())
+    assert encoded_root[item][b"_dd.p.test"] == b"value"
+    assert encoded_root[item][b"_dd.p.dm"] == b"-4"
+    assert encoded_child[item][b"_dd.p.test"] == b"value"
+    assert encoded_child[item][b"_dd.p.other"] == b"child-value"
+    # The sampling decision and the other tags of the context are only set on the root span
+    assert b"_dd.p.dm" not in encoded_child[item]
+    assert b"other" not in encoded_child[item]
+
+
+@pytest.mark.parametrize("Encoder", [JSONEncoder, JSONEncoderV2])
+def test_json_encoder_propagates_trace_meta(Encoder):
+    tracer = Tracer()
+    tracer.configure(writer=LogWriter(out=StringIO()))
+    context = Context(trace_id=1, span_id=2, meta={"_dd.p.usr.id": "abc", "other": "value"})
+    context._meta["_dd.p.dm"] = "-4"
+    with tracer.start_span("root", child_of=context) as root:
+        with tracer.start_span("child", child_of=root) as child:
+            pass
+
+    assert child.get_tag("_dd.p.usr.id") == "abc"
+    encoded = json.loads(Encoder().encode_traces([[root, child]]))
+    [[encoded_root, encoded_child]] = encoded["traces"] if Encoder is JSONEncoderV2 else encoded
+    assert encoded_root["meta"]["_dd.p.usr.id"] == "abc"
+    assert encoded_child["meta"]["_dd.p.usr.id"] == "abc"
+    assert "_dd.p.dm" not in encoded_child["meta"]
+    assert "other" not in encoded_child["meta"]
+
+
 @allencodings
 @given(
     trace_id=integers(min_value=1, max_value=2**128 - 1),
@@ -694,7 +753,7 @@ def test_msgpack_string_table():
     size = t.size
     encoded = t.flush()
     assert size == len(encoded)
-    assert decode(encoded + b"\xc0", reconstruct=False) == [[b"", _ORIGIN_KEY, b"foobar", b"foobaz"], None]
+    assert decode(bytes(encoded) + b"\xc0", reconstruct=False) == [[b"", _ORIGIN_KEY, b"foobar", b"foobaz"], None]
 
     assert len(t) == 2
     assert "foobar" not in t
@@ -778,6 +837,72 @@ def test_custom_msgpack_encode_thread_safe(encoding):
     assert unpacked is not None
 
 
+def _name_and_service(span):
+    if isinstance(span, tuple):
+        # v0.5
+        return span[1], span[0]
+    return span[b"name"], span[b"service"]
+
+
+@allencodings
+def test_msgpack_encode_payload_outlives_buffer(encoding):
+    encoder = MSGPACK_ENCODERS[encoding](2 << 10, 2 << 10)
+
+    payloads = []
+    for i in range(4):
+        encoder.put([Span(name="name-%d" % i, service="service-%d" % i)])
+        payloads.append(encoder.encode())
+
+    # Payloads that are still referenced are not overwritten by the next ones
+    for i, payload in enumerate(payloads):
+        assert payload.readonly
+        [[span]] = decode(payload, reconstruct=True)
+        assert _name_and_service(span) == (("name-%d" % i).encode(), ("service-%d" % i).encode())
+
+
+@allencodings
+def test_msgpack_encode_reuses_released_buffers(encoding):
+    encoder = MSGPACK_ENCODERS[encoding](2 << 10, 2 << 10)
+
+    encoder.put([Span(name="name", service="service")])
+    payload = encoder.encode()
+    buf = payload.obj
+
+    # The buffer of a payload in use is not reused
+    encoder.put([Span(name="name", service="service")])
+    held = encoder.encode()
+    assert held.obj is not buf
+
+    # The buffer of a payload is reused once the payload is released
+    payload.release()
+    encoder.put([Span(name="other", service="service")])
+    payload = encoder.encode()
+    assert payload.obj is buf
+    [[span]] = decode(payload, reconstruct=True)
+    assert _name_and_service(span)[0] == b"other"
+    [[span]] = decode(held, reconstruct=True)
+    assert _name_and_service(span)[0] == b"name"
+
+
+@allencodings
+def test_msgpack_encode_frees_large_released_buffers(encoding):
+    encoder = MSGPACK_ENCODERS[encoding](128 << 20, 128 << 20)
+    span = Span(name="name", service="service")
+    span.set_tag_str("large", "x" * (8 << 20))
+
+    tracemalloc.start()
+    try:
+        encoder.put([span])
+        payload = encoder.encode()
+        before = tracemalloc.get_traced_memory()[0]
+
+        # The buffers that grew past their initial size are not kept for reuse
+        payload.release()
+        assert before - tracemalloc.get_traced_memory()[0] > 8 << 20
+    finally:
+        tracemalloc.stop()
+
+
 @pytest.mark.subprocess(parametrize={"encoder_cls": ["JSONEncoder", "JSONEncoderV2"]})
 def test_json_encoder_traces_bytes():
     """
@@ -130,3 +130,248 @@ def test_awakeable_periodic_service():
     awake_me.stop()
 
     assert queue == list(range(n + 2))
+
+
+def test_awakeable_periodic_service_no_wait():
+    awaken = Event()
+
+    class AwakeMe(periodic.AwakeablePeriodicService):
+        def periodic(self):
+            # Requests made from the periodic thread itself must not block
+            self.awake(wait=False)
+            awaken.set()
+
+    awake_me = AwakeMe(60)
+    awake_me.start()
+    try:
+        awaken.wait(1)
+        awaken.clear()
+        # The request made on the first run triggers a second run right away
+        assert awaken.wait(1)
+    finally:
+        awake_me.stop()
+        awake_me.join()
+
+
+@pytest.fixture
+def scheduler():
+    return periodic.PeriodicScheduler()
+
+
+@pytest.fixture
+def shared_scheduler():
+    original = periodic.SHARED_SCHEDULER_ENABLED
+    periodic.SHARED_SCHEDULER_ENABLED = True
+    try:
+        yield
+    finally:
+        periodic.SHARED_SCHEDULER_ENABLED = original
+
+
+def test_timer_wheel():
+    wheel = periodic.TimerWheel(tick=1, slots=8, now=0)
+    wheel.add(3.5, "a")
+    wheel.add(20.5, "c")  # due in a later rotation of the wheel
+    wheel.add(2.5, "b")
+    assert len(wheel) == 3
+    assert wheel.next_deadline() == 2.5
+
+    assert wheel.expire(2) == []
+    assert wheel.expire(4) == ["b", "a"]
+    assert wheel.next_deadline() == 20.5
+    assert wheel.expire(12.5) == []
+
+    # Timers in the past expire with the next tick
+    wheel.add(1, "d")
+    assert wheel.next_deadline() == 1
+    assert wheel.expire(13) == ["d"]
+    assert wheel.expire(100) == ["c"]
+    assert len(wheel) == 0
+    assert wheel.next_deadline() is None
+
+
+@pytest.mark.parametrize("workers", [0, 1, 2])
+def test_scheduled_task(workers):
+    x = {"OK": 0}
+
+    task_started = Event()
+    task_continue = Event()
+
+    def _run_periodic():
+        task_started.set()
+        x["OK"] += 1
+        task_continue.wait()
+
+    def _on_shutdown():
+        x["DOWN"] = True
+
+    t = periodic.ScheduledTask(
+        0.001, _run_periodic, on_shutdown=_on_shutdown, scheduler=periodic.PeriodicScheduler(workers)
+    )
+    assert not t.is_alive()
+    t.start()
+    task_started.wait()
+    task_continue.set()
+    assert t.is_alive()
+    t.stop()
+    t.join()
+    assert not t.is_alive()
+    assert x["OK"]
+    assert x["DOWN"]
+
+    with pytest.raises(RuntimeError):
+        t.start()
+
+
+def test_scheduled_task_error(scheduler):
+    x = {"OK": False}
+
+    def _run_periodic():
+        raise ValueError
+
+    def _on_shutdown():
+        x["DOWN"] = True
+
+    t = periodic.ScheduledTask(0.001, _run_periodic, on_shutdown=_on_shutdown, scheduler=scheduler)
+    t.start()
+    t.join(1)
+    assert not t.is_alive()
+    assert "DOWN" not in x
+
+
+def test_scheduled_tasks_share_threads(scheduler):
+    n = 20
+    runs = {i: 0 for i in range(n)}
+    idents = set()
+
+    def target(i):
+        def _():
+            idents.add(threading.get_ident())
+            runs[i] += 1
+
+        return _
+
+    tasks = [periodic.ScheduledTask(0.01, target(i), scheduler=scheduler) for i in range(n)]
+    for task in tasks:
+        task.start()
+    sleep(0.3)
+    for task in tasks:
+        task.stop()
+    for task in tasks:
+        task.join()
+
+    assert all(runs.values())
+    # A scheduler thread and a worker thread
+    assert len(scheduler._threads) == 2
+    assert len(idents) == 1
+
+
+def test_scheduled_task_interval(scheduler):
+    runs = []
+    ran = Event()
+
+    def _run_periodic():
+        runs.append(len(runs))
+        # The new interval is used from the next run, like for threads
+        t.interval = 60
+        ran.set()
+
+    t = periodic.ScheduledTask(0.01, _run_periodic, scheduler=scheduler)
+    t.start()
+    assert ran.wait(1)
+    sleep(0.1)
+    t.stop()
+    t.join()
+    assert runs == [0]
+
+
+def test_periodic_service_shared_scheduler(shared_scheduler):
+    queue = []
+
+    class AwakeMe(periodic.AwakeablePeriodicService):
+        def periodic(self):
+            queue.append(len(queue))
+
+    interval = 1
+
+    awake_me = AwakeMe(interval)
+    awake_me.start()
+    assert isinstance(awake_me._worker, periodic.AwakeableScheduledTask)
+
+    # Manually awake the service
+    n = 10
+    for _ in range(10):
+        awake_me.awake()
+
+    # Sleep long enough to also trigger the periodic function with the timeout
+    sleep(1.1 * interval)
+
+    awake_me.stop()
+    awake_me.join()
+
+    assert queue == list(range(n + 2))
+
+
+def test_awakeable_periodic_service_no_wait_shared_scheduler(shared_scheduler):
+    awaken = Event()
+
+    class AwakeMe(periodic.AwakeablePeriodicService):
+        def periodic(self):
+            # Requests made from the periodic task itself must not block
+            self.awake(wait=False)
+            awaken.set()
+
+    awake_me = AwakeMe(60)
+    awake_me.start()
+    try:
+        awaken.wait(1)
+        awaken.clear()
+        # The request made on the first run triggers a second run right away
+        assert awaken.wait(1)
+    finally:
+        awake_me.stop()
+        awake_me.join()
+
+
+@pytest.mark.subprocess(env=dict(DD_PERIODIC_SHARED_SCHEDULER_ENABLED="true"))
+def test_periodic_service_shared_scheduler_fork():
+    import os
+    import threading
+    import time
+
+    from ddtrace.internal import periodic
+
+    class Counter(periodic.PeriodicService):
+        runs = 0
+
+        def periodic(self):
+            self.runs += 1
+
+    parent = Counter(0.01)
+    parent.start()
+    time.sleep(0.1)
+    assert parent.runs
+
+    pid = os.fork()
+    if pid == 0:
+        # The task of the parent does not run in the child
+        assert not parent._worker.is_alive()
+        parent.stop()
+        parent.join()
+
+        child = Counter(0.01)
+        child.start()
+        time.sleep(0.1)
+        child.stop()
+        child.join()
+        assert child.runs
+        # The threads of the scheduler have been restarted
+        assert all(t.is_alive() for t in periodic.get_scheduler()._threads)
+        os._exit(0)
+
+    _, status = os.waitpid(pid, 0)
+    assert os.WEXITSTATUS(status) == 0
+
+    parent.stop()
+    parent.join()
+    assert len([t for t in threading.enumerate() if "PeriodicScheduler" in t.name]) == 2
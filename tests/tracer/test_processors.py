@@ -35,6 +35,7 @@ from ddtrace.internal.processor.truncator import NormalizeSpanProcessor
 from ddtrace.internal.processor.truncator import TruncateSpanProcessor
 from ddtrace.internal.sampling import SamplingMechanism
 from ddtrace.internal.sampling import SpanSamplingRule
+from ddtrace.internal.writer import AgentWriter
 from tests.utils import DummyTracer
 from tests.utils import DummyWriter
 from tests.utils import override_global_config
@@ -252,6 +253,286 @@ def test_aggregator_partial_flush_2_spans():
     assert parent.get_metric("_dd.py.partial_flush") is None
 
 
+def test_aggregator_sharded():
+    writer = DummyWriter()
+    aggr = SpanAggregator(
+        partial_flush_enabled=False, partial_flush_min_spans=0, trace_processors=[], writer=writer, num_shards=4
+    )
+    assert len(aggr._shards) == 4
+
+    parents = [Span("parent", trace_id=i, on_finish=[aggr.on_span_finish]) for i in range(1, 9)]
+    children = []
+    for parent in parents:
+        aggr.on_span_start(parent)
+        child = Span("child", trace_id=parent.trace_id, parent_id=parent.span_id, on_finish=[aggr.on_span_finish])
+        aggr.on_span_start(child)
+        children.append(child)
+
+    # Each shard holds only the traces that hash to it
+    for n, shard in enumerate(aggr._shards):
+        assert sorted(shard.traces) == [p.trace_id for p in parents if p.trace_id % 4 == n]
+
+    for parent, child in zip(parents, children):
+        child.finish()
+        assert writer.pop() == []
+        parent.finish()
+        assert writer.pop() == [parent, child]
+
+    assert all(not shard.traces for shard in aggr._shards)
+
+
+def test_aggregator_sharded_threads():
+    import threading
+
+    writer = DummyWriter()
+    aggr = SpanAggregator(
+        partial_flush_enabled=False, partial_flush_min_spans=0, trace_processors=[], writer=writer, num_shards=8
+    )
+
+    def trace():
+        for _ in range(50):
+            root = Span("root", on_finish=[aggr.on_span_finish])
+            aggr.on_span_start(root)
+            for _ in range(5):
+                child = Span("child", trace_id=root.trace_id, parent_id=root.span_id, on_finish=[aggr.on_span_finish])
+                aggr.on_span_start(child)
+                child.finish()
+            root.finish()
+
+    threads = [threading.Thread(target=trace) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    traces = writer.pop_traces()
+    assert len(traces) == 8 * 50
+    assert all(len(t) == 6 for t in traces)
+    assert all(not shard.traces for shard in aggr._shards)
+
+
+def test_aggregator_invalid_shards():
+    with pytest.raises(ValueError):
+        SpanAggregator(
+            partial_flush_enabled=False,
+            partial_flush_min_spans=0,
+            trace_processors=[],
+            writer=DummyWriter(),
+            num_shards=0,
+        )
+
+
+@pytest.mark.parametrize("async_processing", [False, True])
+def test_aggregator_dropped_trace(async_processing):
+    class DropProc(TraceProcessor):
+        def process_trace(self, trace):
+            return None
+
+    if async_processing:
+        writer = AgentWriter("http://localhost:8126", async_processing=True)
+        writer._put = mock.Mock()
+    else:
+        writer = mock.Mock()
+    aggr = SpanAggregator(
+        partial_flush_enabled=False, partial_flush_min_spans=0, trace_processors=[DropProc()], writer=writer
+    )
+
+    with mock.patch("ddtrace.internal.telemetry.telemetry_writer.add_count_metric") as mock_tm:
+        for _ in range(150):
+            span = Span("span", on_finish=[aggr.on_span_finish])
+            aggr.on_span_start(span)
+            span.finish()
+        if async_processing:
+            writer._process_pending()
+            assert len(writer._encoder) == 0
+            writer.stop()
+        else:
+            # Dropped traces are not written
+            writer.write.assert_not_called()
+
+    # The spans of dropped traces are not reported as finished
+    assert not [c for c in mock_tm.call_args_list if c[0][1] == "spans_finished"]
+
+
+def test_aggregator_async_writer():
+    class Proc(TraceProcessor):
+        def process_trace(self, trace):
+            return trace
+
+    proc = mock.Mock(wraps=Proc())
+    writer = AgentWriter("http://localhost:8126", async_processing=True)
+    writer._put = mock.Mock()
+    aggr = SpanAggregator(
+        partial_flush_enabled=False, partial_flush_min_spans=0, trace_processors=[proc], writer=writer
+    )
+
+    span = Span("span", on_finish=[aggr.on_span_finish])
+    aggr.on_span_start(span)
+    span.finish()
+
+    # The trace processors are deferred to the writer
+    proc.process_trace.assert_not_called()
+    assert len(writer._pending) == 1
+
+    writer._process_pending()
+    proc.process_trace.assert_called_once_with([span])
+    assert len(writer._encoder) == 1
+    writer.stop()
+
+
+def test_aggregator_max_traces():
+    writer = DummyWriter()
+    aggr = SpanAggregator(
+        partial_flush_enabled=False, partial_flush_min_spans=0, trace_processors=[], writer=writer, max_traces=2
+    )
+
+    with mock.patch("ddtrace.internal.telemetry.telemetry_writer.add_count_metric") as mock_tm:
+        roots = []
+        for i in range(1, 4):
+            root = Span("root", trace_id=i, on_finish=[aggr.on_span_finish])
+            aggr.on_span_start(root)
+            child = Span("child", trace_id=i, parent_id=root.span_id, on_finish=[aggr.on_span_finish])
+            aggr.on_span_start(child)
+            child.finish()
+            roots.append(root)
+
+        # The oldest trace is evicted, and its finished spans are flushed
+        assert list(aggr._shards[0].traces) == [2, 3]
+        [evicted] = writer.pop_traces()
+        assert [s.name for s in evicted] == ["child"]
+        assert evicted[0].get_metric("_dd.py.partial_flush") == 1
+        mock_tm.assert_has_calls(
+            [
+                mock.call("tracers", "traces_evicted", 1, tags=(("reason", "max_traces"),)),
+                mock.call("tracers", "spans_evicted", 1, tags=(("reason", "max_traces"),)),
+            ]
+        )
+
+    # The unfinished spans of the evicted trace are flushed on their own
+    roots[0].finish()
+    assert writer.pop_traces() == [[roots[0]]]
+    assert list(aggr._shards[0].traces) == [2, 3]
+
+
+def test_aggregator_max_spans_per_trace():
+    writer = DummyWriter()
+    aggr = SpanAggregator(
+        partial_flush_enabled=False,
+        partial_flush_min_spans=0,
+        trace_processors=[],
+        writer=writer,
+        max_spans_per_trace=4,
+    )
+
+    root = Span("root", on_finish=[aggr.on_span_finish])
+    aggr.on_span_start(root)
+    children = []
+    for _ in range(3):
+        child = Span("child", trace_id=root.trace_id, parent_id=root.span_id, on_finish=[aggr.on_span_finish])
+        aggr.on_span_start(child)
+        children.append(child)
+    children[0].finish()
+    assert writer.pop() == []
+
+    # The finished spans are flushed when the trace grows past the limit
+    child = Span("child", trace_id=root.trace_id, parent_id=root.span_id, on_finish=[aggr.on_span_finish])
+    aggr.on_span_start(child)
+    assert writer.pop() == [children[0]]
+    assert len(aggr._shards[0].traces[root.trace_id].spans) == 4
+
+    # The trace is evicted when its unfinished spans exceed the limit
+    aggr.on_span_start(Span("child", trace_id=root.trace_id, parent_id=root.span_id))
+    assert root.trace_id not in aggr._shards[0].traces
+    assert writer.pop() == []
+
+
+def test_aggregator_span_started_after_eviction():
+    writer = DummyWriter()
+    aggr = SpanAggregator(
+        partial_flush_enabled=False,
+        partial_flush_min_spans=0,
+        trace_processors=[],
+        writer=writer,
+        max_spans_per_trace=2,
+    )
+
+    root = Span("root", on_finish=[aggr.on_span_finish])
+    aggr.on_span_start(root)
+    children = []
+    for i in range(3):
+        child = Span("c%d" % i, trace_id=root.trace_id, parent_id=root.span_id, on_finish=[aggr.on_span_finish])
+        aggr.on_span_start(child)
+        children.append(child)
+    # The trace is evicted when the third span starts, the last child starts a new entry
+    assert aggr._shards[0].traces[root.trace_id].spans == [children[2]]
+
+    # A span of the evicted trace started after the eviction joins the new entry
+    late = Span("late", trace_id=root.trace_id, parent_id=root.span_id, on_finish=[aggr.on_span_finish])
+    aggr.on_span_start(late)
+
+    # The spans of the evicted trace are written on their own when they finish
+    root.finish()
+    assert writer.pop_traces() == [[root]]
+    children[0].finish()
+    assert writer.pop_traces() == [[children[0]]]
+    assert aggr._shards[0].traces[root.trace_id].spans == [children[2], late]
+
+    late.finish()
+    assert writer.pop_traces() == []
+    children[2].finish()
+    assert writer.pop_traces() == [[children[2], late]]
+    assert root.trace_id not in aggr._shards[0].traces
+
+
+def test_aggregator_max_trace_age():
+    writer = DummyWriter()
+    aggr = SpanAggregator(
+        partial_flush_enabled=False, partial_flush_min_spans=0, trace_processors=[], writer=writer, max_trace_age=10.0
+    )
+
+    old = Span("old", trace_id=1, on_finish=[aggr.on_span_finish])
+    aggr.on_span_start(old)
+    aggr.on_span_start(Span("recent", trace_id=2))
+    traces = aggr._shards[0].traces
+    traces[1].created, traces[2].created = 100.0, 105.0
+    with mock.patch("ddtrace.internal.compat.monotonic", return_value=111.0):
+        aggr.on_span_start(Span("new", trace_id=3))
+
+    # Only the traces older than the maximum age are evicted
+    assert list(aggr._shards[0].traces) == [2, 3]
+    old.finish()
+    assert writer.pop() == [old]
+
+
+@pytest.mark.parametrize("num_shards", [1, 4])
+def test_aggregator_spans_finish(num_shards):
+    writer = DummyWriter()
+    aggr = SpanAggregator(
+        partial_flush_enabled=False,
+        partial_flush_min_spans=0,
+        trace_processors=[],
+        writer=writer,
+        num_shards=num_shards,
+    )
+
+    spans = []
+    for i in range(1, 9):
+        root = Span("root", trace_id=i)
+        child = Span("child", trace_id=i, parent_id=root.span_id)
+        aggr.on_span_start(root)
+        aggr.on_span_start(child)
+        spans.extend((child, root))
+    for span in spans:
+        span.finished = True
+
+    # The unfinished traces are kept, the finished ones are written
+    aggr.on_spans_finish(spans[:-1])
+    assert sorted(t[0].trace_id for t in writer.pop_traces()) == list(range(1, 8))
+    aggr.on_spans_finish(spans[-1:])
+    assert writer.pop_traces() == [[spans[-1], spans[-2]]]
+    assert all(not shard.traces for shard in aggr._shards)
+
+
 def test_trace_top_level_span_processor_partial_flushing():
     """Parent span and child span have the same service name"""
     tracer = Tracer()
@@ -4,6 +4,7 @@ import logging
 import os
 import pickle
 
+import mock
 import pytest
 
 from ddtrace.context import Context
@@ -12,6 +13,7 @@ from ddtrace.internal.constants import _PROPAGATION_STYLE_W3C_TRACECONTEXT
 from ddtrace.internal.constants import PROPAGATION_STYLE_B3_MULTI
 from ddtrace.internal.constants import PROPAGATION_STYLE_B3_SINGLE
 from ddtrace.internal.constants import PROPAGATION_STYLE_DATADOG
+from ddtrace.propagation import http
 from ddtrace.propagation._utils import get_wsgi_header
 from ddtrace.propagation.http import _HTTP_BAGGAGE_PREFIX
 from ddtrace.propagation.http import _HTTP_HEADER_B3_FLAGS
@@ -27,6 +29,9 @@ from ddtrace.propagation.http import HTTP_HEADER_PARENT_ID
 from ddtrace.propagation.http import HTTP_HEADER_SAMPLING_PRIORITY
 from ddtrace.propagation.http import HTTP_HEADER_TRACE_ID
 from ddtrace.propagation.http import HTTPPropagator
+from ddtrace.propagation.http import _B3MultiHeader
+from ddtrace.propagation.http import _B3SingleHeader
+from ddtrace.propagation.http import _DatadogMultiHeader
 from ddtrace.propagation.http import _TraceContext
 from ddtrace.span import _get_64_lowest_order_bits_as_int
 from ddtrace.tracing._span_link import SpanLink
@@ -263,6 +268,50 @@ def test_inject_tags_previous_error(tracer):  # noqa: F811
         assert _HTTP_HEADER_TAGS not in headers
 
 
+def _render_headers(span_context):
+    headers = {}
+    for propagator in (_DatadogMultiHeader, _B3MultiHeader, _B3SingleHeader, _TraceContext):
+        propagator._inject(span_context, headers)
+    return headers
+
+
+def test_inject_cached_headers(tracer):  # noqa: F811
+    styles = [PROPAGATION_STYLE_DATADOG, PROPAGATION_STYLE_B3_MULTI, PROPAGATION_STYLE_B3_SINGLE, "tracecontext"]
+    meta = {"_dd.p.dm": "-4", "_dd.p.test": "value"}
+    ctx = Context(trace_id=(2**64 + 1234), sampling_priority=1, dd_origin="synthetics", meta=meta)
+    tracer.context_provider.activate(ctx)
+    with override_global_config(dict(_propagation_style_inject=styles)), mock.patch(
+        "ddtrace.propagation.http._render_injected_headers", wraps=http._render_injected_headers
+    ) as render:
+        with tracer.trace("root") as root:
+            spans = [tracer.start_span("child", child_of=root) for _ in range(3)]
+            for span in spans:
+                headers = {}
+                HTTPPropagator.inject(span.context, headers)
+                assert headers == _render_headers(span.context)
+                assert headers[HTTP_HEADER_PARENT_ID] == str(span.span_id)
+                assert headers[_HTTP_HEADER_TRACEPARENT].split("-")[2] == "{:016x}".format(span.span_id)
+                span.finish()
+
+            # The headers are rendered once for all the spans of the trace
+            assert render.call_count == 1
+
+            # The headers are rendered again when the state of the trace changes
+            for update in (
+                lambda: setattr(root.context, "sampling_priority", 2),
+                lambda: setattr(root.context, "dd_origin", "rum"),
+                lambda: root.context._meta.__setitem__("_dd.p.test", "other"),
+            ):
+                update()
+                headers = {}
+                HTTPPropagator.inject(root.context, headers)
+                assert headers == _render_headers(root.context)
+            assert render.call_count == 4
+            assert headers[HTTP_HEADER_SAMPLING_PRIORITY] == "2"
+            assert headers[HTTP_HEADER_ORIGIN] == "rum"
+            assert "_dd.p.test=other" in headers[_HTTP_HEADER_TAGS]
+
+
 def test_extract(tracer):  # noqa: F811
     headers = {
         "x-datadog-trace-id": "1234",
@@ -775,6 +824,32 @@ def test_extract_traceparent(caplog, headers, expected_tuple, expected_logging,
                 assert expected_log in caplog.text
 
 
+@pytest.mark.parametrize(
+    "traceparent",
+    [
+        "00-80f198ee56343ba864fe8b2a57d3eff7-e457b5a2e4d86bd1-01",
+        "01-80f198ee56343ba864fe8b2a57d3eff7-e457b5a2e4d86bd1-00-future",
+        "01-80f198ee56343ba864fe8b2a57d3eff7-e457b5a2e4d86bd1-00-",
+        "01-80f198ee56343ba864fe8b2a57d3eff7-e457b5a2e4d86bd1-00-a\nb",
+        "01-80f198ee56343ba864fe8b2a57d3eff7-e457b5a2e4d86bd1-00x",
+        "00-80f198ee56343ba864fe8b2a57d3eff7-e457b5a2e4d86bd1-0",
+        "00-80f198ee56343ba864fe8b2a57d3eff-7e457b5a2e4d86bd1-01",
+        "00-80F198EE56343BA864FE8B2A57D3EFF7-E457B5A2E4D86BD1-01",
+        "00-80f198ee56343ba864fe8b2a57d3eff7-e457b5a2e4d86bd1-0g",
+        "00-80f198ee-6343ba864fe8b2a57d3eff7-e457b5a2e4d86bd1-01",
+        "",
+    ],
+)
+def test_parse_traceparent(traceparent):
+    import re
+
+    from ddtrace.propagation.http import _parse_traceparent
+
+    # The expression the traceparents used to be matched with
+    match = re.match(r"^([a-f0-9]{2})-([a-f0-9]{32})-([a-f0-9]{16})-([a-f0-9]{2})(-.+)?$", traceparent)
+    assert _parse_traceparent(traceparent) == (match.groups() if match else None)
+
+
 @pytest.mark.parametrize(
     "ts_string,expected_tuple,expected_logging,expected_exception",
     [
@@ -2552,3 +2627,29 @@ print(json.dumps(headers))
 
     result = json.loads(stdout.decode())
     assert result == expected_headers
+
+
+def test_extract_header_table():
+    from ddtrace.propagation import http
+
+    styles = [PROPAGATION_STYLE_B3_SINGLE, PROPAGATION_STYLE_DATADOG]
+    headers = {
+        get_wsgi_header(HTTP_HEADER_TRACE_ID): "1234",
+        "X-Datadog-Parent-Id": "5678",
+        _HTTP_HEADER_TRACEPARENT: "00-80f198ee56343ba864fe8b2a57d3eff7-e457b5a2e4d86bd1-01",
+        "Content-Type": "text/plain",
+    }
+    with override_global_config(dict(_propagation_style_extract=styles)):
+        table = http._get_extract_header_table()
+        # The table is only built again when the styles change
+        assert http._get_extract_header_table() is table
+        # The headers of the styles that are not configured are ignored
+        assert table.collect(headers) == {HTTP_HEADER_TRACE_ID: "1234", HTTP_HEADER_PARENT_ID: "5678"}
+
+        context = HTTPPropagator.extract(headers)
+        assert context.trace_id == 1234
+        assert context.span_id == 5678
+
+    with override_global_config(dict(_propagation_style_extract=[_PROPAGATION_STYLE_W3C_TRACECONTEXT])):
+        assert http._get_extract_header_table() is not table
+        assert HTTPPropagator.extract(headers).span_id == 0xE457B5A2E4D86BD1
@@ -282,3 +282,57 @@ def test_span_api_fork():
             q.put(child_ids)
         finally:
             os._exit(0)
+
+
+def _batched_rand64bits(n):
+    ids = []
+    for _ in range(n):
+        try:
+            ids.append(_rand.pop_rand64bits())
+        except IndexError:
+            ids.append(_rand.refill_rand64bits())
+    return ids
+
+
+def test_batched_random():
+    ids_list = _batched_rand64bits(2**16)
+    ids = set(ids_list)
+    assert len(ids) == len(ids_list), "Collisions found in ids"
+    assert all(0 <= n <= 2**64 - 1 for n in ids)
+
+
+def test_batched_threadsafe():
+    q = Queue()
+
+    ts = [threading.Thread(target=lambda: q.put(_batched_rand64bits(200000))) for _ in range(5)]
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+
+    ids_list = []
+    while not q.empty():
+        ids_list.extend(q.get())
+    assert len(ids_list) == 5 * 200000
+    assert len(set(ids_list)) == len(ids_list), "Collisions found in ids"
+
+
+def test_batched_fork():
+    q = MPQueue()
+    # Make sure that there are pre-generated IDs left when forking
+    _rand.refill_rand64bits()
+    pid = os.fork()
+
+    if pid > 0:
+        # parent
+        rns = set(_batched_rand64bits(100))
+        child_rns = q.get()
+
+        assert rns & child_rns == set()
+
+    else:
+        # child
+        try:
+            q.put(set(_batched_rand64bits(100)))
+        finally:
+            os._exit(0)
@@ -7,6 +7,7 @@ from ddtrace.internal import compat
 from ddtrace.internal.rate_limiter import BudgetRateLimiterWithJitter
 from ddtrace.internal.rate_limiter import RateLimiter
 from ddtrace.internal.rate_limiter import RateLimitExceeded
+from ddtrace.internal.rate_limiter import SamplingBudget
 
 
 def nanoseconds(x):
@@ -259,3 +260,17 @@ def test_rate_limiter_with_jitter_not_raise():
     limiter = BudgetRateLimiterWithJitter(limit_rate=1, raise_on_exceed=False)
 
     assert [limiter.limit(lambda: None) for _ in range(10)][1:] == [RateLimitExceeded] * 9
+
+
+@pytest.mark.parametrize("rate_limit", [0, 0.5, 1, 10, 100])
+def test_sampling_budget(rate_limit):
+    now = compat.monotonic()
+    with mock.patch.object(compat, "monotonic", return_value=now) as monotonic:
+        budget = SamplingBudget(rate_limit)
+
+        for second in range(1, 4):
+            # Up to the allowed limit is allowed, with at least one call when the rate is lower than 1
+            allowed = sum(budget.is_allowed() for _ in range(1000))
+            assert allowed == (max(int(rate_limit), 1) if rate_limit else 0)
+
+            monotonic.return_value = now + second * max(1.0, 1.0 / rate_limit if rate_limit else 0)
@@ -1,5 +1,6 @@
 from __future__ import division
 
+import random
 import re
 import unittest
 
@@ -19,6 +20,8 @@ from ddtrace.context import Context
 from ddtrace.internal.rate_limiter import RateLimiter
 from ddtrace.internal.sampling import SAMPLING_DECISION_TRACE_TAG_KEY
 from ddtrace.internal.sampling import SamplingMechanism
+from ddtrace.internal.sampling import SamplingRuleMatcher
+from ddtrace.internal.sampling import _get_highest_precedence_rule_matching
 from ddtrace.internal.sampling import set_sampling_decision_maker
 from ddtrace.sampler import DatadogSampler
 from ddtrace.sampler import RateByServiceSampler
@@ -629,6 +632,92 @@ def test_sampling_rule_matches_exception():
         )
 
 
+def test_sampling_rule_matches_all_tags():
+    rule = SamplingRule(sample_rate=1.0, tags={"a": "x*", "b": "y?"})
+
+    span = create_span()
+    span.set_tag("a", "xyz")
+    span.set_tag("b", "yz")
+    assert rule.matches(span) is True
+
+    # Every tag must match, not only the last one
+    span.set_tag("a", "abc")
+    assert rule.matches(span) is False
+
+
+def _random_sampling_rules(rng, n):
+    def pattern(values):
+        values = [value for value in values if value is not None]
+        kind = rng.randint(0, 4)
+        if kind == 0:
+            return SamplingRule.NO_RULE
+        if kind == 1:
+            return re.compile(re.escape(rng.choice(values)[:2]))
+        if kind == 2:
+            value = rng.choice(values)
+            return lambda prop: prop is not None and prop.endswith(value[-1])
+        return rng.choice(values)
+
+    rules = []
+    for _ in range(n):
+        tags = SamplingRule.NO_RULE
+        if rng.random() < 0.3:
+            tags = {rng.choice(TAG_KEYS): rng.choice(["*", "v?", "v1*", "v2", "x*"]) for _ in range(rng.randint(1, 2))}
+        rules.append(
+            SamplingRule(
+                sample_rate=rng.random(),
+                service=pattern(SERVICES),
+                name=pattern(NAMES),
+                resource=pattern(RESOURCES),
+                tags=tags,
+            )
+        )
+    return rules
+
+
+SERVICES = ["svc-a", "svc-b", "db-c", None]
+NAMES = ["web.request", "db.query", "cache.get"]
+RESOURCES = ["GET /", "POST /users", "SELECT 1"]
+TAG_KEYS = ["k1", "k2", "k3"]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_sampling_rule_matcher(seed):
+    rng = random.Random(seed)
+    rules = _random_sampling_rules(rng, 500)
+    matcher = SamplingRuleMatcher(rules, cache_size=16)
+
+    for _ in range(1000):
+        span = Span(rng.choice(NAMES), service=rng.choice(SERVICES), resource=rng.choice(RESOURCES))
+        for key in rng.sample(TAG_KEYS, rng.randint(0, len(TAG_KEYS))):
+            span.set_tag(key, rng.choice(["v1", "v2", "v12", "x"]))
+        assert matcher.match(span) is _get_highest_precedence_rule_matching(span, rules)
+        assert len(matcher._cache) <= 16
+
+
+def test_sampling_rule_matcher_opaque_rules():
+    rules = [SamplingRule(sample_rate=0.1, service="other"), NoMatch(0.2), MatchSample(0.3), SamplingRule(0.4)]
+    matcher = SamplingRuleMatcher(rules)
+
+    assert matcher.match(create_span(service="other")) is rules[0]
+    assert matcher.match(create_span(service="svc")) is rules[2]
+    # Rules that override matching cannot be cached
+    assert not matcher._cache
+
+
+def test_datadog_sampler_recompiles_rules():
+    sampler = DatadogSampler(rules=[SamplingRule(sample_rate=0.5, service="a")])
+    span = create_span(service="b")
+    sampler.sample(span)
+    assert span.get_metric(SAMPLING_RULE_DECISION) is None
+
+    rule = SamplingRule(sample_rate=0.25, service="b")
+    sampler.rules.append(rule)
+    span = create_span(service="b")
+    sampler.sample(span)
+    assert span.get_metric(SAMPLING_RULE_DECISION) == 0.25
+
+
 @pytest.mark.subprocess(
     parametrize={"DD_TRACE_128_BIT_TRACEID_GENERATION_ENABLED": ["true", "false"]},
 )
@@ -0,0 +1,234 @@
+import random
+import threading
+
+from ddsketch.pb.proto import DDSketchProto
+import mock
+import pytest
+
+from ddtrace.constants import SPAN_MEASURED_KEY
+from ddtrace.internal.processor import stats
+from ddtrace.internal.processor.stats import SpanStatsProcessorV06
+from ddtrace.internal.processor.stats import _CompactSketch
+from ddtrace.internal.processor.stats import _new_sketch
+from ddtrace.span import Span
+
+
+@pytest.fixture
+def processor_factory():
+    processors = []
+
+    def factory(**kwargs):
+        processor = SpanStatsProcessorV06("http://localhost:8126", interval=10.0, **kwargs)
+        processor.stop()
+        processor.join()
+        processors.append(processor)
+        return processor
+
+    yield factory
+
+
+def _spans(n, seed=0):
+    rng = random.Random(seed)
+    spans = []
+    for i in range(n):
+        span = Span(
+            "name-%d" % rng.randint(0, 3),
+            service="service-%d" % rng.randint(0, 1),
+            resource="resource-%d" % rng.randint(0, 5),
+            span_id=i + 1,
+            parent_id=rng.choice([None, i]),
+            start=1_000 + rng.random() * 30,
+        )
+        if span.parent_id is None:
+            span._local_root = span
+        else:
+            span.set_metric(SPAN_MEASURED_KEY, rng.randint(0, 1))
+        span.set_tag("http.status_code", rng.choice([200, 404, 500]))
+        span.error = rng.randint(0, 1)
+        span.finish(span.start + rng.random())
+        spans.append(span)
+    return spans
+
+
+def _sketch(distribution):
+    sketch = distribution.to_sketch()
+    return sketch.count, [sketch.get_quantile_value(q) for q in (0.5, 0.75, 0.99)]
+
+
+def _aggregated(processor):
+    # DEV: the dense stores of the sketches depend on the order the values are
+    # added in, so compare the distributions rather than their serialization.
+    if processor._batched:
+        processor._aggregate_batches()
+    aggregated = {
+        (bucket_time_ns, key): (
+            stats.hits,
+            stats.top_level_hits,
+            stats.duration,
+            stats.errors,
+            _sketch(stats.ok_distribution),
+            _sketch(stats.err_distribution),
+        )
+        for bucket_time_ns, bucket in processor._buckets.items()
+        for key, stats in bucket.items()
+    }
+    processor._serialize_buckets()
+    return aggregated
+
+
+@pytest.mark.parametrize("numpy_min_records", [1, 1 << 30])
+def test_span_stats_batched(processor_factory, numpy_min_records):
+    if numpy_min_records == 1:
+        pytest.importorskip("numpy")
+
+    spans = _spans(2000)
+    processor = processor_factory(batched=False)
+    batched_processor = processor_factory(batched=True)
+
+    with mock.patch.object(stats, "_NUMPY_MIN_RECORDS", numpy_min_records):
+        for span in spans:
+            processor.on_span_finish(span)
+            batched_processor.on_span_finish(span)
+
+        # Nothing is aggregated until the stats are flushed
+        assert not batched_processor._buckets
+
+        expected = _aggregated(processor)
+        assert len(expected) > 1
+        assert _aggregated(batched_processor) == expected
+
+
+def test_span_stats_batched_threads(processor_factory):
+    spans = _spans(1000)
+    processor = processor_factory(batched=False)
+    batched_processor = processor_factory(batched=True)
+
+    for span in spans:
+        processor.on_span_finish(span)
+
+    threads = [
+        threading.Thread(target=lambda chunk: [batched_processor.on_span_finish(s) for s in chunk], args=(spans[i::4],))
+        for i in range(4)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(batched_processor._recorders) == 4
+    assert _aggregated(batched_processor) == _aggregated(processor)
+    # The recorders of the threads that have not recorded since the previous flush are discarded
+    assert len(batched_processor._recorders) == 4
+    batched_processor._aggregate_batches()
+    assert batched_processor._recorders == {}
+
+
+def test_span_stats_batched_late_records(processor_factory):
+    span = Span("name", service="service", resource="resource", start=1_000)
+    span._local_root = span
+    span.finish(1_001)
+    late_span = Span("name", service="service", resource="late-resource", start=1_000)
+    late_span._local_root = late_span
+    late_span.finish(1_001)
+    processor = processor_factory(batched=True)
+
+    processor.on_span_finish(span)
+    [recorder] = processor._recorders.values()
+    batch = recorder.batch
+    assert len(_aggregated(processor)) == 1
+
+    # A thread that was about to record when the batch was swapped out
+    with mock.patch.object(recorder, "batch", batch):
+        processor.on_span_finish(late_span)
+
+    [(key, (hits, top_level_hits, _, _, _, _))] = _aggregated(processor).items()
+    assert key[1][2] == "late-resource"
+    assert hits == top_level_hits == 1
+    assert _aggregated(processor) == {}
+
+
+@pytest.mark.parametrize("batched", [False, True])
+def test_span_stats_spans_finish(processor_factory, batched):
+    spans = _spans(500)
+    processor = processor_factory(batched=batched)
+    batch_processor = processor_factory(batched=batched)
+
+    for span in spans:
+        processor.on_span_finish(span)
+    for i in range(0, len(spans), 50):
+        batch_processor.on_spans_finish(spans[i : i + 50])
+
+    assert _aggregated(batch_processor) == _aggregated(processor)
+
+
+@pytest.mark.parametrize("n", [0, 1, stats._SKETCH_SPARSE_LIMIT, stats._SKETCH_SPARSE_LIMIT + 1, 1000])
+def test_compact_sketch(n):
+    rng = random.Random(n)
+    values = [rng.randint(1, 10**9) for _ in range(n)]
+
+    distribution = _CompactSketch()
+    sketch = _new_sketch()
+    for value in values:
+        distribution.add(value)
+        sketch.add(value)
+
+    # The sketch is only allocated past the limit
+    assert (distribution._sketch is not None) is (n > stats._SKETCH_SPARSE_LIMIT)
+    assert distribution.count == n
+    assert DDSketchProto.to_proto(distribution.to_sketch()) == DDSketchProto.to_proto(sketch)
+
+
+def test_span_stats_interned_keys(processor_factory):
+    processor = processor_factory(batched=False)
+    for start in (1_000, 1_020):
+        for _ in range(2):
+            span = Span("name", service="service", resource="resource", start=start)
+            span._local_root = span
+            span.finish(start + 1)
+            processor.on_span_finish(span)
+
+    [first, second] = processor._buckets.values()
+    [key] = first
+    # The buckets share the same key
+    assert next(iter(second)) is key
+    assert processor._keys == {key: key}
+
+    processor._serialize_buckets()
+    assert processor._keys == {}
+
+
+def test_span_stats_batched_max_records(processor_factory):
+    spans = _spans(25)
+    for span in spans:
+        span._local_root = span
+    processor = processor_factory(batched=False)
+    batched_processor = processor_factory(batched=True)
+
+    with mock.patch.object(stats, "_BATCH_MAX_RECORDS", 10):
+        for span in spans:
+            processor.on_span_finish(span)
+            batched_processor.on_span_finish(span)
+
+    # Full batches are aggregated by the thread that records them
+    [recorder] = batched_processor._recorders.values()
+    recorded = len(recorder.batch.keys)
+    assert 0 < recorded < 10
+    assert sum(s.hits for bucket in batched_processor._buckets.values() for s in bucket.values()) == 25 - recorded
+    assert _aggregated(batched_processor) == _aggregated(processor)
+
+
+def test_span_stats_batched_recorders_by_native_thread(processor_factory):
+    spans = _spans(10)
+    for span in spans:
+        span._local_root = span
+    processor = processor_factory(batched=True)
+
+    # Greenlets share the recorder of the native thread they run on
+    greenlets = [threading.Thread(target=processor.on_span_finish, args=(span,)) for span in spans]
+    with mock.patch.object(stats, "_get_thread_id", return_value=42):
+        for g in greenlets:
+            g.start()
+            g.join()
+
+    assert list(processor._recorders) == [42]
+    assert len(processor._recorders[42].batch.keys) == len(spans)
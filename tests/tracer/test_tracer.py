@@ -33,6 +33,7 @@ from ddtrace.constants import VERSION_KEY
 from ddtrace.context import Context
 from ddtrace.contrib.trace_utils import set_user
 from ddtrace.ext import user
+from ddtrace.internal import compat
 from ddtrace.internal import telemetry
 from ddtrace.internal._encoding import MsgpackEncoderV03
 from ddtrace.internal._encoding import MsgpackEncoderV05
@@ -41,6 +42,7 @@ from ddtrace.internal.serverless import in_aws_lambda
 from ddtrace.internal.writer import AgentWriter
 from ddtrace.internal.writer import LogWriter
 from ddtrace.settings import Config
+from ddtrace.span import Span
 from ddtrace.span import _is_top_level
 from ddtrace.tracer import Tracer
 from tests.appsec.appsec.test_processor import tracer_appsec
@@ -289,6 +291,82 @@ class TracerTestCases(TracerTestCase):
             (dict(name="wrap.overwrite", service="webserver", meta=dict(args="(42,)", kwargs="{'kw_param': 42}")),),
         )
 
+    def test_tracer_wrap_hot(self):
+        def f(tag_name, tag_value, *args, **kwargs):
+            span = self.tracer.current_span()
+            span.set_tag(tag_name, tag_value)
+            return args, kwargs
+
+        wrapped = self.tracer.wrap("decorated_function", service="s", resource="r", span_type="t", hot=True)(f)
+
+        # The function is instrumented in place
+        assert wrapped is f
+        assert f("a", "b", 1, c=2) == ((1,), {"c": 2})
+
+        self.assert_span_count(1)
+        self.get_root_span().assert_matches(
+            name="decorated_function",
+            service="s",
+            resource="r",
+            span_type="t",
+            meta=dict(a="b"),
+        )
+
+    def test_tracer_wrap_hot_nesting(self):
+        @self.tracer.wrap("inner", hot=True)
+        def inner():
+            raise ValueError("bim")
+
+        @self.tracer.wrap("outer", hot=True)
+        def outer():
+            with self.trace("mid"):
+                with pytest.raises(ValueError):
+                    inner()
+
+        outer()
+
+        self.assert_structure(
+            dict(name="outer"),
+            ((dict(name="mid"), (dict(name="inner", resource="inner", error=1),)),),
+        )
+
+    def test_tracer_wrap_hot_factory(self):
+        def wrap_executor(tracer, fn, args, kwargs, span_name=None, service=None, resource=None, span_type=None):
+            with tracer.trace("wrap.overwrite") as span:
+                span.set_tag("args", args)
+                span.set_tag("kwargs", kwargs)
+                return fn(*args, **kwargs)
+
+        @self.tracer.wrap(hot=True)
+        def wrapped_function(param, kw_param=None):
+            self.assertEqual(42, param)
+            self.assertEqual(42, kw_param)
+
+        self.tracer.configure(wrap_executor=wrap_executor)
+
+        wrapped_function(42, kw_param=42)
+
+        # The named parameters are passed as positional arguments
+        self.assert_span_count(1)
+        self.spans[0].assert_matches(
+            name="wrap.overwrite",
+            meta=dict(args="(42, 42)", kwargs="{}"),
+        )
+
+    def test_tracer_wrap_max_spans_per_second(self):
+        for hot in (False, True):
+
+            @self.tracer.wrap("limited", hot=hot, max_spans_per_second=2)
+            def f(value):
+                return value
+
+            with mock.patch("ddtrace.internal.compat.monotonic", return_value=compat.monotonic()):
+                # The calls over the budget are not traced
+                assert [f(i) for i in range(5)] == list(range(5))
+
+            self.assert_span_count(2)
+            self.reset()
+
     def test_tracer_disabled(self):
         self.tracer.enabled = True
         with self.trace("foo") as s:
@@ -855,6 +933,31 @@ def test_tracer_with_env():
             assert span.get_tag(ENV_KEY) == "config.env"
 
 
+def test_tracer_global_tags_types():
+    t = ddtrace.Tracer()
+    t.set_tags({"str": "value", "int": 42, "float": 0.5, MANUAL_KEEP_KEY: None, "service.name": "svc"})
+
+    for _ in range(2):
+        with t.trace("root") as root:
+            with t.trace("child") as child:
+                pass
+
+        for span in (root, child):
+            assert span.get_tag("str") == "value"
+            assert span.get_metric("int") == 42
+            assert span.get_metric("float") == 0.5
+            assert span.service == "svc"
+            assert span.context.sampling_priority == USER_KEEP
+
+    # The tags of a span do not leak to the next ones
+    with t.trace("other") as span:
+        span.set_tag("str", "other")
+        span.set_metric("int", 0)
+    with t.trace("other") as span:
+        assert span.get_tag("str") == "value"
+        assert span.get_metric("int") == 42
+
+
 class EnvTracerTestCase(TracerTestCase):
     """Tracer test cases requiring environment variables."""
 
@@ -1967,3 +2070,179 @@ def test_installed_excepthook():
     assert sys.excepthook is telemetry._excepthook
     # Reset exception hooks
     telemetry.uninstall_excepthook()
+
+
+@pytest.mark.parametrize(
+    "sample_rate,compute_stats,early_drop,dropped",
+    [
+        (0.0, True, True, True),
+        (1.0, True, True, False),
+        (0.0, False, True, False),
+        (0.0, True, False, False),
+    ],
+)
+def test_early_drop(tracer, sample_rate, compute_stats, early_drop, dropped):
+    from ddtrace.internal.processor import SpanProcessor
+    from ddtrace.propagation.http import HTTPPropagator
+    from ddtrace.sampler import DatadogSampler
+    from ddtrace.sampler import SamplingRule
+
+    class StatsProcessor(SpanProcessor):
+        _process_dropped_spans = True
+        on_span_start = mock.Mock()
+        on_span_finish = mock.Mock()
+
+    stats_processor = StatsProcessor()
+    stats_processor.register()
+    tracer.configure(sampler=DatadogSampler(rules=[SamplingRule(sample_rate=sample_rate)]))
+    tracer._compute_stats = compute_stats
+    try:
+        with override_global_config(dict(_trace_early_drop_enabled=early_drop)):
+            with tracer.trace("root") as root:
+                with tracer.trace("child") as child:
+                    assert tracer.current_span() is child
+                    with tracer.trace("grandchild") as grandchild:
+                        headers = {}
+                        HTTPPropagator.inject(tracer.current_span().context, headers)
+                    assert tracer.current_span() is child
+                assert tracer.current_span() is root
+            spans = tracer.pop()
+    finally:
+        stats_processor.unregister()
+
+    # The trace context is still propagated from the dropped spans
+    assert headers["x-datadog-trace-id"] == str(root._trace_id_64bits)
+    assert headers["x-datadog-parent-id"] == str(grandchild.span_id)
+    assert headers["x-datadog-sampling-priority"] == str(root.context.sampling_priority)
+    assert grandchild.parent_id == child.span_id
+
+    if dropped:
+        assert spans == [root]
+        assert "runtime-id" not in child._meta
+        assert stats_processor.on_span_start.call_count == 1
+        # The stats are computed on the dropped spans
+        assert [c.args[0] for c in stats_processor.on_span_finish.call_args_list] == [grandchild, child, root]
+    else:
+        assert spans == [root, child, grandchild]
+        assert stats_processor.on_span_start.call_count == 3
+
+
+def test_early_drop_single_span_sampling(tracer):
+    from ddtrace.internal.sampling import SpanSamplingRule
+    from ddtrace.sampler import DatadogSampler
+    from ddtrace.sampler import SamplingRule
+
+    tracer.configure(sampler=DatadogSampler(rules=[SamplingRule(sample_rate=0.0)]))
+    tracer._compute_stats = True
+    tracer._single_span_sampling_rules = [SpanSamplingRule(name="kept", sample_rate=1.0, max_per_second=-1)]
+    with override_global_config(dict(_trace_early_drop_enabled=True)):
+        with tracer.trace("root") as root:
+            with tracer.trace("dropped"):
+                pass
+            with tracer.trace("kept") as kept:
+                pass
+
+    assert tracer.pop() == [root, kept]
+
+
+def test_finish_spans(tracer):
+    from ddtrace.internal.processor import SpanProcessor
+
+    class BatchProcessor(SpanProcessor):
+        on_span_start = mock.Mock()
+        on_span_finish = mock.Mock()
+        on_spans_finish = mock.Mock()
+
+    processor = BatchProcessor()
+    processor.register()
+    try:
+        root = tracer.trace("root")
+        children = [tracer.start_span("child", child_of=root) for _ in range(3)]
+        children[0].finish()
+        other = Span("other", on_finish=[mock.Mock()])
+        tracer._finish_spans(children + [other, root], finish_time=root.start + 1)
+    finally:
+        processor.unregister()
+
+    # The spans that are already finished are skipped
+    assert processor.on_span_finish.call_count == 1
+    processor.on_spans_finish.assert_called_once_with(children[1:] + [root])
+    other._on_finish_callbacks[0].assert_called_once_with(other)
+    assert all(s.finished for s in children + [other, root])
+    # The spans share the same finish time
+    assert len({s.start_ns + s.duration_ns for s in children[1:] + [other, root]}) == 1
+    assert tracer.current_span() is None
+    assert tracer.pop() == [root] + children
+
+
+def test_context_provider_activate_hooks(tracer):
+    provider = tracer.context_provider
+    hook = mock.Mock()
+
+    with tracer.trace("root") as root:
+        with tracer.trace("child") as child:
+            pass
+        # The finished span is replaced by its parent
+        assert tracer.current_span() is root
+        assert tracer.current_root_span() is root
+        provider._on_activate(hook)
+        with tracer.trace("hooked") as hooked:
+            pass
+        provider._deregister_on_activate(hook)
+        with tracer.trace("unhooked"):
+            pass
+
+    assert child.finished
+    # The hook is called when the span is activated and when its parent is reactivated
+    assert hook.call_args_list == [mock.call(hooked), mock.call(root)]
+    assert not provider._has_activate_hooks
+
+
+def test_start_span_version_tag(tracer):
+    with override_global_config(dict(version="1.2.3", service="service")):
+        root = tracer.start_span("root", service="service")
+        child = tracer.start_span("child", child_of=root, service="service")
+        other = tracer.start_span("other", child_of=root, service="other")
+        for span in (other, child, root):
+            span.finish()
+
+    assert root.get_tag("version") == child.get_tag("version") == "1.2.3"
+    assert other.get_tag("version") is None
+
+
+def test_span_processor_hooks(tracer):
+    from ddtrace.internal.processor import SpanProcessor
+
+    class NoopStartProcessor(SpanProcessor):
+        def on_span_start(self, span):
+            """Nothing to do."""
+
+        on_span_finish = mock.Mock()
+
+    with tracer.trace("span"):
+        pass
+    hooks = tracer._span_processor_hooks
+    # The hooks are only resolved again when the processors change
+    with tracer.trace("span"):
+        pass
+    assert tracer._span_processor_hooks is hooks
+
+    processor = NoopStartProcessor()
+    processor.register()
+    try:
+        with tracer.trace("span") as span:
+            pass
+        hooks = tracer._span_processor_hooks
+        assert processor.on_span_finish in hooks.on_span_finish
+        assert all(getattr(hook, "__self__", None) is not processor for hook in hooks.on_span_start)
+        processor.on_span_finish.assert_called_once_with(span)
+    finally:
+        processor.unregister()
+
+    with tracer.trace("span"):
+        pass
+    assert processor.on_span_finish not in tracer._span_processor_hooks.on_span_finish
+    assert processor.on_span_finish.call_count == 1
+
+    tracer.configure(compute_stats_enabled=True)
+    assert tracer._span_processor_hooks is None
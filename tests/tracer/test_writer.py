@@ -1,4 +1,5 @@
 import contextlib
+import gzip
 import os
 import socket
 import sys
@@ -25,6 +26,8 @@ from ddtrace.internal.writer import AgentWriter
 from ddtrace.internal.writer import LogWriter
 from ddtrace.internal.writer import Response
 from ddtrace.internal.writer import _human_size
+from ddtrace.internal.writer.compression import get_compressor
+from ddtrace.internal.writer.writer_client import AgentWriterClientV4
 from ddtrace.span import Span
 from tests.utils import AnyInt
 from tests.utils import BaseTestCase
@@ -658,6 +661,77 @@ def test_racing_start(writer_class):
     assert len(writer._encoder) == 100
 
 
+@pytest.mark.parametrize("writer_class", (AgentWriter,))
+def test_write_unprocessed_async(writer_class):
+    statsd = mock.Mock()
+    process = mock.Mock(side_effect=lambda spans: spans)
+    with override_global_config(dict(health_metrics_enabled=True)):
+        # Use a long interval so that the queue is only drained by the explicit flush
+        writer = writer_class("http://asdf:1234", dogstatsd=statsd, processing_interval=60, async_processing=True)
+        writer._put = mock.Mock(return_value=Response(status=200))
+        for i in range(10):
+            writer.write_unprocessed(
+                [Span(name="name", trace_id=i, span_id=j + 1, parent_id=j or None) for j in range(5)], process
+            )
+
+        # Nothing is processed or encoded on the calling thread
+        process.assert_not_called()
+        assert len(writer._pending) == 10
+        assert len(writer._encoder) == 0
+
+        writer.flush_queue()
+        writer.stop()
+        writer.join()
+
+    assert process.call_count == 10
+    assert len(writer._pending) == 0
+    statsd.distribution.assert_has_calls(
+        [mock.call("datadog.%s.queue.accepted.traces" % writer.STATSD_NAMESPACE, 1, tags=None)] * 10
+        + [mock.call("datadog.%s.buffer.accepted.traces" % writer.STATSD_NAMESPACE, 1, tags=None)] * 10,
+        any_order=True,
+    )
+
+
+@pytest.mark.parametrize("writer_class", (AgentWriter,))
+def test_write_unprocessed_async_queue_full(writer_class):
+    statsd = mock.Mock()
+    with override_global_config(dict(health_metrics_enabled=True, _trace_writer_async_queue_size=2)):
+        writer = writer_class("http://asdf:1234", dogstatsd=statsd, async_processing=True)
+        writer._put = mock.Mock(return_value=Response(status=200))
+        # Prevent the periodic thread from draining the queue
+        writer._process_pending = mock.Mock()
+        for i in range(3):
+            writer.write_unprocessed([Span(name="name", trace_id=i)], lambda spans: spans)
+        # The dropped trace is not accepted but is reflected in the keep rate
+        assert writer._metrics["accepted_traces"] == 0
+        assert writer._metrics["dropped_traces"] == 1
+        writer.stop()
+        writer.join()
+
+    assert len(writer._pending) == 2
+    assert writer._drop_sma.get() > 0
+    statsd.distribution.assert_has_calls(
+        [
+            mock.call("datadog.%s.queue.dropped.traces" % writer.STATSD_NAMESPACE, 1, tags=["reason:full"]),
+            mock.call("datadog.%s.queue.dropped.spans" % writer.STATSD_NAMESPACE, 1, tags=["reason:full"]),
+        ],
+        any_order=True,
+    )
+
+
+@pytest.mark.parametrize("writer_class", (AgentWriter,))
+def test_write_unprocessed_sync_mode(writer_class):
+    process = mock.Mock(side_effect=lambda spans: spans)
+    writer = writer_class("http://asdf:1234", sync_mode=True, async_processing=True)
+    writer._put = mock.Mock(return_value=Response(status=200))
+    writer.write_unprocessed([Span(name="name")], process)
+
+    # Synchronous writers always process and send before returning
+    assert not writer._async_processing
+    process.assert_called_once()
+    writer._put.assert_called_once()
+
+
 @pytest.mark.subprocess(
     env={"_DD_TRACE_WRITER_ADDITIONAL_HEADERS": "additional-header:additional-value,header2:value2"}
 )
@@ -805,9 +879,9 @@ def test_writer_reuse_connections(writer_class):
         writer = writer_class("http://localhost:9126", reuse_connections=True)
         # Do an initial flush to get a connection
         writer.flush_queue()
-        assert writer._conn is None
+        assert writer._conns == [None]
         writer.flush_queue()
-        assert writer._conn is None
+        assert writer._conns == [None]
 
 
 @pytest.mark.parametrize("writer_class", (AgentWriter, CIVisibilityWriter))
@@ -817,10 +891,329 @@ def test_writer_reuse_connections_false(writer_class):
         writer = writer_class("http://localhost:9126", reuse_connections=False)
         # Do an initial flush to get a connection
         writer.flush_queue()
-        conn = writer._conn
+        conns = list(writer._conns)
         # And another to potentially have it reset
         writer.flush_queue()
-        assert writer._conn is conn
+        assert writer._conns == conns
+
+
+class _BlockingConnection(object):
+    """Fake intake connection whose requests wait for each other on a barrier."""
+
+    def __init__(self, barrier):
+        self.barrier = barrier
+
+    def request(self, *args, **kwargs):
+        self.barrier.wait()
+
+    def getresponse(self):
+        return mock.Mock(status=200, reason="OK", read=lambda: b"{}")
+
+    def close(self):
+        pass
+
+
+@pytest.mark.parametrize("writer_class", (AgentWriter,))
+def test_writer_connection_pool_concurrent_requests(writer_class):
+    barrier = threading.Barrier(2, timeout=5)
+    writer = writer_class("http://localhost:9126", connection_pool_size=2, reuse_connections=True)
+    client = writer._clients[0]
+
+    with mock.patch(
+        "ddtrace.internal.writer.writer.get_connection", side_effect=lambda *_: _BlockingConnection(barrier)
+    ):
+        # The two requests can only complete if they are in flight at the same time
+        responses = []
+        threads = [
+            threading.Thread(target=lambda: responses.append(writer._put(b"", {}, client, no_trace=True)))
+            for _ in range(2)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    assert [r.status for r in responses] == [200, 200]
+    assert all(c is not None for c in writer._conns)
+
+
+@pytest.mark.parametrize("writer_class", (AgentWriter,))
+def test_writer_connection_pool_background_upload(writer_class):
+    statsd = mock.Mock()
+    sent = threading.Event()
+    with override_global_config(dict(health_metrics_enabled=True)):
+        writer = writer_class("http://localhost:9126", dogstatsd=statsd, connection_pool_size=2)
+
+        def _put(*args, **kwargs):
+            sent.wait(5)
+            return Response(status=200)
+
+        writer._put = _put
+        writer.write([Span(name="name")])
+        writer.flush_queue(wait=False)
+
+        # The payload is uploaded in the background
+        assert len(writer._uploads) == 1
+        assert len(writer._encoder) == 0
+        assert not writer._uploads[0].done()
+
+        sent.set()
+        writer.flush_queue()
+        assert len(writer._uploads) == 0
+        writer.on_shutdown()
+
+    statsd.distribution.assert_has_calls(
+        [mock.call("datadog.%s.http.sent.traces" % writer.STATSD_NAMESPACE, 1, tags=None)]
+    )
+
+
+@pytest.mark.parametrize("writer_class", (AgentWriter,))
+def test_writer_connection_pool_upload_after_shutdown(writer_class):
+    statsd = mock.Mock()
+    with override_global_config(dict(health_metrics_enabled=True)):
+        writer = writer_class("http://localhost:9126", dogstatsd=statsd, connection_pool_size=2)
+        writer._put = mock.Mock(return_value=Response(status=200))
+        writer.write([Span(name="name")])
+        writer.flush_queue()
+        # New futures cannot be scheduled once the interpreter shutdown started
+        writer._upload_executor.shutdown()
+
+        writer.write([Span(name="name")])
+        writer.flush_queue(wait=False)
+        assert len(writer._uploads) == 0
+
+        # The last payloads are sent inline when the writer shuts down
+        writer.write([Span(name="name")])
+        writer.on_shutdown()
+        assert writer._upload_executor is None
+
+    assert writer._put.call_count == 3
+    sent = mock.call("datadog.%s.http.sent.traces" % writer.STATSD_NAMESPACE, 1, tags=None)
+    assert statsd.distribution.call_args_list.count(sent) == 3
+
+
+def test_writer_concurrent_downgrade():
+    writer = AgentWriter("http://localhost:9126", api_version="v0.5", connection_pool_size=2)
+    client = writer._clients[0]
+    writer._put = mock.Mock(return_value=Response(status=404))
+
+    # Both uploads of a v0.5 payload get a 404 but the API is only downgraded once
+    writer._send_payload(b"payload", 1, client)
+    downgraded = writer._clients[0]
+    assert downgraded.ENDPOINT == "v0.4/traces"
+    writer._send_payload(b"payload", 1, client)
+    assert writer._clients[0] is downgraded
+
+
+@pytest.mark.parametrize("writer_class", (AgentWriter,))
+def test_writer_connection_latency_metrics(writer_class):
+    statsd = mock.Mock()
+    with override_global_config(dict(health_metrics_enabled=True)):
+        writer = writer_class("http://localhost:9126", dogstatsd=statsd)
+        with mock.patch(
+            "ddtrace.internal.writer.writer.get_connection",
+            side_effect=lambda *_: _BlockingConnection(threading.Barrier(1)),
+        ):
+            writer._put(b"", {}, writer._clients[0], no_trace=True)
+
+    statsd.distribution.assert_called_once_with(
+        "datadog.%s.http.connection.latency" % writer.STATSD_NAMESPACE, mock.ANY, tags=["connection:0"]
+    )
+
+
+def test_writer_connection_pool_size_invalid():
+    with pytest.raises(ValueError):
+        AgentWriter("http://localhost:9126", connection_pool_size=0)
+
+
+def test_writer_adaptive_flush_high_watermark():
+    with override_global_config(dict(_trace_writer_adaptive_flush=True, _trace_writer_flush_high_watermark=0.5)):
+        writer = AgentWriter("http://localhost:9126", processing_interval=60, buffer_size=4096)
+    writer._request_flush = mock.Mock()
+    spans = [Span(name="name", trace_id=1, span_id=j + 1, parent_id=j or None) for j in range(5)]
+
+    writer._write_with_client(writer._clients[0], spans)
+    assert writer._encoder.size < 2048
+    writer._request_flush.assert_not_called()
+
+    while writer._encoder.size < 2048:
+        writer._write_with_client(writer._clients[0], spans)
+    writer._request_flush.assert_called_once_with()
+
+    writer.stop()
+    writer.join()
+
+
+def test_writer_adaptive_flush_awakes_writer():
+    flushed = threading.Event()
+    with override_global_config(dict(_trace_writer_adaptive_flush=True, _trace_writer_flush_high_watermark=0.5)):
+        writer = AgentWriter("http://localhost:9126", processing_interval=60, buffer_size=4096)
+    writer._put = mock.Mock(side_effect=lambda *args, **kwargs: flushed.set() or Response(status=200))
+    try:
+        while writer._encoder.size < 2048:
+            writer.write([Span(name="name", trace_id=1, span_id=j + 1, parent_id=j or None) for j in range(5)])
+        # The interval is far longer than the wait below
+        assert flushed.wait(5)
+    finally:
+        writer.stop()
+        writer.join()
+
+
+def test_writer_adaptive_flush_backoff():
+    with override_global_config(dict(_trace_writer_adaptive_flush=True, _trace_writer_max_interval_seconds=4.0)):
+        writer = AgentWriter("http://localhost:9126", processing_interval=1.0)
+    writer._put = mock.Mock(return_value=Response(status=200))
+
+    intervals = []
+    for _ in range(4):
+        writer.periodic()
+        intervals.append(writer.interval)
+    assert intervals == [2.0, 4.0, 4.0, 4.0]
+    writer._put.assert_not_called()
+
+    writer._encoder.put([Span(name="name", trace_id=1, span_id=1)])
+    writer.periodic()
+    assert writer.interval == 1.0
+    writer._put.assert_called_once()
+
+    # The base interval is kept across forks
+    writer.periodic()
+    assert writer.interval == 2.0
+    assert writer.recreate().interval == 1.0
+
+
+def test_writer_adaptive_flush_disabled():
+    writer = AgentWriter("http://localhost:9126", processing_interval=1.0)
+    assert writer._adaptive_flush is False
+    writer.periodic()
+    assert writer.interval == 1.0
+
+
+def test_writer_buffer_fill_ratio_metrics():
+    statsd = mock.Mock()
+    with override_global_config(dict(health_metrics_enabled=True)):
+        writer = AgentWriter("http://localhost:9126", dogstatsd=statsd, buffer_size=4096)
+        writer._put = mock.Mock(return_value=Response(status=200))
+        writer._encoder.put([Span(name="name", trace_id=1, span_id=1)])
+        fill_ratio = float(writer._encoder.size) / writer._encoder.max_size
+        writer.periodic()
+
+    assert 0 < fill_ratio < 1
+    statsd.distribution.assert_any_call("datadog.tracer.buffer.fill_ratio", fill_ratio, tags=None)
+
+
+def test_writer_spool_replay(tmp_path):
+    statsd = mock.Mock()
+    with override_global_config(dict(health_metrics_enabled=True, _trace_writer_spool_dir=str(tmp_path))):
+        writer = AgentWriter("http://localhost:9126", dogstatsd=statsd, api_version="v0.4", processing_interval=60)
+        writer._send_payload_with_backoff = mock.Mock(side_effect=ConnectionError)
+        writer._put = mock.Mock(return_value=Response(status=200))
+
+        # Payloads that fail to be sent are spooled
+        writer._encoder.put([Span(name="first", trace_id=1, span_id=1)])
+        writer.flush_queue()
+        assert len(writer._spool) == 1
+        statsd.distribution.assert_any_call("datadog.tracer.spool.spooled.traces", 1, tags=None)
+        assert mock.call("datadog.tracer.http.dropped.traces", 1, tags=None) not in statsd.distribution.mock_calls
+
+        # New payloads wait in the spool behind the older ones
+        writer._send_payload_with_backoff.reset_mock()
+        writer._encoder.put([Span(name="second", trace_id=2, span_id=1)])
+        writer.flush_queue()
+        writer._send_payload_with_backoff.assert_not_called()
+        assert len(writer._spool) == 2
+
+        # The spooled payloads are replayed in order once the agent is reachable
+        writer.periodic()
+        assert len(writer._spool) == 0
+        statsd.distribution.assert_any_call("datadog.tracer.spool.replayed.traces", 1, tags=None)
+
+    payloads = [writer._encoder._decode(call[0][0]) for call in writer._put.call_args_list]
+    assert [trace[0][b"name"] for [trace] in payloads] == [b"first", b"second"]
+    assert os.listdir(os.path.join(str(tmp_path), "tracer")) == []
+
+
+def test_writer_spool_incompatible(tmp_path):
+    statsd = mock.Mock()
+    with override_global_config(dict(health_metrics_enabled=True, _trace_writer_spool_dir=str(tmp_path))):
+        writer = AgentWriter("http://localhost:9126", dogstatsd=statsd, api_version="v0.5")
+        writer._spool.append("v0.5/traces", b"payload", 3)
+        # Downgrade the API version
+        writer._clients = [AgentWriterClientV4(1 << 10, 1 << 10)]
+        writer._put = mock.Mock()
+        writer._replay_spool()
+
+    writer._put.assert_not_called()
+    assert len(writer._spool) == 0
+    statsd.distribution.assert_any_call("datadog.tracer.spool.evicted.traces", 3, tags=["reason:incompatible"])
+
+
+def test_writer_spool_disabled():
+    assert AgentWriter("http://localhost:9126")._spool is None
+    with override_global_config(dict(_trace_writer_spool_dir=tempfile.gettempdir())):
+        assert AgentWriter("http://localhost:9126", sync_mode=True)._spool is None
+
+
+@pytest.mark.parametrize("api_version", ("v0.4", "v0.5"))
+def test_writer_compression(api_version):
+    statsd = mock.Mock()
+    with override_global_config(dict(health_metrics_enabled=True, _trace_writer_compression="gzip")):
+        writer = AgentWriter("http://localhost:9126", dogstatsd=statsd, api_version=api_version)
+        writer._put = mock.Mock(return_value=Response(status=200))
+        writer._encoder.put([Span(name="name", trace_id=1, span_id=1)])
+        writer.flush_queue()
+
+    [(body, headers, _), _] = writer._put.call_args
+    assert headers["Content-Encoding"] == "gzip"
+    assert writer._encoder._decode(gzip.decompress(body))
+    statsd.distribution.assert_any_call("datadog.tracer.http.compressed.bytes", len(body), tags=["encoding:gzip"])
+    assert writer.recreate()._compressor.encoding == "gzip"
+
+
+def test_writer_compression_unsupported():
+    with override_global_config(dict(_trace_writer_compression="gzip")):
+        writer = AgentWriter("http://localhost:9126", api_version="v0.4")
+    writer._put = mock.Mock(side_effect=[Response(status=415), Response(status=200), Response(status=200)])
+    writer._encoder.put([Span(name="name", trace_id=1, span_id=1)])
+    writer.flush_queue()
+
+    # The payload is sent again uncompressed, and the following ones too
+    [_, (body, headers, _)] = [args for args, _ in writer._put.call_args_list]
+    assert "Content-Encoding" not in headers
+    assert writer._encoder._decode(body)
+    assert writer._compressor is None
+    assert writer._clients[0].ENDPOINT == "v0.4/traces"
+
+
+def test_writer_compression_fallback():
+    with mock.patch.dict("sys.modules", {"zstandard": None}):
+        writer = AgentWriter("http://localhost:9126", compression="zstd")
+    assert writer._compressor.encoding == "gzip"
+
+
+def test_writer_compression_zstd_per_thread():
+    zstandard = mock.Mock()
+    zstandard.ZstdCompressor.side_effect = lambda level: mock.Mock(compress=lambda payload: b"zstd:" + payload)
+    with mock.patch.dict("sys.modules", {"zstandard": zstandard}):
+        compressor = get_compressor("zstd", 5)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(compressor.compress(b"payload"))) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert compressor.compress(b"payload") == b"zstd:payload"
+    assert compressor.compress(b"payload") == b"zstd:payload"
+
+    # Each thread compresses with its own zstandard compressor
+    assert results == [b"zstd:payload"] * 2
+    assert zstandard.ZstdCompressor.call_args_list == [mock.call(level=5)] * 3
+
+
+def test_writer_compression_invalid():
+    with pytest.raises(ValueError):
+        AgentWriter("http://localhost:9126", compression="lz4")
 
 
 @pytest.mark.subprocess(env=dict(DD_TRACE_128_BIT_TRACEID_GENERATION_ENABLED="true"))
@@ -0,0 +1,128 @@
+import os
+
+import mock
+import pytest
+
+from ddtrace.internal.writer import spool as spool_module
+from ddtrace.internal.writer.spool import PayloadSpool
+
+
+def _spool(directory, max_size=1 << 20, segment_size=1 << 10, max_age=60.0, on_evict=None):
+    return PayloadSpool(
+        str(directory), max_size=max_size, segment_size=segment_size, max_age=max_age, on_evict=on_evict
+    )
+
+
+def _drain(spool):
+    payloads = []
+    while True:
+        payload = spool.peek()
+        if payload is None:
+            return payloads
+        payloads.append((payload.endpoint, payload.read(), payload.n_traces))
+        spool.pop(payload)
+
+
+def _segments(directory):
+    return [name for name in os.listdir(str(directory)) if name.endswith(".seg")]
+
+
+def test_spool_order(tmp_path):
+    spool = _spool(tmp_path)
+    spool.append("v0.4/traces", b"foo", 1)
+    spool.append("v0.5/traces", memoryview(b"bar"), 2)
+    assert len(spool) == 2
+
+    assert _drain(spool) == [("v0.4/traces", b"foo", 1), ("v0.5/traces", b"bar", 2)]
+    assert len(spool) == 0
+    # Consumed segments are deleted
+    assert _segments(tmp_path) == []
+
+
+def test_spool_segments(tmp_path):
+    spool = _spool(tmp_path, segment_size=256)
+    payloads = [("v0.4/traces", os.urandom(90), i) for i in range(10)]
+    for payload in payloads:
+        spool.append(*payload)
+
+    assert len(_segments(tmp_path)) == 5
+    assert spool.size == 5 * 256
+
+    # Payloads larger than a segment get a segment of their own
+    large = ("v0.4/traces", os.urandom(1000), 10)
+    spool.append(*large)
+    assert len(_segments(tmp_path)) == 6
+
+    assert _drain(spool) == payloads + [large]
+    assert _segments(tmp_path) == []
+
+
+def test_spool_evict_size(tmp_path):
+    on_evict = mock.Mock()
+    spool = _spool(tmp_path, max_size=512, segment_size=256, on_evict=on_evict)
+    payloads = [("v0.4/traces", os.urandom(90), i) for i in range(6)]
+    for payload in payloads:
+        assert spool.append(*payload)
+
+    # The oldest segment, with the first two payloads, was evicted
+    assert spool.size == 512
+    assert [(args[0].n_traces, args[1]) for args, _ in on_evict.call_args_list] == [(0, "size"), (1, "size")]
+    assert _drain(spool) == payloads[2:]
+
+    # Payloads that cannot fit in the spool are rejected
+    assert not spool.append("v0.4/traces", os.urandom(1000), 1)
+
+
+def test_spool_evict_age(tmp_path):
+    on_evict = mock.Mock()
+    spool = _spool(tmp_path, max_age=10.0, on_evict=on_evict)
+    with mock.patch.object(spool_module, "time_ns", return_value=100 * 10**9):
+        spool.append("v0.4/traces", b"old", 1)
+    with mock.patch.object(spool_module, "time_ns", return_value=105 * 10**9):
+        spool.append("v0.4/traces", b"new", 2)
+
+    with mock.patch.object(spool_module, "time_ns", return_value=112 * 10**9):
+        payload = spool.peek()
+
+    assert payload.read() == b"new"
+    on_evict.assert_called_once_with(mock.ANY, "age")
+    assert on_evict.call_args[0][0].n_traces == 1
+
+
+@pytest.mark.skipif(spool_module.fcntl is None, reason="advisory file locks are not supported")
+def test_spool_adopt_segments(tmp_path):
+    spool = _spool(tmp_path)
+    spool.append("v0.4/traces", b"foo", 1)
+    spool.append("v0.4/traces", b"bar", 2)
+
+    # Segments in use by another spool are left alone
+    assert len(_spool(tmp_path)) == 0
+
+    spool.close()
+    assert len(_segments(tmp_path)) == 1
+
+    adopted = _spool(tmp_path)
+    assert _drain(adopted) == [("v0.4/traces", b"foo", 1), ("v0.4/traces", b"bar", 2)]
+    assert _segments(tmp_path) == []
+
+
+def test_spool_adopt_segments_consumed(tmp_path):
+    spool = _spool(tmp_path)
+    for i in range(3):
+        spool.append("v0.4/traces", b"payload%d" % i, 1)
+
+    payload = spool.peek()
+    assert payload.read() == b"payload0"
+    spool.pop(payload)
+    spool.close()
+
+    # The replay resumes after the payloads that were already consumed
+    adopted = _spool(tmp_path)
+    assert len(adopted) == 2
+    assert adopted.peek().read() == b"payload1"
+    adopted.pop(adopted.peek())
+    adopted.close()
+
+    adopted = _spool(tmp_path)
+    assert _drain(adopted) == [("v0.4/traces", b"payload2", 1)]
+    assert _segments(tmp_path) == []
@@ -116,6 +116,11 @@ def override_global_config(values):
         "service",
         "_raise",
         "_trace_compute_stats",
+        "_trace_compute_stats_batched",
+        "_trace_early_drop_enabled",
+        "_span_aggregator_max_traces",
+        "_span_aggregator_max_spans_per_trace",
+        "_span_aggregator_max_trace_age",
         "_obfuscation_query_string_pattern",
         "global_query_string_obfuscation_disabled",
         "_ci_visibility_agentless_url",
@@ -133,7 +138,19 @@ def override_global_config(values):
         "_trace_writer_payload_size",
         "_trace_writer_interval_seconds",
         "_trace_writer_connection_reuse",
+        "_trace_writer_connection_pool_size",
         "_trace_writer_log_err_payload",
+        "_trace_writer_async_processing",
+        "_trace_writer_async_queue_size",
+        "_trace_writer_adaptive_flush",
+        "_trace_writer_flush_high_watermark",
+        "_trace_writer_max_interval_seconds",
+        "_trace_writer_compression",
+        "_trace_writer_compression_level",
+        "_trace_writer_spool_dir",
+        "_trace_writer_spool_max_size",
+        "_trace_writer_spool_segment_size",
+        "_trace_writer_spool_max_age_seconds",
         "_span_traceback_max_size",
         "propagation_http_baggage_enabled",
         "_telemetry_enabled",